@@ -35,20 +35,201 @@ import bottle
 import os
 import urllib.request
 import threading
+import queue
+import socket
+import socketserver
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler, \
+    ServerHandler
 
 print(os.path.dirname(os.path.realpath(__file__)))
 
 
+class ThreadingWSGIServer(socketserver.ThreadingMixIn, WSGIServer):
+    """ The standard library WSGI server, handling each request in its own
+    thread so that long running responses (such as event streams) do not
+    block other requests.
+    """
+    daemon_threads = True
+
+
+class PooledWSGIServer(WSGIServer):
+    """ The standard library WSGI server, handling connections with a fixed
+    number of worker threads, so that the number of requests being
+    processed at once is limited.   Connections wait in a queue until a
+    worker is free.
+    Note that each /events or /liveStream client uses a worker for as long
+    as it is connected.
+    """
+    def __init__(self, serverAddress, handlerClass, nWorkers = 16):
+        WSGIServer.__init__(self, serverAddress, handlerClass)
+        self.connQueue = queue.Queue()
+        for i in range(nWorkers):
+            threading.Thread(target=self.processConnections,
+                             daemon=True).start()
+
+    def process_request(self, request, clientAddress):
+        """ Queue the new connection for the next free worker """
+        self.connQueue.put((request, clientAddress))
+
+    def processConnections(self):
+        """ Worker thread - handles queued connections until the program
+        exits.
+        """
+        while True:
+            request, clientAddress = self.connQueue.get()
+            try:
+                self.finish_request(request, clientAddress)
+            except Exception:
+                self.handle_error(request, clientAddress)
+            finally:
+                self.shutdown_request(request)
+
+    def isBusy(self):
+        """ Returns True if there are connections waiting for a worker """
+        return(not self.connQueue.empty())
+
+
+class KeepAliveServerHandler(ServerHandler):
+    """ A wsgiref ServerHandler that responds with HTTP/1.1 and tells
+    KeepAliveRequestHandler whether the connection can be kept open after
+    the response.
+    """
+    http_version = "1.1"
+
+    def __init__(self, *args, keepAlive = False, **kwargs):
+        ServerHandler.__init__(self, *args, **kwargs)
+        self.keepAlive = keepAlive
+
+    def cleanup_headers(self):
+        """ Close the connection after responses of unknown length (e.g.
+        event streams and streamed downloads), as they are ended by
+        closing the connection.
+        """
+        ServerHandler.cleanup_headers(self)
+        if ('Content-Length' not in self.headers
+            and not self.status.startswith(("204", "304"))):
+            self.keepAlive = False
+        if (not self.keepAlive):
+            self.headers['Connection'] = 'close'
+
+    def finish_response(self):
+        ServerHandler.finish_response(self)
+        # Only reached if the whole response was sent.
+        self.request_handler.close_connection = not self.keepAlive
+
+
+class KeepAliveRequestHandler(WSGIRequestHandler):
+    """ A wsgiref request handler that handles several requests on each
+    connection (HTTP keep-alive), so that clients polling the server do
+    not have to open a new connection for every request.   Idle
+    connections are closed after KEEPALIVE_TIMEOUT seconds, or as soon as
+    a response has been sent if other connections are waiting for a
+    PooledWSGIServer worker.
+    """
+    protocol_version = "HTTP/1.1"
+    KEEPALIVE_TIMEOUT = 5  # seconds
+
+    def setup(self):
+        WSGIRequestHandler.setup(self)
+        # wsgiref sends the headers and body separately, which with Nagle's
+        # algorithm delays every response on a kept-alive connection.
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def handle(self):
+        """ Handle requests until the connection is closed """
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection:
+            self.handle_one_request()
+
+    def handle_one_request(self):
+        """ Handle a single HTTP request """
+        self.connection.settimeout(self.KEEPALIVE_TIMEOUT)
+        try:
+            self.raw_requestline = self.rfile.readline(65537)
+        except (TimeoutError, OSError):
+            self.close_connection = True
+            return
+        self.connection.settimeout(None)
+        if (not self.raw_requestline):
+            self.close_connection = True
+            return
+        if (len(self.raw_requestline) > 65536):
+            self.requestline = ''
+            self.request_version = ''
+            self.command = ''
+            self.send_error(414)
+            return
+        if (not self.parse_request()):
+            return
+
+        # parse_request() sets close_connection from the request headers.
+        keepAlive = not self.close_connection
+        isBusy = getattr(self.server, 'isBusy', None)
+        if (isBusy is not None and isBusy()):
+            keepAlive = False
+        self.close_connection = True  # Unless the response is completed
+        handler = KeepAliveServerHandler(
+            self.rfile, self.wfile, self.get_stderr(), self.get_environ(),
+            multithread=True, keepAlive=keepAlive)
+        handler.request_handler = self
+        handler.run(self.server.get_app())
+
+
+class KeepAliveServer(bottle.ServerAdapter):
+    """ A bottle server adapter for ThreadingWSGIServer, or
+    PooledWSGIServer if option workers is given, with keep-alive
+    connections.
+    """
+    def run(self, app):
+        nWorkers = self.options.get('workers')
+        if (nWorkers):
+            srv = PooledWSGIServer((self.host, self.port),
+                                   KeepAliveRequestHandler, nWorkers)
+        else:
+            srv = ThreadingWSGIServer((self.host, self.port),
+                                      KeepAliveRequestHandler)
+        srv.set_app(app)
+        self.srv = srv
+        srv.serve_forever()
+
+
+class WaitressServer(bottle.ServerAdapter):
+    """ A bottle server adapter for waitress (if it is installed) - the
+    one supplied with bottle does not pass on the number of threads.
+    """
+    def run(self, app):
+        from waitress import serve
+        serve(app, host=self.host, port=self.port,
+              threads=self.options.get('threads', 4))
+
 
 class WebControlClass:
+    # Web server backends:
+    #   wsgiref - bottle's default single threaded server,
+    #   threaded - a thread for each connection, with keep-alive,
+    #   pool - a fixed number (nWorkers) of threads, with keep-alive,
+    #   waitress - the waitress server with nWorkers threads (if installed).
+    SERVERS = ('wsgiref', 'threaded', 'pool', 'waitress')
     shutDown = False
     scriptDir = None
-    def __init__(self,portNo = 8080):
+    serverName = 'threaded'
+    nWorkers = 16
+    serverAdapter = None
+    def __init__(self,portNo = 8080, server = None, workers = None):
         ''' Initialise this WebControlClass to serve data on port Number
-        portNo (default = 8080.
+        portNo (default = 8080), using web server backend server (one of
+        SERVERS, default threaded) with workers worker threads (pool and
+        waitress only, default 16).
         '''
         print("WebControlClass.__init__(portNo=%d)" % (int(portNo)))
         self.portNo = portNo
+        if (server is not None):
+            if (server not in self.SERVERS):
+                raise ValueError("Unrecognised web server %s" % server)
+            self.serverName = server
+        if (workers is not None):
+            self.nWorkers = int(workers)
         self.scriptDir = os.path.dirname(os.path.realpath(__file__))
         self.wwwPath = os.path.join(self.scriptDir,'www')
         print("wwwPath=%s" % self.wwwPath)
@@ -57,9 +238,28 @@ class WebControlClass:
         return(self.wwwPath)
 
     def startServer(self):
-        wwwThread = threading.Thread(target=self._startServer)
+        wwwThread = threading.Thread(target=self._startServer, daemon=True)
         wwwThread.start()
         print("wwwThread started")
+
+    def stopServer(self):
+        ''' Stop the web server - sets shutDown and calls onShutDown() so
+        that long running responses (such as event streams) end, then stops
+        the server from accepting connections (threaded and pool servers
+        only - the others stop when the program exits).
+        '''
+        print("WebControlClass.stopServer()")
+        self.shutDown = True
+        self.onShutDown()
+        srv = getattr(self.serverAdapter, 'srv', None)
+        if (srv is not None):
+            srv.shutdown()
+
+    def onShutDown(self):
+        ''' Called by stopServer() - sub-classes override this to end their
+        long running responses.
+        '''
+        pass
         
     def _startServer(self):
         ''' Start the web server'''
@@ -79,6 +279,14 @@ class WebControlClass:
         def favicon():
             return(server_static('favicon.ico'))
 
+        # Tile coordinates are the only values that contain '/' - the
+        # generic route does not allow it, so that values used as file
+        # names can not reach outside the data directory.
+        @app.route('/getTile/<zoom:int>/<x:int>/<y:int>')
+        def tile(zoom, x, y):
+            return self.onWwwCmd('getTile', "%d/%d/%d" % (zoom, x, y),
+                                 bottle.request.method, bottle.request)
+
         @app.route('/<cmdStr>/<valStr>', method=['PUT','POST','GET','DELETE'])
         @app.route('/<cmdStr>/', method=['PUT','POST','GET','DELETE'])
         @app.route('/<cmdStr>', method=['PUT','POST','GET','DELETE'])
@@ -86,7 +294,21 @@ class WebControlClass:
             #print("WebControlClass.cmd(%s, %s)" % (cmdStr,valStr))
             return self.onWwwCmd(cmdStr, valStr,bottle.request.method, bottle.request)
 
-        bottle.run(app,host='0.0.0.0', port=self.portNo)
+        print("Starting %s web server on port %d" % (self.serverName,
+                                                      self.portNo))
+        if (self.serverName == 'wsgiref'):
+            bottle.run(app, host='0.0.0.0', port=self.portNo)
+        elif (self.serverName == 'waitress'):
+            bottle.run(app, server=WaitressServer, host='0.0.0.0',
+                       port=self.portNo, threads=self.nWorkers)
+        else:
+            workers = None
+            if (self.serverName == 'pool'):
+                workers = self.nWorkers
+            self.serverAdapter = KeepAliveServer(host='0.0.0.0',
+                                                 port=self.portNo,
+                                                 workers=workers)
+            bottle.run(app, server=self.serverAdapter)
 
     def onWwwCmd(self,cmdStr,valStr, methodStr,request):
         ''' Process the command, with parameter 'valStr' using request
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+#
+# calibrationLibrary.py
+#
+# MIT License - CCD_CAPTURE
+#
+# Copyright (c) 2019 Graham Jones
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+'''calibrationLibrary - Master bias, dark and flat frames, and the
+calibration of camera images with them.
+'''
+import os
+import json
+from datetime import datetime
+import numpy as np
+
+
+class CalibrationLibrary():
+    '''
+    Master bias, dark and flat calibration frames, cached in memory and in
+    calDir on disk, keyed by the camera settings they were taken with.
+    '''
+    BIAS = "bias"
+    DARK = "dark"
+    FLAT = "flat"
+    TYPES = (BIAS, DARK, FLAT)
+
+    TEMP_TOLERANCE = 2.0  # degC difference allowed when matching masters
+    INDEX_FNAME = "calibration.json"
+
+    def __init__(self, calDir):
+        self.calDir = calDir
+        if (not os.path.exists(self.calDir)):
+            os.makedirs(self.calDir)
+        self.masters = {}   # fname: float32 array
+        self.index = {}     # fname: dictionary of camera settings
+        indexPath = os.path.join(self.calDir, self.INDEX_FNAME)
+        if (os.path.exists(indexPath)):
+            with open(indexPath) as f:
+                self.index = json.load(f)
+        print("CalibrationLibrary - %d master frames in %s" %
+              (len(self.index), self.calDir))
+        self.work = None  # float32 working image for calibrate()
+
+    def makeSettings(self, calType, exposureTime, binning, subFrame, ccdTemp):
+        """ Returns the dictionary of camera settings used to identify a
+        master frame of type calType.  Bias frames do not depend on exposure
+        time, and flats depend on neither exposure time nor temperature.
+        """
+        settings = {'type': calType,
+                    'binning': list(binning),
+                    'subFrame': list(subFrame)}
+        if (calType == self.DARK):
+            settings['exposureTime'] = round(float(exposureTime), 3)
+        if (calType != self.FLAT):
+            settings['ccdTemp'] = round(float(ccdTemp), 1)
+        return(settings)
+
+    def findMaster(self, calType, exposureTime, binning, subFrame, ccdTemp):
+        """ Returns the master frame of type calType that matches the given
+        camera settings (with the closest temperature within
+        TEMP_TOLERANCE), or None if there is not one.
+        """
+        wanted = self.makeSettings(calType, exposureTime, binning, subFrame,
+                                   ccdTemp)
+        bestFname = None
+        bestDt = None
+        for fname, settings in self.index.items():
+            if (any(settings.get(k) != v for k, v in wanted.items()
+                    if k != 'ccdTemp')):
+                continue
+            dt = abs(settings.get('ccdTemp', 0) - wanted.get('ccdTemp', 0))
+            if (dt <= self.TEMP_TOLERANCE and (bestDt is None or dt < bestDt)):
+                bestFname = fname
+                bestDt = dt
+        if (bestFname is None):
+            return(None)
+        if (bestFname not in self.masters):
+            self.masters[bestFname] = np.load(
+                os.path.join(self.calDir, bestFname))
+        return(self.masters[bestFname])
+
+    def addMaster(self, img, calType, exposureTime, binning, subFrame,
+                  ccdTemp):
+        """ Store float32 image img as the master frame of type calType for
+        the given camera settings, in memory and on disk.
+        Flat frames have the matching dark (or bias) subtracted and are
+        normalised to a mean of 1.
+        """
+        settings = self.makeSettings(calType, exposureTime, binning,
+                                     subFrame, ccdTemp)
+        img = img.astype(np.float32)
+        if (calType == self.FLAT):
+            dark = self.findMaster(self.DARK, exposureTime, binning,
+                                   subFrame, ccdTemp)
+            if (dark is None):
+                dark = self.findMaster(self.BIAS, exposureTime, binning,
+                                       subFrame, ccdTemp)
+            if (dark is not None and dark.shape == img.shape):
+                img -= dark
+            img /= max(float(img.mean()), 1e-6)
+            np.maximum(img, 1e-3, out=img)  # avoid dividing by zero
+
+        # Replace any existing master for these settings
+        for fname in [f for f, st in self.index.items() if st == settings]:
+            del self.index[fname]
+            self.masters.pop(fname, None)
+        tsStr = datetime.now().strftime("%Y%m%d%H%M%S")
+        fname = "%s-%s.npy" % (calType, tsStr)
+        i = 0
+        while (fname in self.index
+               or os.path.exists(os.path.join(self.calDir, fname))):
+            i += 1
+            fname = "%s-%s-%03d.npy" % (calType, tsStr, i)
+        np.save(os.path.join(self.calDir, fname), img)
+        self.index[fname] = settings
+        self.masters[fname] = img
+        with open(os.path.join(self.calDir, self.INDEX_FNAME), "w") as f:
+            json.dump(self.index, f, indent=2, sort_keys=True)
+        print("CalibrationLibrary - saved master %s %s" % (fname, settings))
+        return(fname)
+
+    def calibrate(self, img, exposureTime, binning, subFrame, ccdTemp):
+        """ Calibrate uint16 image img in place, subtracting the matching
+        master dark (or master bias if there is no dark) and dividing by the
+        matching master flat.
+        Returns a string listing the master frames applied ("" if none).
+        """
+        dark = self.findMaster(self.DARK, exposureTime, binning, subFrame,
+                               ccdTemp)
+        applied = []
+        if (dark is not None and dark.shape == img.shape):
+            applied.append(self.DARK)
+        else:
+            dark = self.findMaster(self.BIAS, exposureTime, binning,
+                                   subFrame, ccdTemp)
+            if (dark is not None and dark.shape == img.shape):
+                applied.append(self.BIAS)
+            else:
+                dark = None
+        flat = self.findMaster(self.FLAT, exposureTime, binning, subFrame,
+                               ccdTemp)
+        if (flat is not None and flat.shape == img.shape):
+            applied.append(self.FLAT)
+        else:
+            flat = None
+        if (len(applied) == 0):
+            return("")
+
+        if (self.work is None or self.work.shape != img.shape):
+            self.work = np.empty(img.shape, dtype=np.float32)
+        if (dark is not None):
+            np.subtract(img, dark, out=self.work)
+        else:
+            np.copyto(self.work, img)
+        if (flat is not None):
+            np.divide(self.work, flat, out=self.work)
+        np.clip(self.work, 0, 65535, out=self.work)
+        np.rint(self.work, out=self.work)
+        np.copyto(img, self.work, casting='unsafe')
+        return("+".join(applied))
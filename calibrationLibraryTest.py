@@ -0,0 +1,127 @@
+#
+# calibrationLibraryTest.py
+#
+# MIT License - CCD_CAPTURE
+#
+# Copyright (c) 2019 Graham Jones
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+''' Unit Tests for the calibrationLibrary module '''
+
+import unittest
+import tempfile
+import shutil
+import numpy as np
+from calibrationLibrary import CalibrationLibrary
+
+
+class TestCalibrationLibrary(unittest.TestCase):
+
+    def setUp(self):
+        self.calDir = tempfile.mkdtemp()
+        self.cl = CalibrationLibrary(self.calDir)
+        self.binning = (1,1)
+        self.subFrame = (0,0,4,3)
+
+    def tearDown(self):
+        shutil.rmtree(self.calDir)
+
+    def addMaster(self, value, calType, exposureTime = 1.0, ccdTemp = -10.):
+        return(self.cl.addMaster(np.full((3,4),value,dtype=np.float32),
+                                 calType, exposureTime, self.binning,
+                                 self.subFrame, ccdTemp))
+
+    def findMaster(self, calType, exposureTime = 1.0, ccdTemp = -10.,
+                   binning = None):
+        if (binning is None):
+            binning = self.binning
+        return(self.cl.findMaster(calType, exposureTime, binning,
+                                  self.subFrame, ccdTemp))
+
+    def test_findMaster(self):
+        self.addMaster(100, CalibrationLibrary.DARK, ccdTemp=-10.)
+        self.addMaster(200, CalibrationLibrary.DARK, ccdTemp=-11.5)
+        self.addMaster(50, CalibrationLibrary.BIAS, exposureTime=0.)
+        # The closest temperature within TEMP_TOLERANCE is used.
+        self.assertEqual(self.findMaster(CalibrationLibrary.DARK,
+                                         ccdTemp=-10.6)[0,0], 100,
+                         'wrong dark temperature')
+        self.assertEqual(self.findMaster(CalibrationLibrary.DARK,
+                                         ccdTemp=-11.)[0,0], 200,
+                         'wrong dark temperature')
+        self.assertIsNone(self.findMaster(CalibrationLibrary.DARK,
+                                          ccdTemp=-14.),
+                          'dark matched outside temperature tolerance')
+        self.assertIsNone(self.findMaster(CalibrationLibrary.DARK,
+                                          exposureTime=2.0),
+                          'dark matched wrong exposure time')
+        self.assertIsNone(self.findMaster(CalibrationLibrary.DARK,
+                                          binning=(2,2)),
+                          'dark matched wrong binning')
+        # Bias frames do not depend on exposure time.
+        self.assertEqual(self.findMaster(CalibrationLibrary.BIAS,
+                                         exposureTime=5.)[0,0], 50,
+                         'bias not matched')
+        # A new master replaces the old one for the same settings.
+        self.addMaster(150, CalibrationLibrary.DARK, ccdTemp=-10.)
+        self.assertEqual(len(self.cl.index), 3, 'old master not replaced')
+        # Masters are re-loaded from disk.
+        cl = CalibrationLibrary(self.calDir)
+        self.assertEqual(cl.findMaster(CalibrationLibrary.DARK, 1.0,
+                                       self.binning, self.subFrame,
+                                       -10.)[0,0], 150,
+                         'master not loaded from disk')
+
+    def test_calibrate(self):
+        img = np.array([[0,100,1000,65535]]*3, dtype=np.uint16)
+        self.assertEqual(self.cl.calibrate(img.copy(), 1.0, self.binning,
+                                           self.subFrame, -10.), "",
+                         'calibrated with no masters')
+        # The flat is added first, so the bias is not subtracted from it.
+        self.addMaster(
+            np.array([[1.,1.,2.,0.5]]*3, dtype=np.float32),
+            CalibrationLibrary.FLAT)
+        self.addMaster(200, CalibrationLibrary.BIAS, exposureTime=0.)
+        res = img.copy()
+        applied = self.cl.calibrate(res, 1.0, self.binning, self.subFrame,
+                                    -10.)
+        self.assertEqual(applied, "bias+flat", 'wrong masters applied')
+        self.assertEqual(res.dtype, np.uint16, 'wrong dtype')
+        # The flat is normalised to a mean of 1 (it was 1.125).  Values
+        # are clipped to 0-65535 rather than wrapping.
+        flat = np.array([1.,1.,2.,0.5]) / 1.125
+        expected = np.clip(np.rint((img[0].astype(float) - 200) / flat),
+                           0, 65535)
+        self.assertTrue(np.array_equal(res[0], expected),
+                        'wrong calibrated values %s' % res[0])
+        self.assertEqual((res[0,0], res[0,3]), (0, 65535), 'not clipped')
+        # A dark is used in preference to the bias.
+        self.addMaster(300, CalibrationLibrary.DARK)
+        self.assertEqual(self.cl.calibrate(img.copy(), 1.0, self.binning,
+                                           self.subFrame, -10.),
+                         "dark+flat", 'dark not used')
+        # Masters of the wrong size are not applied.
+        self.assertEqual(self.cl.calibrate(np.zeros((5,5),dtype=np.uint16),
+                                           1.0, self.binning, self.subFrame,
+                                           -10.), "",
+                         'wrong size master applied')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -30,24 +30,43 @@
         The following commands are recognised:
         HTTP GET Commands:
         /getData - returns a JSON string summarising the current state.
-        /getImage - returns a web-scaled version of the latest camera image.
+        /liveStream - a multipart/x-mixed-replace (MJPEG) stream of web-scaled images, updated whenever a new frame is received Add ?w=<width>&h=<height> to choose the image size.
+        /events - a text/event-stream (Server-Sent Events) stream, that sends a 'frame' event containing the frameId and image statistics whenever a new frame is received.
+        /getSnapshot - returns a JSON string containing the current state, and the preview and ROI images and chart data for one frame, tagged with its frameId.  Add ?since=<frameId> to omit the images and charts if the frame has not changed.
+        /getImage - returns a web-scaled version of the latest camera image.  Add ?fmt=<jpeg|webp|png> and ?q=<quality> to choose the encoding (otherwise it is negotiated from the Accept header), or ?mode=archive for lossless PNG, and ?w=<width>&h=<height> to choose the size (default 600x400) - this applies to all of the preview image requests.
         /getRoiImage - as for /getImage but the defined ROI is highlighted on the image.
-        /getFullImage - NOT IMPLEMENTED
+        /getFullImage[?fmt=tiff|npy|fits] - downloads the full resolution image, streamed as a deflate compressed TIFF (the default) or numpy .npy file, or the FITS data exactly as received from the camera.
+        /getTileInfo - returns a JSON string describing the tile pyramid of the current image - tileSize, maxZoom, imgSizeX, imgSizeY and frameId.
+        /getTile/<zoom>/<x>/<y> - returns tile (x, y) of zoom level zoom (0 = whole image in one tile, maxZoom = full resolution) of the current image, encoded as for /getImage.
+        The image, tile, chart and chart data responses have an ETag that changes when the frame, ROI or rendering options change - requests with a matching If-None-Match header get an empty 304 (Not Modified) response.
+        /getRecentFrames/<n> - returns the last n frames (up to the frame buffer size) as a numpy .npy array.
         /getFrameHistogram - returns an image of the pixel intensity histogram for the current image.
         /getRoiHistogram - returns an image of the pixel intensity histogram for the Region of Interest in the current image.
         /getXProfile - returns an image of a graph showing the intensity of pixels across the X direction at the midpoint of the image in Y.
         /getRoiXProfile - returns an image of a graph showing the intensity of pixels across the X direction of the region of interest at the midpoint of the image in Y.
         /getYProfile - returns an image of a graph showing the intensity of pixels across the Y direction at the midpoint of the image in X.
         /getYProfile - returns an image of a graph showing the intensity of pixels across the Y direction of the region of interest at the midpoint of the image in X.
+        /getChartData/<chart> - returns the data for chart (frameHistogram, roiHistogram, xProfile, yProfile, roiXProfile or roiYProfile) as JSON {"chart", "x0", "dx", "values"}, where x0 and dx give the x value of values[0] and the step between values, so the browser can draw the chart.  Add ?fmt=bin for binary data - little endian float64 x0 and dx followed by uint32 values.
 
         HTTP POST Commands:
         /startExposure - start a single camera exposure
-        /startContinuousExposures - start collecting repeated camera exposures.
+        /startContinuousExposures - start collecting repeated camera exposures (the next exposure is started as soon as the image data arrives unless --noPipeline is used).
         /stopContinuousExposures - stop collecting repeated exposures when the current one completes.
         /saveImage/<fname> - save the current image with the specified filename root.
         /startAutoSave/<fname> - start auto saving every image that is received with the specified filename root.
         /stopAutoSave - stop auto saving images.
+        /startStack/<n> - start co-adding the next n frames (0 = until stopStack) - the image, histogram and profile requests then show the stacked image.
+        /stopStack - stop stacking and show live images again (add ?src=stack to a GET request to see the last stack).
+        /setStackMode/<mode>[,<kappa>] - stack combine mode, mean or sigmaClip (rejecting pixels more than kappa SD from the running mean), used from the next /startStack.
+        /saveStack/<fname> - save the stacked image with the specified filename root.
+        /startBurst/<n> - capture n frames back to back into memory without analysing them, then save them to a single .npz file (named using the filename root of the last save request).
+        /stopBurst - stop the current burst early, saving the frames captured so far.
+        /captureMaster/<type>,<n> - capture n raw frames to make a master bias, dark or flat calibration frame for the current exposure time, binning, subframe and CCD temperature.
+        /startCalibration - subtract the matching master dark (or bias) and divide by the matching master flat for each image received.
+        /stopCalibration - stop calibrating images.
         /setExposureTime/<time_secs> - set the camera exposure time to the given time in seconds.
+        /setStatsStep/<n> - calculate the live image statistics from every n'th pixel (1 = all pixels).
+        /setStretch/<stretch> - set the preview image display stretch - linear, asinh, log or percentile (auto-contrast) - add ?stretch=<stretch> to an image request to override it.
         /setCooler/<setpoint> - set the cooler setpoint to the given value (in degC)
         /setSubFrame/<OriginX>,<OriginY>:<SizeX>,<SizeY> define the subframe in camera pixel coordinates.
         /setRoi/<OriginX>,<OriginY>:<SizeX>,<SizeY> define the ROI in camera pixel coordinates, relative to subFrame origin.
@@ -64,11 +83,29 @@ import threading
 import json
 import numpy as np
 import io
-import astropy.io.fits
+import base64
+import hashlib
+import email.utils
+import traceback
 import PyIndi
 import cv2
-import matplotlib.pyplot as plt
+import bottle
 from WebControlClass import WebControlClass
+from frameQueue import FrameQueue
+from frameNotifier import FrameNotifier
+from renderCache import RenderCache
+from chartRenderer import ChartRenderer
+from webEncoder import WebEncoder, negotiateFormat, getMimeType, FORMATS
+from tilePyramid import TilePyramid
+from frameExport import npyChunks, tiffChunks
+from fitsBlob import decodeFitsBlob, getImageShape
+from frameBuffer import FrameRingBuffer, FrameStacker, BurstBuffer, \
+    FrameOverwrittenError
+from calibrationLibrary import CalibrationLibrary
+from imgAnalyser import calcHistogram16, rebinHistogram, \
+    makeStretchLut, applyLut, getWebSize, STRETCHES, WEB_SIZE
+from frameSnapshot import makeFrameSnapshot, FRAME_LIVE, FRAME_STACK, \
+    NO_FRAME
 
 
 class IndiClient(PyIndi.BaseClient):
@@ -77,9 +114,74 @@ class IndiClient(PyIndi.BaseClient):
         #self.blobEvent=threading.Event()
         #self.blobEvent.clear()
         self.imgCallback = imgCallback
+        # Latest values of the number, switch and text properties, keyed
+        # by (deviceName, propertyName), kept up to date by the INDI
+        # callbacks so that they can be read without querying INDI.
+        self.propCache = {}
+        # Notified whenever a device or property is defined or updated, so
+        # that waitFor() returns as soon as the server answers.
+        self.propCond = threading.Condition()
+        self.propGeneration = 0
+
+    def notifyWaiters(self):
+        """ Wake up any threads waiting in waitFor() or waitForUpdate() """
+        with self.propCond:
+            self.propGeneration += 1
+            self.propCond.notify_all()
+
+    def waitFor(self, getter, timeout = 10.0):
+        """ Wait up to timeout seconds for getter() to return something
+        other than None/False, re-trying every time the server defines or
+        updates a device or property.
+        Returns the value returned by getter(), or None on timeout.
+        getter() is called without holding propCond because it calls into
+        the INDI library, which may be dispatching a callback to us.
+        """
+        deadline = time.time() + timeout
+        while True:
+            with self.propCond:
+                generation = self.propGeneration
+            result = getter()
+            if (result):
+                return(result)
+            remaining = deadline - time.time()
+            if (remaining <= 0):
+                return(None)
+            with self.propCond:
+                self.propCond.wait_for(
+                    lambda: self.propGeneration != generation, remaining)
+
+    def waitForUpdate(self, deviceName, propName, since, timeout = 10.0):
+        """ Wait up to timeout seconds for the server to report a new value
+        of property propName of device deviceName after time since, that
+        is not busy.
+        Returns True if the update was received, or False on timeout.
+        """
+        def updated():
+            entry = self.propCache.get((deviceName, propName))
+            return(entry is not None and entry[2] > since
+                   and entry[1] != PyIndi.IPS_BUSY)
+        with self.propCond:
+            return(self.propCond.wait_for(updated, timeout))
+
+    def cacheProperty(self, prop, values):
+        """ Store the values of property vector prop in the property cache
+        """
+        self.propCache[(prop.device, prop.name)] = (values, prop.s, time.time())
+        self.notifyWaiters()
+
+    def getCachedProperty(self, deviceName, propName):
+        """ Returns the list of cached values of property propName of
+        device deviceName, or None if it has not been received yet.
+        """
+        entry = self.propCache.get((deviceName, propName))
+        if (entry is None):
+            return(None)
+        return(entry[0])
 
     def newDevice(self, d):
         print("newDevice:",d.getDeviceName())
+        self.notifyWaiters()
 
     def newProperty(self, p):
         #print("New property ", p.getName(), " for device ",
@@ -87,7 +189,14 @@ class IndiClient(PyIndi.BaseClient):
         #if (p.getName() == "CCD_FRAME"):
         #    for n in p.getNumber():
         #        print(n.name, " = ", n.value)
-        pass
+        if (p.getType() == PyIndi.INDI_NUMBER):
+            self.newNumber(p.getNumber())
+        elif (p.getType() == PyIndi.INDI_SWITCH):
+            self.newSwitch(p.getSwitch())
+        elif (p.getType() == PyIndi.INDI_TEXT):
+            self.newText(p.getText())
+        else:
+            self.notifyWaiters()
     
     def removeProperty(self, p):
         pass
@@ -96,15 +205,15 @@ class IndiClient(PyIndi.BaseClient):
         print("new BLOB ", bp.name)
         #self.blobEvent.set()
         #blobEvent.set()
-        self.imgCallback()
+        self.imgCallback(bp)
 
     def newSwitch(self, svp):
-        pass
+        self.cacheProperty(svp, [sw.s == PyIndi.ISS_ON for sw in svp])
     def newNumber(self, nvp):
-        pass
+        self.cacheProperty(nvp, [n.value for n in nvp])
     def newText(self, tvp):
-        print("IndiClient.newText: ",tvp)
-        pass
+        #print("IndiClient.newText: ",tvp)
+        self.cacheProperty(tvp, [t.text for t in tvp])
     def newLight(self, lvp):
         pass
     def newMessage(self, d, m):
@@ -126,8 +235,37 @@ class Ccd_capture(WebControlClass):
     STATUS_EXPOSING = 2
     STATUS_DOWNLOADING = 3
 
-    WEB_X_MAX = 600
-    WEB_Y_MAX = 400
+    # Clients may ask for preview images of any size up to
+    # PREVIEW_SIZE_MAX pixels - sizes are rounded down to a multiple of
+    # PREVIEW_SIZE_STEP so that similar screens share cached previews.
+    PREVIEW_SIZE_STEP = 50
+    PREVIEW_SIZE_MAX = 2000
+    PREVIEW_CACHE_MB = 16  # Scaled previews of the current frame
+    TILE_SIZE = 256   # Pixels - see getTile
+
+    # Preview image (format, quality) for live viewing and for archival
+    # snapshots (?mode=archive) - see getEncoding().
+    LIVE_ENCODING = ('jpeg', 80)
+    ARCHIVE_ENCODING = ('png', 3)
+    # /getFullImage formats : (file extension, mime type).   fits is the
+    # FITS data exactly as received from the camera.
+    FULL_IMAGE_FORMATS = {'tiff': ('tif', 'image/tiff'),
+                          'npy': ('npy', 'application/octet-stream'),
+                          'fits': ('fits', 'application/fits')}
+    FULL_IMAGE_DEFLATE_LEVEL = 1  # Higher levels barely help noisy frames
+
+    # Request query parameters that change how images are rendered
+    RENDER_PARAMS = ('src', 'fmt', 'stretch')
+    # Times to re-try a render with the latest frame if the frame being
+    # rendered is over-written (see renderFrame()).
+    RENDER_ATTEMPTS = 3
+    CHARTS = ('frameHistogram', 'roiHistogram', 'xProfile', 'yProfile',
+              'roiXProfile', 'roiYProfile')
+
+    PROPERTY_TIMEOUT = 10  # Seconds to wait for the INDI server to respond
+    SLEW_TIMEOUT = 120     # Seconds to wait for the telescope simulator
+    EVENT_KEEPALIVE = 15   # Seconds between /events keep-alive comments
+    LIVE_JPEG_QUALITY = 80  # JPEG quality of the /liveStream frames
     
     indiConnected = False
     cameraInitialised = False
@@ -147,24 +285,39 @@ class Ccd_capture(WebControlClass):
     coolerSetpoint = 0.0 # degC
     coolerOn = False
     ccdTemp = -1
+    exposureRemaining = 0  # Seconds remaining of the current exposure
+    reconfigTime = 0  # Seconds taken for the last subframe/binning change
     continuousMode = False
+    pipelinedMode = True  # Re-arm continuous exposures as soon as the image
+                          # data arrives, rather than after processing it.
     saveFnameRoot = "fname"
     autoSave = False
+    frameQueueSize = 4   # Max frames waiting to be processed
+    frameQueuePolicy = FrameQueue.POLICY_DROP_OLDEST
+
+    calibrationOn = False  # Apply master bias/dark/flat frames to images
+    frameBufferSize = 8  # Number of recent frames kept in memory (>= 2)
 
-    curImageTime = 0  # Time current image was collected
+    # Camera duty cycle monitoring for continuous mode.
+    expStartTime = None  # Time the current exposure was requested
+    lastBlobTime = None  # Time the last image data arrived
+    camBusyTime = 0.     # Total time the camera has been exposing/reading out
+    camIdleTime = 0.     # Total time the camera has been waiting for us
 
-    curImageMean = -1
-    curImageSd = -1
-    curRoiMean = -1
-    curRoiSd = -1
+    statsStep = 1  # Set >1 to calculate statistics from every statsStep'th pixel
+    stretch = "percentile"  # Preview display stretch - see setStretch
 
     status = STATUS_NO_IMAGE
     errorState = 0  # 0=ok, -1=warning, -2=error
     msg = ""
     
-    def __init__(self, cameraId="Atik 383L", dataDir = "."):
+    def __init__(self, cameraId="Atik 383L", dataDir = ".",
+                 frameQueueSize = None, frameQueuePolicy = None,
+                 pipelinedMode = None, frameBufferSize = None,
+                 renderCacheMB = 32, server = None, workers = None):
         print("ccd_capture.__init__()")
-        WebControlClass.__init__(self,portNo=8081)
+        WebControlClass.__init__(self,portNo=8081,server=server,
+                                 workers=workers)
 
         self.cameraId = cameraId
         self.dataDir = os.path.join(self.wwwPath,dataDir)
@@ -173,13 +326,94 @@ class Ccd_capture(WebControlClass):
 
         if (not os.path.exists(self.dataDir)):
             os.makedirs(self.dataDir)
+
+        # Frames received from INDI are processed in their own thread so
+        # that the INDI client thread is never blocked by image processing.
+        if (frameQueueSize is not None):
+            self.frameQueueSize = frameQueueSize
+        if (frameQueuePolicy is not None):
+            self.frameQueuePolicy = frameQueuePolicy
+        if (pipelinedMode is not None):
+            self.pipelinedMode = pipelinedMode
+        if (frameBufferSize is not None):
+            self.frameBufferSize = frameBufferSize
+        self.frameBuffer = FrameRingBuffer(self.frameBufferSize)
+        # Encoded images and charts, so that repeated requests for the same
+        # frame are not re-rendered.
+        self.renderCache = RenderCache(renderCacheMB * 1024 * 1024)
+        # Scaled and stretched previews, before encoding, at each size that
+        # clients have asked for.
+        self.previewCache = RenderCache(self.PREVIEW_CACHE_MB * 1024 * 1024)
+        self.chartRenderer = ChartRenderer()
+        self.webEncoder = WebEncoder()
+        # Included in ETags so that they change if the server is restarted.
+        self.etagSalt = "%x" % int(time.time())
+        # Histograms and display stretch lookup tables, built once per frame.
+        self.lutCache = {}
+        self.lutLock = threading.Lock()
+        # The latest live and stacked frames, as immutable FrameSnapshots.
+        # Readers take a reference to one and use it for the whole request,
+        # so never need a lock - publishLock just stops the frame processing
+        # thread and ROI changes replacing a snapshot at the same time.
+        self.frame = NO_FRAME
+        self.stackFrame = None
+        self.publishLock = threading.Lock()
+        self.stacker = FrameStacker()
+        self.showStack = False  # Serve the stacked image rather than live
+
+        # Calibration masters are built from raw frames by calStacker.
+        self.calLib = CalibrationLibrary(os.path.join(self.dataDir,
+                                                      "calibration"))
+        self.calStacker = FrameStacker(FrameStacker.MODE_SIGMA_CLIP)
+        self.calCaptureType = None
+        self.calStartedExposures = False
+
+        self.burst = None  # BurstBuffer of the current/last burst
+        self.burstStartedExposures = False
+        self.lastBurstFile = ""
+
+        # Number of frames still needed by a burst or calibration capture
+        # that started the exposures (None for continuous exposures).
+        self.exposuresLeft = None
+
+        # Held while new subframe or binning settings are being set and sent
+        # to the camera, so that updateFromPropertyCache() does not put the
+        # old values back in the meantime.
+        self.settingsLock = threading.RLock()
+
+        # /events and /liveStream clients wait on frameNotifier for new
+        # frames.
+        self.frameNotifier = FrameNotifier()
+        # The latest /liveStream frame, shared by all of the viewers.
+        self.liveJpegLock = threading.Lock()
+        self.liveJpegCount = None
+        self.liveJpegs = {}   # maxSize : JPEG image
+        self.nLiveViewers = 0
+
+        self.frameQueue = FrameQueue(self.frameQueueSize,
+                                     self.frameQueuePolicy)
+        self.frameThread = threading.Thread(target=self.processFrames,
+                                            daemon=True)
+        self.frameThread.start()
+
         self.connectINDI(cameraId)
         
         self.startServer()
 
     def toJson(self):
         """ Returns a JSON representation of the current ccd status """
-        self.getCcdTemperature()
+        jsonStr = json.dumps(self.getStatus(),indent=2,sort_keys=True)
+        #print jsonStr
+        return jsonStr
+
+    def getStatus(self, frame = None):
+        """ Returns a dictionary summarising the current ccd status, with
+        the statistics of FrameSnapshot frame (default the latest live
+        frame).
+        """
+        self.updateFromPropertyCache()
+        if (frame is None):
+            frame = self.frame
         
         obj = {}
         obj['statusVal']=self.status
@@ -202,16 +436,44 @@ class Ccd_capture(WebControlClass):
         obj['coolerSetpoint']=self.coolerSetpoint
         obj['coolerOn']=self.coolerOn
         obj['ccdTemp']=self.ccdTemp
-        obj['curImageTime']=self.curImageTime
-        obj['curImageMean']="%.1f" % self.curImageMean
-        obj['curImageSd']="%.1f" % self.curImageSd
-        obj['curRoiMean']="%.1f" % self.curRoiMean
-        obj['curRoiSd']="%.1f" % self.curRoiSd
-
-
-        jsonStr = json.dumps(obj,indent=2,sort_keys=True)
-        #print jsonStr
-        return jsonStr
+        obj['exposureRemaining']="%.1f" % self.exposureRemaining
+        obj['reconfigTime']="%.3f" % self.reconfigTime
+        obj['curImageTime']=frame.time
+        obj['frameSeq']=frame.seq
+        obj['renderCacheHits']=self.renderCache.hits
+        obj['renderCacheMisses']=self.renderCache.misses
+        obj['stackActive']=self.stacker.active
+        obj['showStack']=self.showStack
+        obj['stackMode']=self.stacker.mode
+        obj['nStacked']=self.stacker.nStacked
+        obj['nStackTarget']=self.stacker.nTarget
+        obj['nStackRejected']=self.stacker.nRejected
+        obj['calibrationOn']=self.calibrationOn
+        obj['curCalibration']=frame.calibration
+        obj['calCaptureType']=self.calCaptureType
+        obj['nCalStacked']=self.calStacker.nStacked
+        obj['nCalTarget']=self.calStacker.nTarget
+        if (self.burst is not None):
+            obj['burstActive']=not self.burst.isComplete()
+            obj['nBurstFrames']=self.burst.nReceived
+            obj['nBurstTarget']=self.burst.nFrames
+            obj['burstFrameRate']="%.1f" % self.burst.getFrameRate()
+        obj['lastBurstFile']=self.lastBurstFile
+        obj['curImageMean']="%.1f" % frame.stats.imageMean
+        obj['curImageSd']="%.1f" % frame.stats.imageSd
+        obj['curRoiMean']="%.1f" % frame.stats.roiMean
+        obj['curRoiSd']="%.1f" % frame.stats.roiSd
+        obj['curImageSat']=frame.stats.imageSat
+        obj['curRoiSat']=frame.stats.roiSat
+        obj['statsStep']=self.statsStep
+        obj['stretch']=self.stretch
+        obj['framesQueued']=self.frameQueue.qsize()
+        obj['framesDropped']=self.frameQueue.nDropped
+        obj['pipelinedMode']=self.pipelinedMode
+        obj['dutyCycle']="%.1f" % self.getDutyCycle()
+        obj['liveViewers']=self.nLiveViewers
+        obj['encodeTimes']=self.webEncoder.getTimings()
+        return(obj)
 
 
     def initialiseCamera(self):
@@ -228,16 +490,20 @@ class Ccd_capture(WebControlClass):
         telescope_connect=None
 
         # get the telescope device
-        device_telescope=self.indiclient.getDevice(telescope)
-        while not(device_telescope):
-            time.sleep(0.5)
-            device_telescope=self.indiclient.getDevice(telescope)
+        device_telescope=self.indiclient.waitFor(
+            lambda: self.indiclient.getDevice(telescope),
+            self.PROPERTY_TIMEOUT)
+        if not(device_telescope):
+            print("ERROR - Failed to find Device %s" % telescope)
+            return(-1)
             
         # wait CONNECTION property be defined for telescope
-        telescope_connect=device_telescope.getSwitch("CONNECTION")
-        while not(telescope_connect):
-            time.sleep(0.5)
-            telescope_connect=device_telescope.getSwitch("CONNECTION")
+        telescope_connect=self.indiclient.waitFor(
+            lambda: device_telescope.getSwitch("CONNECTION"),
+            self.PROPERTY_TIMEOUT)
+        if not(telescope_connect):
+            print("ERROR - Failed to get %s CONNECTION" % telescope)
+            return(-1)
 
         # if the telescope device is not connected, we do connect it
         if not(device_telescope.isConnected()):
@@ -254,10 +520,12 @@ class Ccd_capture(WebControlClass):
 
         # We want to set the ON_COORD_SET switch to engage tracking after goto
         # device.getSwitch is a helper to retrieve a property vector
-        telescope_on_coord_set=device_telescope.getSwitch("ON_COORD_SET")
-        while not(telescope_on_coord_set):
-            time.sleep(0.5)
-            telescope_on_coord_set=device_telescope.getSwitch("ON_COORD_SET")
+        telescope_on_coord_set=self.indiclient.waitFor(
+            lambda: device_telescope.getSwitch("ON_COORD_SET"),
+            self.PROPERTY_TIMEOUT)
+        if not(telescope_on_coord_set):
+            print("ERROR - Failed to get %s ON_COORD_SET" % telescope)
+            return(-1)
         # the order below is defined in the property vector, look at the standard Properties page
         # or enumerate them in the Python shell when you're developing your program
         telescope_on_coord_set[0].s=PyIndi.ISS_ON  # TRACK
@@ -265,17 +533,21 @@ class Ccd_capture(WebControlClass):
         telescope_on_coord_set[2].s=PyIndi.ISS_OFF # SYNC
         self.indiclient.sendNewSwitch(telescope_on_coord_set)
         # We set the desired coordinates
-        telescope_radec=device_telescope.getNumber("EQUATORIAL_EOD_COORD")
-        while not(telescope_radec):
-            time.sleep(0.5)
-            telescope_radec=device_telescope.getNumber("EQUATORIAL_EOD_COORD")
+        telescope_radec=self.indiclient.waitFor(
+            lambda: device_telescope.getNumber("EQUATORIAL_EOD_COORD"),
+            self.PROPERTY_TIMEOUT)
+        if not(telescope_radec):
+            print("ERROR - Failed to get %s EQUATORIAL_EOD_COORD" % telescope)
+            return(-1)
         telescope_radec[0].value=vega['ra']
         telescope_radec[1].value=vega['dec']
+        sendTime = time.time()
         self.indiclient.sendNewNumber(telescope_radec)
         # and wait for the scope has finished moving
-        while (telescope_radec.s==PyIndi.IPS_BUSY):
-            print("Scope Moving ", telescope_radec[0].value, telescope_radec[1].value)
-            time.sleep(2)
+        print("Scope Moving ", telescope_radec[0].value, telescope_radec[1].value)
+        if not(self.indiclient.waitForUpdate(telescope, "EQUATORIAL_EOD_COORD",
+                                             sendTime, self.SLEW_TIMEOUT)):
+            print("WARNING - Scope still moving after %d s" % self.SLEW_TIMEOUT)
 
 
 
@@ -284,7 +556,8 @@ class Ccd_capture(WebControlClass):
                     cameraId="Atik 383L",
                     serverHost = "localhost",
                     serverPort = 7624):
-        self.indiclient=IndiClient(self.receiveImage)
+        startTime = time.time()
+        self.indiclient=IndiClient(self.onBlob)
         self.indiclient.setServer(serverHost, serverPort)
 
         if (not(self.indiclient.connectServer())):
@@ -306,48 +579,40 @@ class Ccd_capture(WebControlClass):
             self.initialiseTelescopeSimulator()
             
         print("Looking for device %s...." % cameraId)
-        self.device_ccd=self.indiclient.getDevice(cameraId)
-        nRetries = 0
-        while not(self.device_ccd):
-            time.sleep(0.5)
-            self.device_ccd=self.indiclient.getDevice(cameraId)
-            sys.stderr.write(".")
-            sys.stderr.flush()
-            nRetries += 1
-
-            if (nRetries >= 20):
-                print("")
-                print("")
-                print("***********************************************")
-                print("ERROR - Failed to find Device %s" % cameraId)
-                print(" - Check that the INDI server is providing it")
-                print("***********************************************")
-                exit(-1)
+        self.device_ccd=self.indiclient.waitFor(
+            lambda: self.indiclient.getDevice(cameraId),
+            self.PROPERTY_TIMEOUT)
+        if not(self.device_ccd):
+            print("")
+            print("")
+            print("***********************************************")
+            print("ERROR - Failed to find Device %s" % cameraId)
+            print(" - Check that the INDI server is providing it")
+            print("***********************************************")
+            exit(-1)
         print("\nFound device!")
 
-        print("Connecting to Device")
-        self.ccd_connect=self.device_ccd.getSwitch("CONNECTION")
-        while not(self.ccd_connect):
-            time.sleep(0.5)
-            self.ccd_connect=self.device_ccd.getSwitch("CONNECTION")
-            sys.stderr.write(".")
-        print("\nConnected!")
-        if not(self.device_ccd.isConnected()):
-            print("oh no - isConnected is false - fiddling...")
-            self.ccd_connect[0].s=PyIndi.ISS_ON  # the "CONNECT" switch
-            self.ccd_connect[1].s=PyIndi.ISS_OFF # the "DISCONNECT" switch
-            self.indiclient.sendNewSwitch(self.ccd_connect)
-
-        print("Getting Exposure Object..")
-        self.ccd_exposure=self.device_ccd.getNumber("CCD_EXPOSURE")
-        while not(self.ccd_exposure):
-            time.sleep(0.5)
-            self.ccd_exposure=self.device_ccd.getNumber("CCD_EXPOSURE")
-            sys.stderr.write(".")
-        print("got exposure object ")
-
-        self.getFrame()
-        self.getSubFrame()
+        # We can not work without these properties, so give up if the
+        # camera does not provide them.
+        try:
+            print("Connecting to Device")
+            self.ccd_connect=self.getCcdProperty("CONNECTION",
+                                                 self.device_ccd.getSwitch)
+            print("\nConnected!")
+            if not(self.device_ccd.isConnected()):
+                print("oh no - isConnected is false - fiddling...")
+                self.ccd_connect[0].s=PyIndi.ISS_ON  # the "CONNECT" switch
+                self.ccd_connect[1].s=PyIndi.ISS_OFF # the "DISCONNECT" switch
+                self.indiclient.sendNewSwitch(self.ccd_connect)
+
+            print("Getting Exposure Object..")
+            self.ccd_exposure=self.getCcdProperty("CCD_EXPOSURE")
+            print("got exposure object ")
+
+            self.getFrame()
+            self.getSubFrame()
+        except RuntimeError:
+            exit(-1)
         
         # we should inform the indi server that we want to receive the
         # "CCD1" blob from this device
@@ -358,7 +623,40 @@ class Ccd_capture(WebControlClass):
 
         self.msg = "ConnectINDI Complete"
         self.errorState = 0
-        print(self.msg)
+        print("%s in %.2f s" % (self.msg, time.time() - startTime))
+
+    def getCcdProperty(self, propName, getter = None):
+        """ Returns the property propName of the camera, waiting up to
+        PROPERTY_TIMEOUT seconds for the server to define it.
+        getter is the device method used to retrieve the property
+        (default self.device_ccd.getNumber).
+        Raises RuntimeError if the property is not defined in time.
+        """
+        if (getter is None):
+            getter = self.device_ccd.getNumber
+        prop = self.indiclient.waitFor(lambda: getter(propName),
+                                       self.PROPERTY_TIMEOUT)
+        if not(prop):
+            self.msg = "ERROR - Camera did not provide %s" % propName
+            self.errorState = -2
+            print(self.msg)
+            raise RuntimeError(self.msg)
+        return(prop)
+
+    def sendCcdNumber(self, prop):
+        """ Send the new values of number property prop to the camera and
+        wait for the server to acknowledge them.   The time taken is
+        stored in self.reconfigTime, and returned.
+        """
+        sendTime = time.time()
+        self.indiclient.sendNewNumber(prop)
+        if not(self.indiclient.waitForUpdate(self.cameraId, prop.name,
+                                             sendTime,
+                                             self.PROPERTY_TIMEOUT)):
+            print("WARNING - no acknowledgement of %s from camera" % prop.name)
+        self.reconfigTime = time.time() - sendTime
+        print("%s set in %.3f s" % (prop.name, self.reconfigTime))
+        return(self.reconfigTime)
 
 
     def getFrame(self):
@@ -366,12 +664,7 @@ class Ccd_capture(WebControlClass):
         in the camera.
         """
         print("Getting CCD_INFO Object..")
-        ccd_info=self.device_ccd.getNumber("CCD_INFO")
-        while not(ccd_info):
-            time.sleep(0.5)
-            ccd_info=self.device_ccd.getNumber("CCD_INFO")
-            sys.stderr.write(".")
-            sys.stderr.flush()
+        ccd_info=self.getCcdProperty("CCD_INFO")
         print("got ccd_info object: ")
         for n in ccd_info:
             print(n.name," = ",n.value)
@@ -384,11 +677,7 @@ class Ccd_capture(WebControlClass):
         in the camera.
         """
         print("Getting Frame Object..")
-        ccd_frame=self.device_ccd.getNumber("CCD_FRAME")
-        while not(ccd_frame):
-            time.sleep(0.5)
-            ccd_frame=self.device_ccd.getNumber("CCD_FRAME")
-            sys.stderr.write(".")
+        ccd_frame=self.getCcdProperty("CCD_FRAME")
         print("got frame object:")
         for n in ccd_frame:
             print(n.name," = ",n.value)
@@ -401,90 +690,109 @@ class Ccd_capture(WebControlClass):
     def setSubFrame(self):
         """ sets the camera frame dimensions based on the properties
         of this object.
+        Raises RuntimeError if the camera does not provide CCD_FRAME.
         """
-        print("Getting Frame Object..")
-        ccd_frame=self.device_ccd.getNumber("CCD_FRAME")
-        while not(ccd_frame):
-            time.sleep(0.5)
-            ccd_frame=self.device_ccd.getNumber("CCD_FRAME")
-            sys.stderr.write(".")
-        print("got frame object ", ccd_frame)
-        for n in ccd_frame:
-            print(n.name," = ",n.value)
-        ccd_frame[0].value = self.subFrameOriginX
-        ccd_frame[1].value = self.subFrameOriginY
-        ccd_frame[2].value = self.subFrameSizeX
-        ccd_frame[3].value = self.subFrameSizeY
-        self.indiclient.sendNewNumber(ccd_frame)
+        with self.settingsLock:
+            print("Getting Frame Object..")
+            ccd_frame=self.getCcdProperty("CCD_FRAME")
+            print("got frame object ", ccd_frame)
+            for n in ccd_frame:
+                print(n.name," = ",n.value)
+            ccd_frame[0].value = self.subFrameOriginX
+            ccd_frame[1].value = self.subFrameOriginY
+            ccd_frame[2].value = self.subFrameSizeX
+            ccd_frame[3].value = self.subFrameSizeY
+            self.sendCcdNumber(ccd_frame)
         print("setFrame complete")
 
     def clearSubFrame(self):
         """ Reset the camera subframe to be the whole sensor dimensions.
+        Raises RuntimeError if the camera does not provide CCD_FRAME.
         """
-        self.subFrameOriginX = 0
-        self.subFrameOriginY = 0
-        self.subFrameSizeX = self.frameSizeX
-        self.subFrameSizeY = self.frameSizeY
-        self.setSubFrame()
+        with self.settingsLock:
+            self.subFrameOriginX = 0
+            self.subFrameOriginY = 0
+            self.subFrameSizeX = self.frameSizeX
+            self.subFrameSizeY = self.frameSizeY
+            self.setSubFrame()
         print("clearSubFrame complete")
 
 
     def setBinning(self, binX, binY):
         """ Sets the camera binning to match binX and binY
         parameters.
+        Raises RuntimeError if the camera does not provide CCD_BINNING.
         """
-        self.binX = binX
-        self.binY = binY
-
-        ccd_binning=self.device_ccd.getNumber("CCD_BINNING")
-        while not(ccd_binning):
-            time.sleep(0.5)
-            ccd_binning=self.device_ccd.getNumber("CCD_BINNING")
-            sys.stderr.write(".")
-            sys.stderr.flush()
-        print("got ccd_binning object ", ccd_binning)
-        for n in ccd_binning:
-            print(n.name," = ",n.value)
-        ccd_binning[0].value = self.binX
-        ccd_binning[1].value = self.binY
-        self.indiclient.sendNewNumber(ccd_binning)
+        with self.settingsLock:
+            self.binX = binX
+            self.binY = binY
+
+            ccd_binning=self.getCcdProperty("CCD_BINNING")
+            print("got ccd_binning object ", ccd_binning)
+            for n in ccd_binning:
+                print(n.name," = ",n.value)
+            ccd_binning[0].value = self.binX
+            ccd_binning[1].value = self.binY
+            self.sendCcdNumber(ccd_binning)
 
     def resetBinning(self):
         self.setBinning(1,1)
         
     def getCcdTemperature(self):
-        """ Retrieve the current temperature of the CCD from the camera
+        """ Retrieve the current temperature of the CCD from the INDI
+        property cache (it is not updated if the camera has not reported
+        a temperature yet).
         """
-        #print("Getting CCD Temperature..")
-        ccd_temp=self.device_ccd.getNumber("CCD_TEMPERATURE")
-        while not(ccd_temp):
-            time.sleep(0.5)
-            ccd_temp=self.device_ccd.getNumber("CCD_TEMPERATURE")
-            sys.stderr.write(".")
-            sys.stderr.flush()
-        #print("got ccd_temp object ", ccd_temp)
-        #for n in ccd_temp:
-        #    print(n.name," = ",n.value)
-        self.ccdTemp = ccd_temp[0].value
-
-        #print("getCcdTemperature complete")
+        ccd_temp = self.indiclient.getCachedProperty(self.cameraId,
+                                                     "CCD_TEMPERATURE")
+        if (ccd_temp is not None):
+            self.ccdTemp = ccd_temp[0]
+        return(self.ccdTemp)
+
+    def updateFromPropertyCache(self):
+        """ Update the camera temperature, exposure countdown, subframe and
+        binning from the values most recently reported by the camera.
+        This only reads memory, so is cheap enough to call for every
+        status request.   The subframe and binning are not updated while
+        new settings are being sent to the camera (see settingsLock).
+        """
+        self.getCcdTemperature()
+        ccd_exposure = self.indiclient.getCachedProperty(self.cameraId,
+                                                         "CCD_EXPOSURE")
+        if (ccd_exposure is not None):
+            self.exposureRemaining = ccd_exposure[0]
+        if (not self.settingsLock.acquire(blocking=False)):
+            return
+        try:
+            ccd_frame = self.indiclient.getCachedProperty(self.cameraId,
+                                                          "CCD_FRAME")
+            if (ccd_frame is not None):
+                self.subFrameOriginX = int(ccd_frame[0])
+                self.subFrameOriginY = int(ccd_frame[1])
+                self.subFrameSizeX = int(ccd_frame[2])
+                self.subFrameSizeY = int(ccd_frame[3])
+            ccd_binning = self.indiclient.getCachedProperty(self.cameraId,
+                                                            "CCD_BINNING")
+            if (ccd_binning is not None):
+                self.binX = int(ccd_binning[0])
+                self.binY = int(ccd_binning[1])
+        finally:
+            self.settingsLock.release()
 
     def setCooler(self,startCooler = True):
         """ Sets up the cooler.  if startCooler is true, the cooler
         is switched on with setpoint self.coolerSetpoint.
         if startCooler is False, the cooler is switched off.
+        Raises RuntimeError if the camera does not provide CCD_TEMPERATURE.
         """
         #print("Getting CCD Temperature..")
-        ccd_temp=self.device_ccd.getNumber("CCD_TEMPERATURE")
-        while not(ccd_temp):
-            time.sleep(0.5)
-            ccd_temp=self.device_ccd.getNumber("CCD_TEMPERATURE")
-            sys.stderr.write(".")
-            sys.stderr.flush()
+        ccd_temp=self.getCcdProperty("CCD_TEMPERATURE")
         #print("got ccd_temp object ", ccd_temp)
         #for n in ccd_temp:
         #    print(n.name," = ",n.value)
         ccd_temp[0].value = self.coolerSetpoint
+        # Note - we do not wait for an acknowledgement because the camera
+        # reports the temperature as busy until the setpoint is reached.
         self.indiclient.sendNewNumber(ccd_temp)
 
         #print("getCcdTemperature complete")
@@ -516,15 +824,6 @@ class Ccd_capture(WebControlClass):
         if not self.indiConnected:
             self.connectINDI()
 
-        print("Getting Blob")
-        self.ccd_ccd1=self.device_ccd.getBLOB("CCD1")
-        while not(self.ccd_ccd1):
-            time.sleep(0.5)
-            self.ccd_ccd1=self.device_ccd.getBLOB("CCD1")
-            sys.stderr.write(".")
-
-        print("got Blob")
-
         #self.indiclient.blobEvent.clear()
         # global blobEvent
         # blobEvent=threading.Event()
@@ -532,6 +831,9 @@ class Ccd_capture(WebControlClass):
         
         print("Sending exposure object...")
         self.status = self.STATUS_EXPOSING
+        self.expStartTime = time.time()
+        if (self.continuousMode and self.lastBlobTime is not None):
+            self.camIdleTime += self.expStartTime - self.lastBlobTime
         self.ccd_exposure[0].value=self.exposureTime
         #print("Setting exposure to %s" % self.ccd_exposure[0])
         self.indiclient.sendNewNumber(self.ccd_exposure)
@@ -542,15 +844,71 @@ class Ccd_capture(WebControlClass):
 
 
 
-    def receiveImage(self):
-        """ called by indiClient when Blob received
-        Memory based file handling from https://www.indilib.org/forum/general/606-take-image-with-python-script/3189.html?start=12
+    def onBlob(self, bp):
+        """ called by indiClient (in the INDI client thread) when a Blob
+        is received.   We only take a copy of the blob data and queue it
+        for processFrames() so the INDI connection is not held up by
+        image processing.
+        """
+        #print("name: ", bp.name," size: ", bp.size," format: ", bp.format)
+        fits = bp.getblobdata()
+        blobTime = datetime.now().timestamp()
+        if (self.expStartTime is not None):
+            self.camBusyTime += blobTime - self.expStartTime
+        self.expStartTime = None
+        self.lastBlobTime = blobTime
+        if (self.exposuresLeft is not None):
+            self.exposuresLeft -= 1
+
+        # In pipelined mode the next exposure runs while we process this
+        # one, as long as more frames are needed.
+        if (self.pipelinedMode and self.needExposure()):
+            self.startExposure()
+
+        nDropped = self.frameQueue.nDropped
+        if (not self.frameQueue.put((fits, blobTime))):
+            print("onBlob - frame queue full, dropped new frame")
+        if (self.exposuresLeft is not None
+            and self.frameQueue.nDropped != nDropped):
+            # Dropped frames have to be taken again.
+            self.exposuresLeft += self.frameQueue.nDropped - nDropped
+            if (self.pipelinedMode and self.expStartTime is None
+                and self.needExposure()):
+                self.startExposure()
+
+    def needExposure(self):
+        """ Returns True if another exposure should be started once the
+        current one is complete - i.e. continuous exposures are running and
+        a burst or calibration capture that started them still needs more
+        frames.
+        """
+        return(self.continuousMode
+               and (self.exposuresLeft is None or self.exposuresLeft > 0))
+
+    def processFrames(self):
+        """ Frame processing thread - takes frames from the frame queue
+        and passes them to receiveImage() until the server is shut down.
+        """
+        while not self.shutDown:
+            item = self.frameQueue.get(timeout=1.0)
+            if (item is None):
+                continue
+            try:
+                self.receiveImage(*item)
+            except Exception:
+                print("processFrames - error processing frame")
+                traceback.print_exc()
+                self.status = self.STATUS_ERROR
+
+    def receiveImage(self, fits, blobTime):
+        """ Process the FITS data fits received from the camera at time
+        blobTime (called from the frame processing thread).
+        The FITS data is decoded in memory by fitsBlob.decodeFitsBlob().
         """
         print("receiveImage()")
-        for blob in self.ccd_ccd1:
-            #print("name: ", blob.name," size: ", blob.size," format: ", blob.format)
-            fits=blob.getblobdata()
-            #print("fits data type: ", type(fits))
+        if (self.burst is not None and not self.burst.isComplete()):
+            self.receiveBurstFrame(fits, blobTime)
+            return
 
         # i=0
         #fname="/tmp"
@@ -564,41 +922,375 @@ class Ccd_capture(WebControlClass):
         #ofile.close()
         #print("written to file %s" % fname)
 
-        blobFile = io.BytesIO(fits)
-        hdulist = astropy.io.fits.open(blobFile)
-        #print(hdulist.info())
-        hdu = hdulist[0]
-        #print(hdu.data.shape)
-        #print(hdu.header)
-        self.curImg = np.asarray(hdu.data,dtype=np.uint16)
-        self.curImageTime = datetime.now().timestamp()
-        self.curImageMean = self.curImg.mean()
-        self.curImageSd = 100 * self.curImg.std() / self.curImageMean
-
-        roiImg = self.curImg[self.roiOriginY :
-                             self.roiOriginY + self.roiSizeY,
-                             self.roiOriginX :
-                             self.roiOriginX + self.roiSizeX]
-
-        self.curRoiMean = roiImg.mean()
-        self.curRoiSd = 100 * roiImg.std() / self.curRoiMean
-        self.status = self.STATUS_IDLE
-        print("curImageTime=%s" % self.curImageTime)
+        # Decode straight into the next slot of the recent frame buffer
+        # to avoid allocating a new image for every frame.
+        shape = getImageShape(fits)
+        if (shape is not None):
+            seq, slot = self.frameBuffer.getWriteSlot(shape)
+            img = decodeFitsBlob(fits, slot)
+        else:
+            img = decodeFitsBlob(fits)
+            seq, slot = self.frameBuffer.getWriteSlot(img.shape)
+            np.copyto(slot, img)
+
+        # Read the temperature now rather than relying on the status polls
+        # so that calibration masters are matched to this frame.
+        ccdTemp = self.getCcdTemperature()
+        if (self.calCaptureType is not None):
+            self.addCalibrationFrame(slot, ccdTemp)
+        calibration = ""
+        if (self.calibrationOn):
+            calibration = self.calLib.calibrate(
+                slot, self.exposureTime, (self.binX, self.binY),
+                (self.subFrameOriginX, self.subFrameOriginY,
+                 self.subFrameSizeX, self.subFrameSizeY),
+                ccdTemp)
+
+        # The frame is only published once it is completely processed, so
+        # requests never see a half calibrated image or stale statistics.
+        frame = makeFrameSnapshot(FRAME_LIVE, seq, slot, self.getRoi(),
+                                  self.statsStep, fits, blobTime,
+                                  self.exposureTime, calibration)
+        stackFrame = None
+        if (self.stacker.add(slot)):
+            stackFrame = makeFrameSnapshot(
+                FRAME_STACK, self.stacker.nStacked, self.stacker.getImage(),
+                frame.roi, self.statsStep, None, blobTime,
+                self.exposureTime, calibration)
+        self.frameBuffer.commit(seq, {
+            'seq': seq,
+            'time': blobTime,
+            'exposureTime': self.exposureTime,
+            'subFrame': (self.subFrameOriginX, self.subFrameOriginY,
+                         self.subFrameSizeX, self.subFrameSizeY),
+            'binning': (self.binX, self.binY),
+            'ccdTemp': ccdTemp,
+            'calibration': calibration,
+            'imageMean': frame.stats.imageMean,
+            'imageSd': frame.stats.imageSd,
+            'roi': frame.roi,
+            'roiMean': frame.stats.roiMean,
+            'roiSd': frame.stats.roiSd,
+            })
+        self.publishFrame(frame, stackFrame)
+        if (self.expStartTime is None):
+            self.status = self.STATUS_IDLE
+        print("curImageTime=%s" % frame.time)
+        self.notifyFrame()
 
         if (self.autoSave):
             self.saveImage()
 
-        if (self.continuousMode):
+        if (not self.pipelinedMode and self.needExposure()):
             self.startExposure()
         
+    def getRoi(self):
+        """ Returns the ROI as (xOrigin, yOrigin, xSize, ySize) """
+        return((self.roiOriginX, self.roiOriginY,
+                self.roiSizeX, self.roiSizeY))
+
+    def publishFrame(self, frame, stackFrame = None):
+        """ Make FrameSnapshot frame the current live frame (and
+        stackFrame, if it is not None, the current stacked frame), and
+        clear the caches of renders of the previous frames.   If the ROI
+        has been changed while the frame was being processed, the
+        snapshots are re-made with the new ROI first.
+        """
+        with self.publishLock:
+            roi = self.getRoi()
+            if (frame.roi != roi):
+                frame = frame.withRoi(roi, self.statsStep)
+            if (stackFrame is not None and stackFrame.roi != roi):
+                stackFrame = stackFrame.withRoi(roi, self.statsStep)
+            self.frame = frame
+            if (stackFrame is not None):
+                self.stackFrame = stackFrame
+        self.renderCache.clear()
+        self.previewCache.clear()
+        with self.lutLock:
+            self.lutCache.clear()
+
+    def publishRoi(self):
+        """ Re-publish the current live and stacked frames with the ROI
+        that has just been set, so that their ROI statistics are updated.
+        """
+        with self.publishLock:
+            roi = self.getRoi()
+            frame = self.frame
+            if (frame.img is not None):
+                self.frame = frame.withRoi(roi, self.statsStep)
+            stackFrame = self.stackFrame
+            if (stackFrame is not None):
+                self.stackFrame = stackFrame.withRoi(roi, self.statsStep)
+        self.renderCache.clear()
+
+    def notifyFrame(self):
+        """ Wake up the /events clients to tell them about a new frame """
+        self.frameNotifier.notify()
+
+    def onShutDown(self):
+        """ Called by stopServer() - ends the /events and /liveStream
+        streams.
+        """
+        self.frameNotifier.stop()
+
+    def getFrameEvent(self):
+        """ Returns a dictionary describing the current frame, sent to
+        /events clients when a new frame is received.
+        """
+        frame = self.frame
+        return({
+            'frameId': self.getDisplayFrame(liveFrame=frame).getFrameId(),
+            'frameSeq': frame.seq,
+            'curImageTime': frame.time,
+            'curImageMean': "%.1f" % frame.stats.imageMean,
+            'curImageSd': "%.1f" % frame.stats.imageSd,
+            'curImageSat': frame.stats.imageSat,
+            'curRoiMean': "%.1f" % frame.stats.roiMean,
+            'curRoiSd': "%.1f" % frame.stats.roiSd,
+            'curRoiSat': frame.stats.roiSat,
+        })
+
+    def frameEvents(self):
+        """ A generator of Server-Sent Events for /events.   A 'frame'
+        event (see getFrameEvent()) is sent when the client connects and
+        whenever a new frame is received.  A comment is sent every
+        EVENT_KEEPALIVE seconds when nothing else is happening, so that
+        dead connections are noticed and closed.   The stream ends when
+        the server is shut down.
+        """
+        yield("retry: 2000\n\n")
+        for count in self.frameNotifier.waitForFrames(self.EVENT_KEEPALIVE):
+            if (count is None):
+                yield(": keepalive\n\n")
+            elif (self.status != self.STATUS_NO_IMAGE):
+                yield("event: frame\ndata: %s\n\n"
+                      % json.dumps(self.getFrameEvent()))
+
+    def getLiveJpeg(self, eventCount, maxSize = WEB_SIZE):
+        """ Returns the current display image, scaled for the web to fit
+        maxSize and stretched to 8 bits, as a JPEG image.   The image is
+        only encoded once for each eventCount (i.e. once per frame) and
+        size, however many /liveStream viewers there are.
+        """
+        with self.liveJpegLock:
+            if (self.liveJpegCount != eventCount):
+                self.liveJpegs = {}
+                self.liveJpegCount = eventCount
+            jpeg = self.liveJpegs.get(maxSize)
+            if (jpeg is None):
+                jpeg = self.webEncoder.encode(
+                    self.getPreviewImg(self.getDisplayFrame(), maxSize), 'jpeg',
+                    self.LIVE_JPEG_QUALITY)
+                self.liveJpegs[maxSize] = jpeg
+            return(jpeg)
+
+    def liveStream(self, maxSize = WEB_SIZE):
+        """ A generator of the parts of a multipart/x-mixed-replace (MJPEG)
+        stream for /liveStream, of images scaled to fit maxSize (see
+        getPreviewSize()).   A JPEG image (see getLiveJpeg()) is sent
+        whenever a new frame is received, and the last one is re-sent
+        every EVENT_KEEPALIVE seconds so that dead connections are noticed
+        and closed.   The stream ends when the server is shut down.
+        """
+        with self.liveJpegLock:
+            self.nLiveViewers += 1
+        try:
+            lastCount = None
+            for count in self.frameNotifier.waitForFrames(
+                    self.EVENT_KEEPALIVE):
+                if (count is not None):
+                    lastCount = count
+                if (self.status == self.STATUS_NO_IMAGE):
+                    continue
+                try:
+                    jpeg = self.getLiveJpeg(lastCount, maxSize)
+                except FrameOverwrittenError:
+                    # A newer frame has arrived - send that one instead.
+                    continue
+                yield(b"--frame\r\n"
+                      b"Content-Type: image/jpeg\r\n"
+                      b"Content-Length: %d\r\n\r\n" % len(jpeg)
+                      + jpeg + b"\r\n")
+        finally:
+            with self.liveJpegLock:
+                self.nLiveViewers -= 1
+
+    def startBurst(self, nFrames):
+        """ Start a burst of nFrames exposures, that are stored in memory
+        without any analysis, then written to disk as a single file when
+        the burst is complete.
+        """
+        if (self.burst is not None and not self.burst.isComplete()):
+            print("startBurst - burst already in progress")
+            return("ERROR - burst already in progress")
+        shape = (int(self.subFrameSizeY / self.binY),
+                 int(self.subFrameSizeX / self.binX))
+        self.burst = BurstBuffer(nFrames, shape)
+        if (not self.continuousMode):
+            self.burstStartedExposures = True
+            self.exposuresLeft = self.burst.nFrames
+            self.continuousMode = True
+            self.resetDutyCycle()
+            self.startExposure()
+        return("ok")
+
+    def receiveBurstFrame(self, fits, blobTime):
+        """ Decode the FITS data fits straight into the burst buffer,
+        and save the burst when it is complete.   If the frame does not
+        match the size of the burst, the burst is stopped and the frame
+        is processed as a normal frame.
+        """
+        burst = self.burst
+        img = None
+        shape = getImageShape(fits)
+        if (shape is None):
+            img = decodeFitsBlob(fits)
+            shape = img.shape
+        slot = burst.getWriteSlot(shape)
+        if (slot is None):
+            print("receiveBurstFrame - frame size changed - stopping burst")
+            burst.cancel()
+            self.endBurst(burst)
+            self.receiveImage(fits, blobTime)
+            return
+        if (img is None):
+            decodeFitsBlob(fits, slot)
+        else:
+            np.copyto(slot, img)
+        burst.commit(blobTime)
+        if (not burst.isComplete()):
+            if (not self.pipelinedMode and self.needExposure()):
+                self.startExposure()
+            return
+
+        print("Burst of %d frames complete - %.1f fps" %
+              (burst.nReceived, burst.getFrameRate()))
+        # Show the last frame of the burst as the current image.
+        seq = self.frameBuffer.push(slot, {
+            'seq': self.frameBuffer.nextSeq,
+            'time': blobTime,
+            'exposureTime': self.exposureTime,
+            'burst': True,
+            })
+        self.publishFrame(makeFrameSnapshot(
+            FRAME_LIVE, seq, self.frameBuffer.get(seq)[0], self.getRoi(),
+            self.statsStep, fits, blobTime, self.exposureTime))
+        self.endBurst(burst)
+        self.notifyFrame()
+
+    def stopBurst(self):
+        """ Stop the current burst, saving the frames received so far """
+        burst = self.burst
+        if (burst is None or burst.isComplete()):
+            print("stopBurst - no burst in progress")
+            return("ERROR - no burst in progress")
+        burst.cancel()
+        self.endBurst(burst)
+        return("ok")
+
+    def endBurst(self, burst):
+        """ Stop the exposures started for burst, and save its frames in a
+        separate thread, once it is complete or has been stopped.
+        """
+        if (self.burstStartedExposures):
+            self.continuousMode = False
+            self.burstStartedExposures = False
+            self.exposuresLeft = None
+        if (self.expStartTime is None and self.frame.img is not None):
+            self.status = self.STATUS_IDLE
+        if (burst.nReceived == 0):
+            return
+        saveThread = threading.Thread(target=self.saveBurst,
+                                      args=(burst,))
+        saveThread.start()
+
+    def saveBurst(self, burst):
+        """ Write all the frames of burst to a single .npz file in the data
+        directory (called in its own thread so that image capture is not
+        held up).
+        """
+        i=0
+        imgDt = datetime.fromtimestamp(burst.times[0])
+        tsStr = imgDt.strftime("%Y%m%d%H%M%S")
+        fname="%s-%s-burst-%03d.npz" % (self.saveFnameRoot,tsStr,i)
+        fpath = os.path.join(self.dataDir, fname)
+        while os.path.exists(fpath):
+            i=i+1
+            fname="%s-%s-burst-%03d.npz" % (self.saveFnameRoot,tsStr,i)
+            fpath = os.path.join(self.dataDir, fname)
+        print("saveBurst - Saving %d frames to %s" % (burst.nReceived, fpath))
+        startTime = time.time()
+        burst.save(fpath,
+                   exposureTime=self.exposureTime,
+                   subFrame=(self.subFrameOriginX, self.subFrameOriginY,
+                             self.subFrameSizeX, self.subFrameSizeY),
+                   binning=(self.binX, self.binY))
+        self.lastBurstFile = fname
+        print("saveBurst - saved in %.2f s" % (time.time() - startTime))
+
+    def startCalibrationCapture(self, calType, nFrames):
+        """ Start capturing nFrames raw frames of type calType (bias, dark
+        or flat) to build a master calibration frame for the current camera
+        settings.   Continuous exposures are started if they are not
+        already running, and stopped again when the master is complete.
+        """
+        if (calType not in CalibrationLibrary.TYPES):
+            print("ERROR - Unrecognised calibration type %s" % calType)
+            return("ERROR - Unrecognised calibration type %s" % calType)
+        self.calCaptureType = calType
+        self.calStacker.start(max(1, nFrames))
+        if (not self.continuousMode):
+            self.calStartedExposures = True
+            self.exposuresLeft = max(1, nFrames)
+            self.continuousMode = True
+            self.resetDutyCycle()
+            self.startExposure()
+        return("ok")
+
+    def addCalibrationFrame(self, img, ccdTemp):
+        """ Add raw image img, taken at CCD temperature ccdTemp, to the
+        master calibration frame being captured, and save the master when
+        enough frames have been stacked.
+        """
+        self.calStacker.add(img)
+        if (self.calStacker.active):
+            return
+        self.calLib.addMaster(self.calStacker.getMean(), self.calCaptureType,
+                              self.exposureTime, (self.binX, self.binY),
+                              (self.subFrameOriginX, self.subFrameOriginY,
+                               self.subFrameSizeX, self.subFrameSizeY),
+                              ccdTemp)
+        self.calCaptureType = None
+        if (self.calStartedExposures):
+            self.continuousMode = False
+            self.calStartedExposures = False
+            self.exposuresLeft = None
+
+    def resetDutyCycle(self):
+        """ Reset the camera duty cycle counters """
+        self.camBusyTime = 0.
+        self.camIdleTime = 0.
+        self.lastBlobTime = None
+
+    def getDutyCycle(self):
+        """ Returns the percentage of time the camera has been busy
+        (exposing or reading out) since continuous exposures were started.
+        """
+        totalTime = self.camBusyTime + self.camIdleTime
+        if (totalTime <= 0):
+            return(0.)
+        return(100. * self.camBusyTime / totalTime)
+
 
     def saveImage(self):
         """ Save the current image to disk using the base filename
         fnameRoot.  The image date/time is also appended to the filename
         with a further index number if necesssary to ensure it is unique.
         """
+        frame = self.frame
         i=0
-        imgDt = datetime.fromtimestamp(self.curImageTime)
+        imgDt = datetime.fromtimestamp(frame.time)
         tsStr = imgDt.strftime("%Y%m%d%H%M%S")
         fname="%s-%s-%03d.tif" % (self.saveFnameRoot,tsStr,i)
         fpath = os.path.join(self.dataDir, fname)
@@ -608,179 +1300,595 @@ class Ccd_capture(WebControlClass):
             fpath = os.path.join(self.dataDir, fname)
         print("saveImg - Saving to %s.  dataDir=%s" % (fpath,self.dataDir))
 
-        cv2.imwrite(fpath,self.curImg)
+        cv2.imwrite(fpath,frame.img)
         return("ok")
         
         
-    def resizeImgForWeb(self,img):
-        """ Returns a re-sized image for web viewing """
-        xMax = int(self.WEB_X_MAX)
-        yMax = int(img.shape[0] * xMax / img.shape[1])
-
-        if (yMax > self.WEB_Y_MAX):
-            yMax = int(self.WEB_Y_MAX)
-            xMax = int(img.shape[1] * yMax / img.shape[0])
+    def saveStack(self):
+        """ Save the current stacked image to disk as a 16 bit tiff, using
+        the same file naming as saveImage(), with "-stackNNN" added to show
+        the number of frames stacked.
+        """
+        stackFrame = self.stackFrame
+        if (stackFrame is None):
+            print("saveStack - no stacked image to save")
+            return("ERROR - no stacked image")
+        i=0
+        imgDt = datetime.fromtimestamp(stackFrame.time)
+        tsStr = imgDt.strftime("%Y%m%d%H%M%S")
+        fnameRoot = "%s-stack%03d" % (self.saveFnameRoot, stackFrame.seq)
+        fname="%s-%s-%03d.tif" % (fnameRoot,tsStr,i)
+        fpath = os.path.join(self.dataDir, fname)
+        while os.path.exists(fpath):
+            i=i+1
+            fname="%s-%s-%03d.tif" % (fnameRoot,tsStr,i)
+            fpath = os.path.join(self.dataDir, fname)
+        print("saveStack - Saving to %s.  dataDir=%s" % (fpath,self.dataDir))
+        cv2.imwrite(fpath,stackFrame.img)
+        return("ok")
+
+    def getPreviewSize(self, request = None):
+        """ Returns the (xMax, yMax) size that preview images for request
+        should fit in.   This is WEB_SIZE, unless the request has query
+        parameters w and/or h giving the width and height the client wants,
+        which are rounded down to a multiple of PREVIEW_SIZE_STEP and
+        limited to PREVIEW_SIZE_MAX.   If only one of them is given, the
+        other dimension is not limited.   Invalid values are ignored.
+        """
+        if (request is None):
+            return(WEB_SIZE)
+        size = []
+        for param in ('w', 'h'):
+            try:
+                val = int(request.query.get(param))
+            except (TypeError, ValueError):
+                val = None
+            if (val is not None):
+                val = val - val % self.PREVIEW_SIZE_STEP
+                val = min(max(val, self.PREVIEW_SIZE_STEP),
+                          self.PREVIEW_SIZE_MAX)
+            size.append(val)
+        if (size == [None, None]):
+            return(WEB_SIZE)
+        return(tuple(self.PREVIEW_SIZE_MAX if val is None else val
+                     for val in size))
+
+    def resizeImgForWeb(self, img, maxSize = WEB_SIZE):
+        """ Returns a re-sized image for web viewing, fitting in maxSize
+        (xMax, yMax).   Large images are first reduced by the largest whole
+        number factor that leaves them at least the web size, by averaging
+        blocks of pixels, which is much quicker than area interpolation to
+        an arbitrary size.
+        img may be a view (e.g. of the ROI) - it is not copied.
+        """
+        xMax, yMax = getWebSize(img.shape, maxSize)
+        factor = min(img.shape[1] // xMax, img.shape[0] // yMax)
+        if (factor > 1):
+            ySize = img.shape[0] // factor
+            xSize = img.shape[1] // factor
+            img = cv2.resize(img[:ySize * factor, :xSize * factor],
+                             dsize=(xSize, ySize),
+                             interpolation=cv2.INTER_AREA)
+        if (img.shape[1] > xMax):
+            interpolation = cv2.INTER_AREA
+        else:
+            interpolation = cv2.INTER_CUBIC
         res = cv2.resize(img, dsize=(xMax,yMax),
-                         interpolation=cv2.INTER_CUBIC)
+                         interpolation=interpolation)
         return(res)
 
-    def getWebImage(self):
-        """ return a copy of the current image, scaled to 800 px width
+    def getStretch(self, request = None):
+        """ Returns the display stretch to use for request - the value of
+        query parameter stretch if it is one of STRETCHES, otherwise
+        self.stretch.
         """
-        res = self.resizeImgForWeb(self.curImg)
-        success, encImg = cv2.imencode('.png',res)
-        imgBytes = encImg.tobytes()
-        return(imgBytes)
-
-    def getFullImage(self):
-        """ return a full resolution image of the current image in tiff format.
+        if (request is not None
+            and request.query.get('stretch') in STRETCHES):
+            return(request.query.get('stretch'))
+        return(self.stretch)
+
+    def getPerFrame(self, frame, name, func, check = True):
+        """ Returns func(), cached as name for FrameSnapshot frame, so that
+        it is only calculated once per frame.   If check is True func() is
+        called using renderFrame(), as it reads the image of the frame.
+        """
+        key = frame.getId() + (name,)
+        with self.lutLock:
+            value = self.lutCache.get(key)
+        if (value is not None):
+            return(value)
+        if (check):
+            value = self.renderFrame(frame, func)
+        else:
+            value = func()
+        with self.lutLock:
+            if (len(self.lutCache) >= 16):
+                self.lutCache.clear()
+            self.lutCache[key] = value
+        return(value)
+
+    def getPreviewImg(self, frame, maxSize = WEB_SIZE, stretch = None):
+        """ Returns the image of FrameSnapshot frame scaled to fit maxSize
+        and stretched to 8 bits for web viewing.   Previews are kept in
+        previewCache, so each size is only rendered once per frame (e.g.
+        for both /getImage and /getRoiImage).   The returned array is
+        shared, so must not be modified.
+        """
+        if (stretch is None):
+            stretch = self.stretch
+
+        def render():
+            res = self.to8BitForWeb(self.resizeImgForWeb(frame.img, maxSize),
+                                    frame, stretch)
+            res.flags.writeable = False
+            return(res)
+
+        return(self.previewCache.get(frame.getId() + (maxSize, stretch),
+                                     lambda: self.renderFrame(frame, render)))
+
+    def getHistogram16(self, frame, useRoi = False):
+        """ Returns the full 65536 bin histogram of the image of
+        FrameSnapshot frame, or of its ROI if useRoi is True (see
+        getPerFrame()).
+        """
+        if (useRoi):
+            return(self.getPerFrame(
+                frame, ('hist', frame.roi),
+                lambda: calcHistogram16(frame.getRoiImg(), step=1)))
+        return(self.getPerFrame(frame, 'hist',
+                                lambda: calcHistogram16(frame.img, step=1)))
+
+    def getStretchLut(self, frame, stretch = None, useRoi = False):
+        """ Returns the 16 to 8 bit display stretch lookup table for
+        FrameSnapshot frame using stretch (default self.stretch), built from
+        the histogram of the image, or of its ROI if useRoi is True (see
+        getPerFrame()).
         """
-        success, encImg = cv2.imencode('.tiff',self.curImg)
-        imgBytes = encImg.tobytes()
-        return(imgBytes)
+        if (stretch is None):
+            stretch = self.stretch
+        name = stretch
+        if (useRoi):
+            name = (stretch, frame.roi)
+        return(self.getPerFrame(
+            frame, name,
+            lambda: makeStretchLut(self.getHistogram16(frame, useRoi),
+                                   stretch)))
+
+    def getPyramid(self, frame):
+        """ Returns the TilePyramid of the image of FrameSnapshot frame (see
+        getPerFrame()).   Making the pyramid only uses the image size - the
+        pixels are read when tiles are rendered, and checked then.
+        """
+        return(self.getPerFrame(frame, 'pyramid',
+                                lambda: TilePyramid(frame.img, self.TILE_SIZE),
+                                check=False))
+
+    def getTileImage(self, frame, zoom, x, y, encoding = None, stretch = None):
+        """ Returns tile (x, y) at zoom level zoom of the pyramid of
+        FrameSnapshot frame, stretched using the lookup table for the whole
+        image so that all tiles match, and encoded for the web.
+        Raises ValueError if the tile does not exist.
+        """
+        tile = self.getPyramid(frame).getTile(zoom, x, y)
+        return(self.encodeWebImage(
+            applyLut(tile, self.getStretchLut(frame, stretch)), encoding))
+
+    def to8BitForWeb(self, res, frame, stretch = None, useRoi = False):
+        """ Returns res, a scaled copy of the image (or ROI if useRoi is
+        True) of FrameSnapshot frame, mapped to 8 bits for display using
+        its display stretch lookup table.
+        """
+        return(applyLut(res, self.getStretchLut(frame, stretch, useRoi)))
+
+    def getDisplayFrame(self, request = None, liveFrame = None):
+        """ Returns the FrameSnapshot that the image, histogram and profile
+        requests should use - the stacked frame if we are showing a stack
+        (or the request has query parameter src=stack), otherwise the live
+        frame.  src=live in the request query selects the live frame.
+        liveFrame is the live frame to use (default self.frame), so that
+        a request that has already taken a snapshot sees the same frame
+        throughout.
+        """
+        if (liveFrame is None):
+            liveFrame = self.frame
+        src = None
+        if (request is not None):
+            src = request.query.get('src')
+        if (src == 'stack' or (src is None and self.showStack)):
+            stackFrame = self.stackFrame
+            if (stackFrame is not None):
+                return(stackFrame)
+        return(liveFrame)
+
+    def getCachedRender(self, cmdStr, request, renderFunc, frame = None,
+                        keyExtra = None, conditional = True, retry = True,
+                        query = None):
+        """ Returns the response for image request cmdStr, calling
+        renderFunc(frame) to produce it only if it is not already in the
+        render cache.  The cache key includes the frame, its ROI, the
+        display stretch and the request parameters that affect rendering
+        (RENDER_PARAMS - taken from dictionary query if it is given,
+        otherwise from the request's query), so repeated requests for an
+        unchanged frame are not re-rendered.
+        frame is the FrameSnapshot to render - if it is None it is
+        obtained from getDisplayFrame(request).   keyExtra is added to the
+        cache key, for anything else that changes the response.
+        If conditional is True, the response is given an ETag made from
+        the cache key and a Last-Modified time of the frame, and if
+        the request's If-None-Match header matches the ETag an empty 304
+        (Not Modified) response is returned without rendering anything.
+        If the frame is over-written while it is being rendered (see
+        renderFrame()) the render is discarded, and re-tried with the
+        latest display frame, or FrameOverwrittenError is raised if retry
+        is False.
+        """
+        if (frame is None):
+            frame = self.getDisplayFrame(request)
+        if (query is None):
+            query = request.query
+        params = tuple((k, query.get(k)) for k in self.RENDER_PARAMS
+                       if k in query)
+        for attempt in range(self.RENDER_ATTEMPTS):
+            key = (cmdStr.lower(), frame.getId(), frame.roi,
+                   self.stretch, params, keyExtra)
+            if (conditional
+                and self.checkNotModified(key, request, frame.time)):
+                return(b"")
+            try:
+                return(self.renderCache.get(
+                    key, lambda: self.renderFrame(
+                        frame, lambda: renderFunc(frame))))
+            except FrameOverwrittenError:
+                if (not retry):
+                    raise
+                print("getCachedRender(%s) - frame %s over-written"
+                      % (cmdStr, frame.getFrameId()))
+                frame = self.getDisplayFrame(request)
+        raise bottle.HTTPError(503, "Frames are being over-written before "
+                               "they can be rendered")
+
+    def checkFrame(self, frame):
+        """ Raises FrameOverwrittenError if the image of FrameSnapshot
+        frame is a frame buffer slot that has been re-used for a newer
+        frame (stacked frame images are never re-used).
+        """
+        if (frame.kind == FRAME_LIVE and frame.img is not None):
+            self.frameBuffer.check(frame.seq)
+
+    def renderFrame(self, frame, renderFunc):
+        """ Returns renderFunc(), something made from the image of
+        FrameSnapshot frame, checking afterwards that the frame was not
+        over-written while renderFunc() was reading it (see checkFrame()),
+        so that a render of the wrong pixels is never cached or returned.
+        """
+        value = renderFunc()
+        self.checkFrame(frame)
+        return(value)
+
+    def checkNotModified(self, key, request, lastModified = 0):
+        """ Sets the ETag (made from key, which must identify the response)
+        and Last-Modified (from time lastModified, if it is set) headers of
+        the response to request.   Returns True, having set the response
+        status to 304 (Not Modified), if the request's If-None-Match header
+        matches the ETag.
+        """
+        etag = '"%s-%s"' % (self.etagSalt, hashlib.sha1(
+            repr(key).encode()).hexdigest()[:16])
+        bottle.response.set_header('ETag', etag)
+        bottle.response.set_header('Cache-Control', 'no-cache')
+        if (lastModified):
+            bottle.response.set_header(
+                'Last-Modified',
+                email.utils.formatdate(lastModified, usegmt=True))
+        ifNoneMatch = request.headers.get('If-None-Match', '')
+        if (etag in [t.strip() for t in ifNoneMatch.split(",")]):
+            bottle.response.status = 304
+            return(True)
+        return(False)
+
+    def getSnapshot(self, request):
+        """ Returns a JSON string containing everything the web interface
+        needs to display the current frame:
+          frameId - identifies the frame (e.g. live-123 or stack-10),
+          frameSeq - the sequence number of the latest frame,
+          status - the data returned by /getData,
+          images - the preview, ROI and cropped ROI images as data: URLs
+                   (encoded as selected by getEncoding(), and sized as
+                   selected by getPreviewSize()),
+          charts - the data for each of CHARTS, as returned by
+                   /getChartData.
+        The images and charts are all of the same frame - if it is
+        over-written while they are being rendered, they are rendered again
+        from the latest frame.  If the request has query parameter
+        since=<frameId> and the frame has not changed, images and charts
+        are omitted.
+        """
+        for attempt in range(self.RENDER_ATTEMPTS):
+            try:
+                return(self.makeSnapshot(request))
+            except FrameOverwrittenError:
+                print("getSnapshot - frame over-written")
+        raise bottle.HTTPError(503, "Frames are being over-written before "
+                               "they can be rendered")
+
+    def makeSnapshot(self, request):
+        """ Returns the /getSnapshot JSON string (see getSnapshot()) for
+        the current frame, raising FrameOverwrittenError if the frame is
+        over-written while it is being rendered.
+        """
+        liveFrame = self.frame
+        frame = self.getDisplayFrame(request, liveFrame)
+        frameId = frame.getFrameId()
+        snapshot = {
+            'frameId': frameId,
+            'frameSeq': liveFrame.seq,
+            'status': self.getStatus(liveFrame),
+        }
+        if (request.query.get('since') != frameId):
+            encoding = self.getEncoding(request)
+            stretch = self.getStretch(request)
+            maxSize = self.getPreviewSize(request)
+            images = {}
+            for name, cmdStr, renderFunc in (
+                    ('preview', 'getImage', self.getWebImage),
+                    ('roi', 'getRoiImage', self.getRoiWebImage),
+                    ('roiCropped', 'getRoiCroppedImage',
+                     self.getRoiCroppedWebImage)):
+                imgBytes = self.getCachedRender(
+                    cmdStr, request,
+                    lambda frame, renderFunc=renderFunc:
+                        renderFunc(frame, encoding, stretch, maxSize),
+                    frame, (encoding, maxSize), conditional=False,
+                    retry=False)
+                images[name] = "data:%s;base64,%s" % (
+                    getMimeType(encoding[0]),
+                    base64.b64encode(imgBytes).decode('ascii'))
+            # The charts are always JSON, so they must not share cache
+            # entries with /getChartData requests for other formats.
+            chartQuery = dict(request.query)
+            chartQuery.pop('fmt', None)
+            charts = {}
+            for chartName in self.CHARTS:
+                chartJson = self.getCachedRender(
+                    "getChartData/%s" % chartName, request,
+                    lambda frame, chartName=chartName:
+                        self.encodeChartData(chartName, frame),
+                    frame, conditional=False, retry=False,
+                    query=chartQuery)
+                charts[chartName] = json.loads(chartJson)
+            snapshot['images'] = images
+            snapshot['charts'] = charts
+        return(json.dumps(snapshot))
+
+    def getEncoding(self, request = None):
+        """ Returns the (format, quality) to encode preview images in for
+        request.   Query parameter fmt (jpeg, webp or png) selects the
+        format, otherwise it is negotiated from the request's Accept header
+        (and the response is marked Vary: Accept), preferring
+        LIVE_ENCODING, or ARCHIVE_ENCODING if the request has query
+        parameter mode=archive.   Query parameter q sets the JPEG or
+        WebP quality (1-100) or PNG compression level (0-9).
+        """
+        if (request is None):
+            return(self.LIVE_ENCODING)
+        default = self.LIVE_ENCODING
+        if (request.query.get('mode') == 'archive'):
+            default = self.ARCHIVE_ENCODING
+        fmt = request.query.get('fmt')
+        if (fmt not in FORMATS):
+            fmt = negotiateFormat(request.headers.get('Accept', ''),
+                                  default[0])
+            # Caches must not give this response to clients that accept
+            # different formats.
+            bottle.response.set_header('Vary', 'Accept')
+        quality = None
+        if (fmt == default[0]):
+            quality = default[1]
+        try:
+            quality = int(request.query.get('q', quality))
+        except (TypeError, ValueError):
+            pass
+        return((fmt, quality))
+
+    def encodeWebImage(self, img, encoding = None):
+        """ Returns 8 bit image img encoded as (format, quality) encoding
+        (default LIVE_ENCODING).
+        """
+        if (encoding is None):
+            encoding = self.LIVE_ENCODING
+        return(self.webEncoder.encode(img, encoding[0], encoding[1]))
+
+    def getWebImage(self, frame = None, encoding = None, stretch = None,
+                    maxSize = WEB_SIZE):
+        """ return a copy of the current image (or the image of
+        FrameSnapshot frame), scaled for web viewing to fit maxSize
+        """
+        if (frame is None):
+            frame = self.frame
+        res = self.getPreviewImg(frame, maxSize, stretch)
+        return(self.encodeWebImage(res, encoding))
+
+    def getRecentFrames(self, nFrames):
+        """ return the last nFrames (at least 1) frames from the frame
+        buffer as a numpy (.npy) array of shape (nFrames, ySize, xSize).
+        Raises ValueError if there are no frames in the buffer.
+        """
+        frames = self.frameBuffer.getLatest(max(1, nFrames))
+        if (len(frames) == 0):
+            raise ValueError("No frames in the frame buffer")
+        npyFile = io.BytesIO()
+        np.save(npyFile, np.stack([frame[1] for frame in frames]))
+        return(npyFile.getvalue())
+
+    def getFullImage(self, request):
+        """ Returns the full resolution image for /getFullImage in the
+        format given by the request's fmt query parameter (a key of
+        FULL_IMAGE_FORMATS, default tiff), setting the response headers so
+        that browsers save it as a file.
+        fits returns the FITS data of the current frame exactly as it was
+        received from the camera.   tiff (deflate compressed) and npy are
+        generators, so the file is streamed to the client a chunk at a time
+        rather than being built in memory, and are not cached.
+        Raises ValueError if the format is not recognised or there is no
+        FITS data for the current frame.
+        """
+        fmt = request.query.get('fmt', 'tiff').lower()
+        if (fmt not in self.FULL_IMAGE_FORMATS):
+            raise ValueError("Unrecognised full image format %s" % fmt)
+        if (fmt == 'fits'):
+            # Always the live frame - stacked images have no FITS data.
+            frame = self.frame
+            if (frame.fits is None):
+                raise ValueError("No FITS data for the current frame")
+        else:
+            frame = self.getDisplayFrame(request)
+        ext, mimeType = self.FULL_IMAGE_FORMATS[fmt]
+        bottle.response.content_type = mimeType
+        bottle.response.set_header(
+            'Content-Disposition',
+            'attachment; filename="frame-%s.%s"' % (frame.getFrameId(), ext))
+        if (self.checkNotModified(('getfullimage', frame.getId(), fmt),
+                                  request, frame.time)):
+            return(b"")
+        if (fmt == 'fits'):
+            bottle.response.set_header('Content-Length',
+                                       str(len(frame.fits)))
+            return(frame.fits)
+        if (fmt == 'npy'):
+            chunks = npyChunks(frame.img)
+        else:
+            chunks = tiffChunks(frame.img, level=self.FULL_IMAGE_DEFLATE_LEVEL)
+        return(self.checkFrameChunks(chunks, frame.getId()))
+
+    def checkFrameChunks(self, chunks, imgId):
+        """ A generator passing on the chunks of a file made from frame
+        imgId, checking after each chunk that the frame buffer slot it is
+        being read from has not been re-used for a newer frame.
+        Raises FrameOverwrittenError (ending the download early) if it has.
+        """
+        for chunk in chunks:
+            if (imgId[0] == FRAME_LIVE):
+                self.frameBuffer.check(imgId[1])
+            yield(chunk)
 
     
-    def getRoiWebImage(self):
-        """ return a copy of the current image, scaled to 800 px width
-        """
-        roiImg = cv2.cvtColor(self.curImg,cv2.COLOR_GRAY2RGB)
-        cv2.rectangle(roiImg,
-                      (self.roiOriginX, self.roiOriginY),
-                      (self.roiOriginX + self.roiSizeX,
-                       self.roiOriginY + self.roiSizeY),
-                      (65535,0,0),
-                      3)
-        res = self.resizeImgForWeb(roiImg)
-        success, encImg = cv2.imencode('.png',res)
-        imgBytes = encImg.tobytes()
-        return(imgBytes)
-
-    def getRoiCroppedWebImage(self):
-        """ return a copy of the current roi, scaled for web viewing
-        """
-        roiImg = self.curImg.copy()
-        roiImg = roiImg[self.roiOriginY : self.roiOriginY + self.roiSizeY, 
-                        self.roiOriginX :  self.roiOriginX + self.roiSizeX]
-        res = self.resizeImgForWeb(roiImg)
-        success, encImg = cv2.imencode('.png',res)
-        imgBytes = encImg.tobytes()
-        return(imgBytes)
+    def getRoiWebImage(self, frame = None, encoding = None, stretch = None,
+                       maxSize = WEB_SIZE):
+        """ return a copy of the current image (or the image of
+        FrameSnapshot frame), scaled for web viewing to fit maxSize, with
+        the frame's ROI outlined.   The image is scaled before it is
+        converted to colour, and the ROI is drawn in scaled coordinates.
+        """
+        if (frame is None):
+            frame = self.frame
+        res8 = self.getPreviewImg(frame, maxSize, stretch)
+        res = cv2.cvtColor(res8,cv2.COLOR_GRAY2BGR)
+        xScale = res.shape[1] / frame.img.shape[1]
+        yScale = res.shape[0] / frame.img.shape[0]
+        roiX, roiY, roiSizeX, roiSizeY = frame.roi
+        cv2.rectangle(res,
+                      (int(roiX * xScale),
+                       int(roiY * yScale)),
+                      (int((roiX + roiSizeX) * xScale),
+                       int((roiY + roiSizeY) * yScale)),
+                      (255,0,0),
+                      2)
+        return(self.encodeWebImage(res, encoding))
+
+    def getRoiCroppedWebImage(self, frame = None, encoding = None,
+                              stretch = None, maxSize = WEB_SIZE):
+        """ return a copy of the current roi (of FrameSnapshot frame if
+        given), scaled for web viewing to fit maxSize, and stretched for
+        the contrast of the roi.
+        """
+        if (frame is None):
+            frame = self.frame
+        res = self.to8BitForWeb(
+            self.resizeImgForWeb(frame.getRoiImg(), maxSize), frame,
+            stretch, useRoi=True)
+        return(self.encodeWebImage(res, encoding))
+
+    def getChartData(self, chartName, frame = None):
+        """ Returns (x0, dx, values) for chart chartName (one of CHARTS) of
+        the current image (or FrameSnapshot frame), where values is a numpy
+        array of the histogram counts or profile intensities, x0 is the x
+        value of values[0] and dx is the step in x between values.
+        Profiles are taken through the midpoint of the image (or ROI), and
+        their x values are pixel positions within the image (or ROI).
+        """
+        if (frame is None):
+            frame = self.frame
+        useRoi = chartName.lower().startswith("roi")
+        img = frame.img
+        if (useRoi):
+            img = frame.getRoiImg()
+        chart = chartName.lower()
+        if (chart.endswith("histogram")):
+            histData, bins = rebinHistogram(self.getHistogram16(frame, useRoi),
+                                            256)
+            return((float(bins[0]), float(bins[1] - bins[0]), histData))
+        elif (chart.endswith("xprofile")):
+            return((0., 1., img[int(img.shape[0]/2),:]))
+        elif (chart.endswith("yprofile")):
+            return((0., 1., img[:,int(img.shape[1]/2)]))
+        raise ValueError("Unrecognised chart %s" % chartName)
+
+    def encodeChartData(self, chartName, frame = None, fmt = None):
+        """ Returns the data for chart chartName of the current image (or
+        frame) encoded as JSON, or if fmt is 'bin' as binary data - little
+        endian float64 x0 and dx followed by the values as uint32.
+        """
+        x0, dx, values = self.getChartData(chartName, frame)
+        if (fmt == 'bin'):
+            return(np.array([x0, dx], dtype='<f8').tobytes()
+                   + values.astype('<u4').tobytes())
+        return(json.dumps({"chart": chartName,
+                           "x0": x0,
+                           "dx": dx,
+                           "values": values.tolist()}).encode())
+
+    def getChartImage(self, chartName, title, frame = None):
+        """ get an image of chart chartName of the current image (or frame).
+        """
+        x0, dx, values = self.getChartData(chartName, frame)
+        if (chartName.lower().endswith("histogram")):
+            return(self.chartRenderer.renderHistogram(values, x0, dx, title))
+        xData = x0 + dx * np.arange(len(values))
+        return(self.chartRenderer.renderLine(xData, values, title))
+
+    def getFrameHistogram(self, frame = None):
+        """ get an image of the histogram of the current image (or frame).
+        """
+        return(self.getChartImage("frameHistogram", "Intensity Histogram", frame))
 
-    
-    def getFrameHistogram(self):
-        """ get an image of the histogram of the current image.
-        """
-        histData, bins = np.histogram(self.curImg,256)
-        fig, ax = plt.subplots( nrows=1, ncols=1 )  # create figure & 1 axis
-        #print(histData)
-        ax.plot(histData)
-        ax.set_title("Intensity Histogram")
-        histImg = io.BytesIO()
-        fig.savefig(histImg, format='png')
-        histImg.seek(0)
-        fig.savefig('hist.png')   # save the figure to file
-        plt.close(fig)    # close the figure
-        return(histImg)
-
-    def getRoiHistogram(self):
-        """ get an image of the histogram of the current image ROI.
-        """
-        roiImg = self.curImg[self.roiOriginY :
-                             self.roiOriginY + self.roiSizeY,
-                             self.roiOriginX :
-                             self.roiOriginX + self.roiSizeX]
-        histData, bins = np.histogram(roiImg,256)
-        fig, ax = plt.subplots( nrows=1, ncols=1 )  # create figure & 1 axis
-        #print(histData)
-        ax.plot(histData)
-        ax.set_title("ROI Intensity Histogram")
-        histImg = io.BytesIO()
-        fig.savefig(histImg, format='png')
-        histImg.seek(0)
-        fig.savefig('hist.png')   # save the figure to file
-        plt.close(fig)    # close the figure
-        return(histImg)
+    def getRoiHistogram(self, frame = None):
+        """ get an image of the histogram of the current image (or frame) ROI.
+        """
+        return(self.getChartImage("roiHistogram", "ROI Intensity Histogram",
+                                  frame))
 
-    
-    def getXProfile(self):
+    def getXProfile(self, frame = None):
         """ get an image of the X profile chart
         """
-        midY = int(self.curImg.shape[0]/2)
-        intProfile = self.curImg[midY,:]
-        xData = np.linspace(0,self.curImg.shape[1]-1,self.curImg.shape[1])
-        fig, ax = plt.subplots( nrows=1, ncols=1 )  # create figure & 1 axis
-        #print(xData,intProfile)
-        ax.plot(xData,intProfile)
-        ax.set_title("X Intensity Profile")
-        histImg = io.BytesIO()
-        fig.savefig(histImg, format='png')
-        histImg.seek(0)
-        fig.savefig('xProfile.png')   # save the figure to file
-        plt.close(fig)    # close the figure
-        return(histImg)
-
-    def getRoiXProfile(self):
+        return(self.getChartImage("xProfile", "X Intensity Profile", frame))
+
+    def getRoiXProfile(self, frame = None):
         """ get an image of the ROI X profile chart
         """
-        roiImg = self.curImg[self.roiOriginY :
-                             self.roiOriginY + self.roiSizeY,
-                             self.roiOriginX :
-                             self.roiOriginX + self.roiSizeX]
-        midY = int(roiImg.shape[0]/2)
-        intProfile = roiImg[midY,:]
-        xData = np.linspace(0,roiImg.shape[1]-1,roiImg.shape[1])
-        fig, ax = plt.subplots( nrows=1, ncols=1 )  # create figure & 1 axis
-        #print(xData,intProfile)
-        ax.plot(xData,intProfile)
-        ax.set_title("ROI X Intensity Profile")
-        histImg = io.BytesIO()
-        fig.savefig(histImg, format='png')
-        histImg.seek(0)
-        fig.savefig('roiXProfile.png')   # save the figure to file
-        plt.close(fig)    # close the figure
-        return(histImg)
-    
-    def getYProfile(self):
+        return(self.getChartImage("roiXProfile", "ROI X Intensity Profile",
+                                  frame))
+
+    def getYProfile(self, frame = None):
         """ get an image of the Y profile chart
         """
-        midX = int(self.curImg.shape[1]/2)
-        intProfile = self.curImg[:,midX]
-        xData = np.linspace(0,self.curImg.shape[0]-1,self.curImg.shape[0])
-        fig, ax = plt.subplots( nrows=1, ncols=1 )  # create figure & 1 axis
-        #print(xData,intProfile)
-        ax.plot(xData,intProfile)
-        ax.set_title("Y Intensity Profile")
-        histImg = io.BytesIO()
-        fig.savefig(histImg, format='png')
-        histImg.seek(0)
-        fig.savefig('yProfile.png')   # save the figure to file
-        plt.close(fig)    # close the figure
-
-        return(histImg)
-    
-    def getRoiYProfile(self):
-        """ get an image of the Y profile chart
+        return(self.getChartImage("yProfile", "Y Intensity Profile", frame))
+
+    def getRoiYProfile(self, frame = None):
+        """ get an image of the ROI Y profile chart
         """
-        roiImg = self.curImg[self.roiOriginY :
-                             self.roiOriginY + self.roiSizeY,
-                             self.roiOriginX :
-                             self.roiOriginX + self.roiSizeX]
-        midX = int(roiImg.shape[1]/2)
-        intProfile = roiImg[:,midX]
-        xData = np.linspace(0,roiImg.shape[0]-1,roiImg.shape[0])
-        fig, ax = plt.subplots( nrows=1, ncols=1 )  # create figure & 1 axis
-        #print(xData,intProfile)
-        ax.plot(xData,intProfile)
-        ax.set_title("ROI Y Intensity Profile")
-        histImg = io.BytesIO()
-        fig.savefig(histImg, format='png')
-        histImg.seek(0)
-        fig.savefig('roiYProfile.png')   # save the figure to file
-        plt.close(fig)    # close the figure
-
-        return(histImg)
-    
-        
+        return(self.getChartImage("roiYProfile", "ROI Y Intensity Profile",
+                                  frame))
+
     def onWwwCmd(self,cmdStr,valStr, methodStr,request):
         ''' Process the command, with parameter 'valStr' using request
         method methodStr, and return the appropriate response.
@@ -788,25 +1896,44 @@ class Ccd_capture(WebControlClass):
         The following commands are recognised:
         HTTP GET Commands:
         /getData - returns a JSON string summarising the current state.
-        /getImage - returns a web-scaled version of the latest camera image.
+        /liveStream - a multipart/x-mixed-replace (MJPEG) stream of web-scaled images, updated whenever a new frame is received Add ?w=<width>&h=<height> to choose the image size.
+        /events - a text/event-stream (Server-Sent Events) stream, that sends a 'frame' event containing the frameId and image statistics whenever a new frame is received.
+        /getSnapshot - returns a JSON string containing the current state, and the preview and ROI images and chart data for one frame, tagged with its frameId.  Add ?since=<frameId> to omit the images and charts if the frame has not changed.
+        /getImage - returns a web-scaled version of the latest camera image.  Add ?fmt=<jpeg|webp|png> and ?q=<quality> to choose the encoding (otherwise it is negotiated from the Accept header), or ?mode=archive for lossless PNG, and ?w=<width>&h=<height> to choose the size (default 600x400) - this applies to all of the preview image requests.
         /getRoiImage - as for /getImage but the defined ROI is highlighted on the image.
         /getRoiCroppedImage - image is cropped to just include the ROI
-        /getFullImage - NOT IMPLEMENTED
+        /getFullImage[?fmt=tiff|npy|fits] - downloads the full resolution image, streamed as a deflate compressed TIFF (the default) or numpy .npy file, or the FITS data exactly as received from the camera.
+        /getTileInfo - returns a JSON string describing the tile pyramid of the current image - tileSize, maxZoom, imgSizeX, imgSizeY and frameId.
+        /getTile/<zoom>/<x>/<y> - returns tile (x, y) of zoom level zoom (0 = whole image in one tile, maxZoom = full resolution) of the current image, encoded as for /getImage.
+        The image, tile, chart and chart data responses have an ETag that changes when the frame, ROI or rendering options change - requests with a matching If-None-Match header get an empty 304 (Not Modified) response.
+        /getRecentFrames/<n> - returns the last n frames (up to the frame buffer size) as a numpy .npy array.
         /getFrameHistogram - returns an image of the pixel intensity histogram for the current image.
         /getRoiHistogram - returns an image of the pixel intensity histogram for the Region of Interest in the current image.
         /getXProfile - returns an image of a graph showing the intensity of pixels across the X direction at the midpoint of the image in Y.
         /getRoiXProfile - returns an image of a graph showing the intensity of pixels across the X direction of the region of interest at the midpoint of the image in Y.
         /getYProfile - returns an image of a graph showing the intensity of pixels across the Y direction at the midpoint of the image in X.
         /getYProfile - returns an image of a graph showing the intensity of pixels across the Y direction of the region of interest at the midpoint of the image in X.
+        /getChartData/<chart> - returns the data for chart (frameHistogram, roiHistogram, xProfile, yProfile, roiXProfile or roiYProfile) as JSON {"chart", "x0", "dx", "values"}, where x0 and dx give the x value of values[0] and the step between values, so the browser can draw the chart.  Add ?fmt=bin for binary data - little endian float64 x0 and dx followed by uint32 values.
 
         HTTP POST Commands:
         /startExposure - start a single camera exposure
-        /startContinuousExposures - start collecting repeated camera exposures.
+        /startContinuousExposures - start collecting repeated camera exposures (the next exposure is started as soon as the image data arrives unless --noPipeline is used).
         /stopContinuousExposures - stop collecting repeated exposures when the current one completes.
         /saveImage/<fname> - save the current image with the specified filename root.
         /startAutoSave/<fname> - start auto saving every image that is received with the specified filename root.
         /stopAutoSave - stop auto saving images.
+        /startStack/<n> - start co-adding the next n frames (0 = until stopStack) - the image, histogram and profile requests then show the stacked image.
+        /stopStack - stop stacking and show live images again (add ?src=stack to a GET request to see the last stack).
+        /setStackMode/<mode>[,<kappa>] - stack combine mode, mean or sigmaClip (rejecting pixels more than kappa SD from the running mean), used from the next /startStack.
+        /saveStack/<fname> - save the stacked image with the specified filename root.
+        /startBurst/<n> - capture n frames back to back into memory without analysing them, then save them to a single .npz file (named using the filename root of the last save request).
+        /stopBurst - stop the current burst early, saving the frames captured so far.
+        /captureMaster/<type>,<n> - capture n raw frames to make a master bias, dark or flat calibration frame for the current exposure time, binning, subframe and CCD temperature.
+        /startCalibration - subtract the matching master dark (or bias) and divide by the matching master flat for each image received.
+        /stopCalibration - stop calibrating images.
         /setExposureTime/<time_secs> - set the camera exposure time to the given time in seconds.
+        /setStatsStep/<n> - calculate the live image statistics from every n'th pixel (1 = all pixels).
+        /setStretch/<stretch> - set the preview image display stretch - linear, asinh, log or percentile (auto-contrast) - add ?stretch=<stretch> to an image request to override it.
         /setCooler/<setpoint> - set the cooler setpoint to the given value (in degC)
         /setSubFrame/<OriginX>,<OriginY>:<SizeX>,<SizeY> define the subframe in camera pixel coordinates.
         /setRoi/<OriginX>,<OriginY>:<SizeX>,<SizeY> define the ROI in camera pixel coordinates, relative to subFrame origin.
@@ -817,14 +1944,39 @@ class Ccd_capture(WebControlClass):
 
         if (methodStr=="GET"):
             if (cmdStr.lower()=="getData".lower()):
+                bottle.response.set_header('Cache-Control', 'no-cache')
                 return self.toJson()
+            elif (cmdStr.lower()=="events".lower()):
+                bottle.response.content_type = 'text/event-stream'
+                bottle.response.set_header('Cache-Control', 'no-cache')
+                return(self.frameEvents())
+            elif (cmdStr.lower()=="liveStream".lower()):
+                bottle.response.content_type = \
+                    'multipart/x-mixed-replace; boundary=frame'
+                bottle.response.set_header('Cache-Control', 'no-cache')
+                return(self.liveStream(self.getPreviewSize(request)))
+            elif (cmdStr.lower()=="getSnapshot".lower()):
+                bottle.response.content_type = 'application/json'
+                bottle.response.set_header('Cache-Control', 'no-cache')
+                if (self.status == self.STATUS_NO_IMAGE):
+                    return(json.dumps({'frameId': None,
+                                       'frameSeq': self.frame.seq,
+                                       'status': self.getStatus()}))
+                return(self.getSnapshot(request))
             elif (cmdStr.lower()=="getImage".lower()):
                 if (self.status == self.STATUS_NO_IMAGE):
                     print("getImage(): no image yet!")
                     return("<p>No Image</p>")
                 else:
-                    # response.set_header('Content-type', 'image/png')
-                    img = self.getWebImage()
+                    encoding = self.getEncoding(request)
+                    stretch = self.getStretch(request)
+                    maxSize = self.getPreviewSize(request)
+                    bottle.response.content_type = getMimeType(encoding[0])
+                    img = self.getCachedRender(
+                        cmdStr, request,
+                        lambda frame: self.getWebImage(frame, encoding, stretch,
+                                                     maxSize),
+                        keyExtra=(encoding, maxSize))
                     #print("getImage: img=",img)
                     return(img)
             elif (cmdStr.lower()=="getRoiImage".lower()):
@@ -832,8 +1984,15 @@ class Ccd_capture(WebControlClass):
                     print("getRoiImage(): no image yet!")
                     return("<p>No Image</p>")
                 else:
-                    # response.set_header('Content-type', 'image/png')
-                    img = self.getRoiWebImage()
+                    encoding = self.getEncoding(request)
+                    stretch = self.getStretch(request)
+                    maxSize = self.getPreviewSize(request)
+                    bottle.response.content_type = getMimeType(encoding[0])
+                    img = self.getCachedRender(
+                        cmdStr, request,
+                        lambda frame: self.getRoiWebImage(frame, encoding, stretch,
+                                                        maxSize),
+                        keyExtra=(encoding, maxSize))
                     #print("getRoi Image: img=",img)
                     return(img)
             elif (cmdStr.lower()=="getRoiCroppedImage".lower()):
@@ -841,8 +2000,15 @@ class Ccd_capture(WebControlClass):
                     print("getRoiCroppedImage(): no image yet!")
                     return("<p>No Image</p>")
                 else:
-                    # response.set_header('Content-type', 'image/png')
-                    img = self.getRoiCroppedWebImage()
+                    encoding = self.getEncoding(request)
+                    stretch = self.getStretch(request)
+                    maxSize = self.getPreviewSize(request)
+                    bottle.response.content_type = getMimeType(encoding[0])
+                    img = self.getCachedRender(
+                        cmdStr, request,
+                        lambda frame: self.getRoiCroppedWebImage(frame, encoding, stretch,
+                                                               maxSize),
+                        keyExtra=(encoding, maxSize))
                     #print("getRoi Image: img=",img)
                     return(img)
             elif (cmdStr.lower()=="getFullImage".lower()):
@@ -850,30 +2016,80 @@ class Ccd_capture(WebControlClass):
                     print("getFullImage(): no image yet!")
                     return("<p>No Image</p>")
                 else:
-                    # response.set_header('Content-type', 'image/png')
-                    img = self.getFullImage()
-                    #print("getImage: img=",img)
+                    try:
+                        return(self.getFullImage(request))
+                    except ValueError as e:
+                        print("ERROR - getFullImage() - %s" % e)
+                        bottle.response.status = 404
+                        return("<h1>ERROR - %s</h1>" % e)
+            elif (cmdStr.lower()=="getTileInfo".lower()):
+                if (self.status == self.STATUS_NO_IMAGE):
+                    print("getTileInfo(): no image yet!")
+                    return("<p>No Image</p>")
+                else:
+                    frame = self.getDisplayFrame(request)
+                    info = self.getPyramid(frame).getInfo()
+                    info['frameId'] = frame.getFrameId()
+                    bottle.response.content_type = 'application/json'
+                    bottle.response.set_header('Cache-Control', 'no-cache')
+                    return(json.dumps(info))
+            elif (cmdStr.lower()=="getTile".lower()):
+                if (self.status == self.STATUS_NO_IMAGE):
+                    print("getTile(): no image yet!")
+                    return("<p>No Image</p>")
+                else:
+                    try:
+                        zoom, x, y = [int(v) for v in valStr.split("/")]
+                        encoding = self.getEncoding(request)
+                        stretch = self.getStretch(request)
+                        # Check the tile exists before a 304 can be sent.
+                        frame = self.getDisplayFrame(request)
+                        self.getPyramid(frame).checkTile(zoom, x, y)
+                        img = self.getCachedRender(
+                            "%s/%d/%d/%d" % (cmdStr, zoom, x, y), request,
+                            lambda frame: self.getTileImage(frame, zoom, x, y,
+                                                          encoding, stretch),
+                            frame, keyExtra=encoding)
+                    except ValueError as e:
+                        print("ERROR - getTile(%s) - %s" % (valStr, e))
+                        bottle.response.status = 404
+                        return("<h1>ERROR - no tile %s</h1>" % valStr)
+                    bottle.response.content_type = getMimeType(encoding[0])
                     return(img)
+            elif (cmdStr.lower()=="getRecentFrames".lower()):
+                if (self.status == self.STATUS_NO_IMAGE):
+                    print("getRecentFrames(): no image yet!")
+                    return("<p>No Image</p>")
+                else:
+                    try:
+                        nFrames = 1
+                        if (valStr != 'None'):
+                            nFrames = int(valStr)
+                        return(self.getRecentFrames(nFrames))
+                    except ValueError as e:
+                        print("ERROR - getRecentFrames(%s) - %s" % (valStr, e))
+                        bottle.response.status = 404
+                        return("<h1>ERROR - %s</h1>" % e)
             elif (cmdStr.lower()=="getFrameHistogram".lower()):
                 if (self.status == self.STATUS_NO_IMAGE):
                     print("getFrameHistogram(): no image yet!")
                     return("<p>No Image</p>")
                 else:
-                    img = self.getFrameHistogram()
+                    img = self.getCachedRender(cmdStr, request, self.getFrameHistogram)
                     return(img)
             elif (cmdStr.lower()=="getXProfile".lower()):
                 if (self.status == self.STATUS_NO_IMAGE):
                     print("getXProfile(): no image yet!")
                     return("<p>No Image</p>")
                 else:
-                    img = self.getXProfile()
+                    img = self.getCachedRender(cmdStr, request, self.getXProfile)
                     return(img)
             elif (cmdStr.lower()=="getYProfile".lower()):
                 if (self.status == self.STATUS_NO_IMAGE):
                     print("getYProfile(): no image yet!")
                     return("<p>No Image</p>")
                 else:
-                    img = self.getYProfile()
+                    img = self.getCachedRender(cmdStr, request, self.getYProfile)
                     return(img)
 
             elif (cmdStr.lower()=="getRoiHistogram".lower()):
@@ -881,22 +2097,38 @@ class Ccd_capture(WebControlClass):
                     print("getRoiHistogram(): no image yet!")
                     return("<p>No Image</p>")
                 else:
-                    img = self.getRoiHistogram()
+                    img = self.getCachedRender(cmdStr, request, self.getRoiHistogram)
                     return(img)
             elif (cmdStr.lower()=="getRoiXProfile".lower()):
                 if (self.status == self.STATUS_NO_IMAGE):
                     print("getRoiXProfile(): no image yet!")
                     return("<p>No Image</p>")
                 else:
-                    img = self.getRoiXProfile()
+                    img = self.getCachedRender(cmdStr, request, self.getRoiXProfile)
                     return(img)
             elif (cmdStr.lower()=="getRoiYProfile".lower()):
                 if (self.status == self.STATUS_NO_IMAGE):
                     print("getRoiYProfile(): no image yet!")
                     return("<p>No Image</p>")
                 else:
-                    img = self.getRoiYProfile()
+                    img = self.getCachedRender(cmdStr, request, self.getRoiYProfile)
                     return(img)
+            elif (cmdStr.lower()=="getChartData".lower()):
+                if (self.status == self.STATUS_NO_IMAGE):
+                    print("getChartData(): no image yet!")
+                    return("<p>No Image</p>")
+                elif (valStr not in self.CHARTS):
+                    print("ERROR - Unrecognised chart %s" % valStr)
+                    return("<h1>ERROR - Unrecognised chart %s</h1>" % valStr)
+                else:
+                    fmt = request.query.get('fmt')
+                    if (fmt == 'bin'):
+                        bottle.response.content_type = 'application/octet-stream'
+                    else:
+                        bottle.response.content_type = 'application/json'
+                    return(self.getCachedRender(
+                        "%s/%s" % (cmdStr, valStr), request,
+                        lambda frame: self.encodeChartData(valStr, frame, fmt)))
 
 
             else:
@@ -907,7 +2139,9 @@ class Ccd_capture(WebControlClass):
                 self.startExposure()
                 return("ok")
             elif (cmdStr.lower()=="startContinuousExposures".lower()):
+                self.exposuresLeft = None
                 self.continuousMode = True
+                self.resetDutyCycle()
                 self.startExposure()
                 return("ok")
             elif (cmdStr.lower()=="stopContinuousExposures".lower()):
@@ -925,24 +2159,94 @@ class Ccd_capture(WebControlClass):
             elif (cmdStr.lower()=="stopAutoSave".lower()):
                 self.autoSave = False
                 return("ok")
+            elif (cmdStr.lower()=="startStack".lower()):
+                nFrames = 0
+                if (valStr != 'None'):
+                    nFrames = int(valStr)
+                with self.publishLock:
+                    self.stacker.start(nFrames)
+                    self.stackFrame = None
+                self.showStack = True
+                return("ok")
+            elif (cmdStr.lower()=="stopStack".lower()):
+                self.stacker.stop()
+                self.showStack = False
+                return("ok")
+            elif (cmdStr.lower()=="setStackMode".lower()):
+                # <mode> or <mode>,<kappa> e.g. sigmaClip,3
+                parts = valStr.split(",")
+                kappa = self.stacker.kappa
+                if (len(parts) > 1):
+                    kappa = float(parts[1])
+                try:
+                    self.stacker.setMode(parts[0], kappa)
+                except ValueError as e:
+                    print("ERROR - %s" % e)
+                    return("<h1>ERROR - %s</h1>" % e)
+                return("ok")
+            elif (cmdStr.lower()=="startBurst".lower()):
+                nFrames = 10
+                if (valStr != 'None'):
+                    nFrames = int(valStr)
+                return(self.startBurst(nFrames))
+            elif (cmdStr.lower()=="stopBurst".lower()):
+                return(self.stopBurst())
+            elif (cmdStr.lower()=="captureMaster".lower()):
+                # <type>,<nFrames> e.g. dark,20
+                parts = valStr.split(",")
+                nFrames = 10
+                if (len(parts) > 1):
+                    nFrames = int(parts[1])
+                return(self.startCalibrationCapture(parts[0], nFrames))
+            elif (cmdStr.lower()=="startCalibration".lower()):
+                self.calibrationOn = True
+                return("ok")
+            elif (cmdStr.lower()=="stopCalibration".lower()):
+                self.calibrationOn = False
+                return("ok")
+            elif (cmdStr.lower()=="saveStack".lower()):
+                self.saveFnameRoot = valStr
+                return(self.saveStack())
             elif (cmdStr.lower()=="setExposureTime".lower()):
                 self.exposureTime = float(valStr)
                 return("ok")
+            elif (cmdStr.lower()=="setStatsStep".lower()):
+                self.statsStep = max(1, int(valStr))
+                return("ok")
+            elif (cmdStr.lower()=="setStretch".lower()):
+                if (valStr not in STRETCHES):
+                    print("ERROR - Unrecognised stretch %s" % valStr)
+                    return("<h1>ERROR - Unrecognised stretch %s</h1>" % valStr)
+                self.stretch = valStr
+                self.renderCache.clear()
+                with self.liveJpegLock:
+                    self.liveJpegCount = None
+                return("ok")
             elif (cmdStr.lower()=="setCooler".lower()):
                 self.coolerSetpoint = float(valStr)
-                self.setCooler(True)
+                try:
+                    self.setCooler(True)
+                except RuntimeError as e:
+                    return("<h1>%s</h1>" % e)
                 return("ok")
             elif (cmdStr.lower()=="setSubFrame".lower()):
                 origin, size =  valStr.split(":")
                 print(origin,size)
-                self.subFrameOriginX = int(origin.split(",")[0])
-                self.subFrameOriginY = int(origin.split(",")[1])
-                self.subFrameSizeX   = int(size.split(",")[0])
-                self.subFrameSizeY   = int(size.split(",")[1])
-                self.setSubFrame()
+                try:
+                    with self.settingsLock:
+                        self.subFrameOriginX = int(origin.split(",")[0])
+                        self.subFrameOriginY = int(origin.split(",")[1])
+                        self.subFrameSizeX   = int(size.split(",")[0])
+                        self.subFrameSizeY   = int(size.split(",")[1])
+                        self.setSubFrame()
+                except RuntimeError as e:
+                    return("<h1>%s</h1>" % e)
                 return("ok")
             elif (cmdStr.lower()=="clearSubFrame".lower()):
-                self.clearSubFrame()
+                try:
+                    self.clearSubFrame()
+                except RuntimeError as e:
+                    return("<h1>%s</h1>" % e)
                 return("ok")
             elif (cmdStr.lower()=="setRoi".lower()):
                 origin, size =  valStr.split(":")
@@ -958,12 +2262,15 @@ class Ccd_capture(WebControlClass):
                 if (self.roiOriginY + self.roiSizeY > self.subFrameSizeY):
                     self.roiSizeY = self.subFrameSizeY - self.roiOriginY
                     print("Clipped ROI to fit in subFrame - Y")
+                self.publishRoi()
                 return("ok")
             elif (cmdStr.lower()=="clearRoi".lower()):
                 self.roiOriginX = int(self.subFrameOriginX)
                 self.roiOriginY = int(self.subFrameOriginY)
                 self.roiSizeX   = int(self.subFrameSizeX)
                 self.roiSizeY   = int(self.subFrameSizeY)
+                self.publishRoi()
+                return("ok")
             else:                
                 print("ERROR - Unreconised Command %s" % cmdStr)
                 return("<h1>ERROR - Unreconised Command %s</h1>" % cmdStr)
@@ -986,8 +2293,33 @@ if __name__ == "__main__":
                         help='Use the simulator rather than the real camera')
     parser.add_argument('--camId', default="Atik 383L",
                         help='Camera ID to use (default Atik 383L)')
+    parser.add_argument('--noPipeline', dest='pipelined', action='store_false',
+                        help='In continuous mode, wait until each image is '
+                        'processed before starting the next exposure')
+    parser.add_argument('--bufferFrames', type=int, default=8,
+                        help='Number of recent frames to keep in memory '
+                        '(at least 2, default 8)')
+    parser.add_argument('--renderCacheMB', type=int, default=32,
+                        help='Memory to use for caching rendered images '
+                        '(MB, default 32)')
+    parser.add_argument('--queueSize', type=int, default=4,
+                        help='Maximum number of received frames waiting '
+                        'to be processed (default 4)')
+    parser.add_argument('--queuePolicy', default=FrameQueue.POLICY_DROP_OLDEST,
+                        choices=FrameQueue.POLICIES,
+                        help='What to do with new frames when the frame '
+                        'queue is full (default dropOldest)')
+    parser.add_argument('--server', default='threaded',
+                        choices=WebControlClass.SERVERS,
+                        help='Web server backend (default threaded - see '
+                        'webBenchmark.py to compare them)')
+    parser.add_argument('--workers', type=int, default=16,
+                        help='Number of web server threads for the pool '
+                        'and waitress servers (default 16)')
 
     argsNamespace = parser.parse_args()
+    if (argsNamespace.bufferFrames < 2):
+        parser.error("--bufferFrames must be at least 2")
     args = vars(argsNamespace)
     print(args)
 
@@ -998,5 +2330,20 @@ if __name__ == "__main__":
     else:
         #cameraId = "Atik 383L"
         cameraId = args['camId']
-    ccdCapture = Ccd_capture(cameraId, dataDir)
+    ccdCapture = Ccd_capture(cameraId, dataDir,
+                             frameQueueSize = args['queueSize'],
+                             frameQueuePolicy = args['queuePolicy'],
+                             pipelinedMode = args['pipelined'],
+                             frameBufferSize = args['bufferFrames'],
+                             renderCacheMB = args['renderCacheMB'],
+                             server = args['server'],
+                             workers = args['workers'])
     print("Ccd_capture complete")
+
+    # The web server runs in a daemon thread, so wait here until we are
+    # interrupted (Ctrl-C), then shut it down so the streams are ended.
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        ccdCapture.stopServer()
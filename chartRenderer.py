@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+#
+# chartRenderer.py
+#
+# MIT License - CCD_CAPTURE
+#
+# Copyright (c) 2019 Graham Jones
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+'''chartRenderer - Draws simple line plots and histograms into a
+preallocated 8 bit greyscale image using numpy and opencv, and encodes them as PNG.
+It is much quicker than matplotlib for the live charts served by
+ccd_capture.py.
+'''
+import math
+import threading
+import numpy as np
+import cv2
+
+
+def niceTicks(lo, hi, maxTicks = 6):
+    """ Returns a list of 'nice' (1, 2 or 5 x 10^n) tick values between
+    lo and hi, with no more than about maxTicks ticks.
+    """
+    if (hi <= lo):
+        return([lo])
+    rawStep = (hi - lo) / max(1, maxTicks)
+    mag = 10 ** math.floor(math.log10(rawStep))
+    for mult in (1, 2, 5, 10):
+        step = mult * mag
+        if (step >= rawStep):
+            break
+    first = math.ceil(lo / step) * step
+    nTicks = int(math.floor((hi - first) / step + 1e-9)) + 1
+    return([first + i * step for i in range(nTicks)])
+
+
+class ChartRenderer():
+    BG_COLOUR = 255
+    AXIS_COLOUR = 0
+    LINE_COLOUR = 60
+    FONT = cv2.FONT_HERSHEY_SIMPLEX
+    FONT_SCALE = 0.4
+    MARGIN_LEFT = 60
+    MARGIN_RIGHT = 15
+    MARGIN_TOP = 30
+    MARGIN_BOTTOM = 30
+    TICK_LEN = 4
+
+    def __init__(self, width = 640, height = 480, pngCompression = 1):
+        """ Initialise a renderer that draws width x height pixel charts.
+        pngCompression is the PNG compression level (0-9) - low levels
+        are much quicker to encode.
+        """
+        self.width = int(width)
+        self.height = int(height)
+        self.pngCompression = int(pngCompression)
+        # A single channel canvas is three times quicker to encode than
+        # a colour one.
+        self.canvas = np.empty((self.height, self.width), dtype=np.uint8)
+        self.plotW = self.width - self.MARGIN_LEFT - self.MARGIN_RIGHT
+        self.plotH = self.height - self.MARGIN_TOP - self.MARGIN_BOTTOM
+        # Row numbers of the plot area, used to fill histogram bars.
+        self.plotRows = np.arange(self.plotH).reshape(self.plotH, 1)
+        self.lock = threading.Lock()
+
+    def drawAxes(self, xLo, xHi, yLo, yHi, title):
+        """ Clear the canvas and draw the title, the plot frame and the
+        ticks and labels for x from xLo to xHi and y from yLo to yHi.
+        """
+        self.canvas[:] = self.BG_COLOUR
+        left = self.MARGIN_LEFT
+        top = self.MARGIN_TOP
+        right = left + self.plotW
+        bottom = top + self.plotH
+        cv2.rectangle(self.canvas, (left, top), (right, bottom),
+                      self.AXIS_COLOUR, 1)
+
+        (textW, textH), baseline = cv2.getTextSize(title, self.FONT,
+                                                   1.5 * self.FONT_SCALE, 1)
+        cv2.putText(self.canvas, title,
+                    (int((self.width - textW) / 2), int(top * 0.7)),
+                    self.FONT, 1.5 * self.FONT_SCALE, self.AXIS_COLOUR, 1,
+                    cv2.LINE_AA)
+
+        for tick in niceTicks(xLo, xHi):
+            x = self.xToPixel(tick, xLo, xHi)
+            cv2.line(self.canvas, (x, bottom), (x, bottom + self.TICK_LEN),
+                     self.AXIS_COLOUR, 1)
+            label = "%g" % tick
+            (textW, textH), baseline = cv2.getTextSize(label, self.FONT,
+                                                       self.FONT_SCALE, 1)
+            cv2.putText(self.canvas, label,
+                        (x - int(textW / 2), bottom + self.TICK_LEN + textH + 4),
+                        self.FONT, self.FONT_SCALE, self.AXIS_COLOUR, 1,
+                        cv2.LINE_AA)
+
+        for tick in niceTicks(yLo, yHi):
+            y = self.yToPixel(tick, yLo, yHi)
+            cv2.line(self.canvas, (left - self.TICK_LEN, y), (left, y),
+                     self.AXIS_COLOUR, 1)
+            label = "%g" % tick
+            (textW, textH), baseline = cv2.getTextSize(label, self.FONT,
+                                                       self.FONT_SCALE, 1)
+            cv2.putText(self.canvas, label,
+                        (left - self.TICK_LEN - textW - 3, y + int(textH / 2)),
+                        self.FONT, self.FONT_SCALE, self.AXIS_COLOUR, 1,
+                        cv2.LINE_AA)
+
+    def xToPixel(self, x, xLo, xHi):
+        """ Returns the canvas column of x value x (scalar or array) """
+        return(np.rint(self.MARGIN_LEFT
+                       + (np.asarray(x, dtype=np.float64) - xLo)
+                       * self.plotW / (xHi - xLo)).astype(np.int32))
+
+    def yToPixel(self, y, yLo, yHi):
+        """ Returns the canvas row of y value y (scalar or array) """
+        return(np.rint(self.MARGIN_TOP + self.plotH
+                       - (np.asarray(y, dtype=np.float64) - yLo)
+                       * self.plotH / (yHi - yLo)).astype(np.int32))
+
+    def getRange(self, data):
+        """ Returns (lo, hi) covering data, widened if it has zero width """
+        lo = float(np.min(data))
+        hi = float(np.max(data))
+        if (hi <= lo):
+            hi = lo + 1.
+        return((lo, hi))
+
+    def encode(self):
+        """ Returns the canvas encoded as PNG bytes """
+        success, encImg = cv2.imencode('.png', self.canvas,
+                                       [cv2.IMWRITE_PNG_COMPRESSION,
+                                        self.pngCompression])
+        return(encImg.tobytes())
+
+    def renderLine(self, xData, yData, title = ""):
+        """ Returns a PNG image (bytes) of a line plot of yData against
+        xData.
+        """
+        xLo, xHi = self.getRange(xData)
+        yLo, yHi = self.getRange(yData)
+        points = np.empty((len(yData), 2), dtype=np.int32)
+        points[:, 0] = self.xToPixel(xData, xLo, xHi)
+        points[:, 1] = self.yToPixel(yData, yLo, yHi)
+        # Anti-aliasing is slow for long profiles, and makes no visible
+        # difference once there are more points than pixel columns.
+        lineType = cv2.LINE_AA
+        if (len(yData) > self.plotW):
+            lineType = cv2.LINE_8
+        with self.lock:
+            self.drawAxes(xLo, xHi, yLo, yHi, title)
+            cv2.polylines(self.canvas, [points], False, self.LINE_COLOUR, 1,
+                          lineType)
+            return(self.encode())
+
+    def renderHistogram(self, counts, x0 = 0., dx = 1., title = ""):
+        """ Returns a PNG image (bytes) of a bar chart of histogram counts,
+        where bin i starts at x value x0 + i * dx.
+        """
+        nBins = len(counts)
+        xLo = float(x0)
+        xHi = float(x0 + dx * nBins)
+        yLo = 0.
+        yHi = max(1., float(np.max(counts)))
+        # The height (in pixels) of the bar under each column of the plot.
+        binIdx = np.arange(self.plotW) * nBins // self.plotW
+        heights = np.rint(np.asarray(counts, dtype=np.float64)[binIdx]
+                          * self.plotH / yHi).astype(np.int32)
+        with self.lock:
+            self.drawAxes(xLo, xHi, yLo, yHi, title)
+            plotArea = self.canvas[self.MARGIN_TOP : self.MARGIN_TOP + self.plotH,
+                                   self.MARGIN_LEFT : self.MARGIN_LEFT + self.plotW]
+            plotArea[self.plotRows >= self.plotH - heights] = self.LINE_COLOUR
+            cv2.rectangle(self.canvas, (self.MARGIN_LEFT, self.MARGIN_TOP),
+                          (self.MARGIN_LEFT + self.plotW,
+                           self.MARGIN_TOP + self.plotH),
+                          self.AXIS_COLOUR, 1)
+            return(self.encode())
@@ -0,0 +1,71 @@
+#
+# chartRendererTest.py
+#
+# MIT License - CCD_CAPTURE
+#
+# Copyright (c) 2019 Graham Jones
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+''' Unit Tests for the chartRenderer module '''
+
+import unittest
+import numpy as np
+import cv2
+import chartRenderer
+
+
+class TestChartRenderer(unittest.TestCase):
+
+    def setUp(self):
+        self.cr = chartRenderer.ChartRenderer(320, 240)
+
+    def decode(self, pngBytes):
+        return(cv2.imdecode(np.frombuffer(pngBytes, np.uint8),
+                            cv2.IMREAD_GRAYSCALE))
+
+    def test_niceTicks(self):
+        self.assertEqual(chartRenderer.niceTicks(0, 100),
+                         [0, 20, 40, 60, 80, 100], 'wrong ticks')
+        self.assertEqual(chartRenderer.niceTicks(3, 7, 4), [3, 4, 5, 6, 7],
+                         'wrong ticks')
+        self.assertEqual(chartRenderer.niceTicks(5, 5), [5],
+                         'wrong ticks for empty range')
+
+    def test_renderLine(self):
+        xData = np.arange(1000)
+        img = self.decode(self.cr.renderLine(xData, xData % 100, "Test"))
+        self.assertEqual(img.shape, (240, 320), 'wrong image size')
+        plotArea = img[self.cr.MARGIN_TOP + 2 : -self.cr.MARGIN_BOTTOM - 2,
+                       self.cr.MARGIN_LEFT + 2 : -self.cr.MARGIN_RIGHT - 2]
+        self.assertTrue(np.any(plotArea != 255), 'no line drawn')
+
+    def test_renderHistogram(self):
+        counts = np.zeros(256, dtype=np.int64)
+        counts[128:] = 10
+        img = self.decode(self.cr.renderHistogram(counts, 0, 256, "Hist"))
+        self.assertEqual(img.shape, (240, 320), 'wrong image size')
+        row = img[self.cr.MARGIN_TOP + self.cr.plotH // 2,
+                  self.cr.MARGIN_LEFT + 2 : self.cr.MARGIN_LEFT + self.cr.plotW - 2]
+        half = len(row) // 2
+        self.assertTrue(np.all(row[:half - 2] == 255), 'empty bins filled')
+        self.assertTrue(np.all(row[half + 2:] != 255), 'full bins not filled')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+#
+# fitsBlob.py
+#
+# MIT License - CCD_CAPTURE
+#
+# Copyright (c) 2019 Graham Jones
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+'''fitsBlob - Fast decoding of the FITS image data sent by the INDI
+server into a 16 bit numpy image.
+
+INDI CCD drivers send a single primary HDU of big-endian signed 16 bit
+integers with BZERO=32768.  For that case we parse the header ourselves
+and build the image directly from the blob buffer, otherwise we fall back
+to astropy.io.fits.
+'''
+import io
+import numpy as np
+import astropy.io.fits
+
+FITS_BLOCK = 2880
+FITS_CARD = 80
+
+
+def parseFitsHeader(blob):
+    """ Parse the primary header of the FITS data in blob.
+    Returns a tuple (header, dataOffset) where header is a dictionary of
+    keyword:value strings and dataOffset is the position of the start of
+    the data in blob, or (None, None) if no END card is found.
+    """
+    header = {}
+    pos = 0
+    while (pos + FITS_CARD <= len(blob)):
+        card = bytes(blob[pos : pos + FITS_CARD]).decode('ascii', 'replace')
+        pos += FITS_CARD
+        keyword = card[:8].strip()
+        if (keyword == "END"):
+            nBlocks = (pos + FITS_BLOCK - 1) // FITS_BLOCK
+            return((header, nBlocks * FITS_BLOCK))
+        if (card[8:10] == "= "):
+            valStr = card[10:]
+            if (not valStr.strip().startswith("'")):
+                valStr = valStr.split("/")[0]
+            header[keyword] = valStr.strip()
+    return((None, None))
+
+
+def getImageShape(blob):
+    """ Returns the (ySize, xSize) shape of the 2 dimensional image in the
+    FITS data blob, or None if it is not a 2 dimensional image.
+    """
+    header, dataOffset = parseFitsHeader(blob)
+    if (header is None):
+        return(None)
+    try:
+        if (int(header.get("NAXIS", 0)) != 2):
+            return(None)
+        return((int(header["NAXIS2"]), int(header["NAXIS1"])))
+    except (KeyError, ValueError):
+        return(None)
+
+
+def fastDecode(blob, out = None):
+    """ Decode the FITS data in blob to a uint16 numpy array without
+    using astropy.  Returns None if the header is not the simple
+    16 bit primary HDU that we know how to handle.
+    If out is given it must be a contiguous uint16 array of the image shape,
+    and the image is decoded into it.  Otherwise, if blob is writable
+    (e.g. a bytearray) the image is decoded in place and shares memory with
+    blob, or if not a single new array is allocated.
+    """
+    header, dataOffset = parseFitsHeader(blob)
+    if (header is None):
+        return(None)
+    try:
+        if (header.get("SIMPLE") != "T"
+            or int(header.get("BITPIX", 0)) != 16
+            or int(header.get("NAXIS", 0)) != 2
+            or float(header.get("BSCALE", 1)) != 1.0
+            or float(header.get("BZERO", 0)) != 32768.0):
+            return(None)
+        xSize = int(header["NAXIS1"])
+        ySize = int(header["NAXIS2"])
+    except (KeyError, ValueError):
+        return(None)
+
+    nPix = xSize * ySize
+    if (len(blob) < dataOffset + 2 * nPix):
+        return(None)
+
+    # Adding BZERO=32768 to a signed 16 bit value is the same as flipping
+    # its top bit when the result is interpreted as unsigned.
+    if (out is not None):
+        if (out.shape != (ySize, xSize) or out.dtype != np.uint16):
+            return(None)
+        raw = np.frombuffer(blob, dtype='>u2', count=nPix, offset=dataOffset)
+        np.bitwise_xor(raw, np.uint16(0x8000), out=out.reshape(nPix))
+        return(out)
+    elif (isinstance(blob, bytearray)
+        or (isinstance(blob, memoryview) and not blob.readonly)):
+        img = np.frombuffer(blob, dtype=np.uint16, count=nPix,
+                            offset=dataOffset)
+        if (np.little_endian):
+            img.byteswap(inplace=True)
+        img ^= 0x8000
+    else:
+        raw = np.frombuffer(blob, dtype='>u2', count=nPix, offset=dataOffset)
+        img = np.empty(nPix, dtype=np.uint16)
+        np.bitwise_xor(raw, np.uint16(0x8000), out=img)
+    return(img.reshape((ySize, xSize)))
+
+
+def decodeFitsBlob(blob, out = None):
+    """ Returns the image in the FITS data blob as a uint16 numpy array,
+    using fastDecode() if possible, and astropy if not.
+    If out is given the image is written into it (see fastDecode()).
+    """
+    img = fastDecode(blob, out)
+    if (img is None):
+        print("decodeFitsBlob - using astropy for unusual FITS header")
+        hdulist = astropy.io.fits.open(io.BytesIO(blob))
+        if (out is not None):
+            np.copyto(out, hdulist[0].data, casting='unsafe')
+            img = out
+        else:
+            img = np.asarray(hdulist[0].data, dtype=np.uint16)
+        hdulist.close()
+    return(img)
@@ -0,0 +1,82 @@
+#
+# fitsBlobTest.py
+#
+# MIT License - CCD_CAPTURE
+#
+# Copyright (c) 2019 Graham Jones
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+''' Unit Tests for the fitsBlob module '''
+
+import unittest
+import io
+import numpy as np
+import astropy.io.fits
+import fitsBlob
+
+
+def makeFits(img):
+    """ Returns FITS data for img, as written by astropy """
+    hdu = astropy.io.fits.PrimaryHDU(img)
+    buf = io.BytesIO()
+    hdu.writeto(buf)
+    return(buf.getvalue())
+
+
+class TestFitsBlob(unittest.TestCase):
+
+    def setUp(self):
+        self.testImg = np.array([[0,1,2],[3,4,5],[32767,32768,65535],
+                                 [100,1000,10000]], dtype=np.uint16)
+
+    def test_fastDecode(self):
+        blob = makeFits(self.testImg)
+        img = fitsBlob.fastDecode(blob)
+        self.assertIsNotNone(img,'fastDecode did not handle uint16 data')
+        self.assertEqual(img.dtype,np.uint16,'wrong dtype')
+        self.assertTrue(np.array_equal(img,self.testImg),'image wrong')
+
+    def test_fastDecodeInPlace(self):
+        blob = bytearray(makeFits(self.testImg))
+        img = fitsBlob.fastDecode(blob)
+        self.assertTrue(np.array_equal(img,self.testImg),'image wrong')
+        self.assertTrue(np.shares_memory(img,np.frombuffer(blob,np.uint8)),
+                        'image not decoded in place')
+
+    def test_decodeIntoOut(self):
+        blob = makeFits(self.testImg)
+        self.assertEqual(fitsBlob.getImageShape(blob),self.testImg.shape,
+                         'wrong shape')
+        out = np.zeros(self.testImg.shape,dtype=np.uint16)
+        img = fitsBlob.decodeFitsBlob(blob,out)
+        self.assertIs(img,out,'image not decoded into out')
+        self.assertTrue(np.array_equal(out,self.testImg),'image wrong')
+
+    def test_fallback(self):
+        # Float data is not handled by fastDecode so astropy is used.
+        floatImg = self.testImg.astype(np.float32)
+        blob = makeFits(floatImg)
+        self.assertIsNone(fitsBlob.fastDecode(blob),'should not fast decode')
+        img = fitsBlob.decodeFitsBlob(blob)
+        self.assertEqual(img.dtype,np.uint16,'wrong dtype')
+        self.assertTrue(np.array_equal(img,self.testImg),'image wrong')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,346 @@
+#!/usr/bin/env python
+#
+# frameBuffer.py
+#
+# MIT License - CCD_CAPTURE
+#
+# Copyright (c) 2019 Graham Jones
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+'''frameBuffer - A fixed capacity ring buffer of the most recent camera
+frames, stored in a single preallocated uint16 array, and a stacker that
+co-adds frames as they arrive.
+'''
+import threading
+import numpy as np
+
+
+class FrameOverwrittenError(RuntimeError):
+    """ Raised when a frame is no longer in a FrameRingBuffer because its
+    slot has been re-used for a newer frame.
+    """
+    pass
+
+
+class FrameRingBuffer():
+    def __init__(self, capacity = 8):
+        """ Initialise the buffer to hold the last capacity frames.
+        The storage is allocated when the first frame is written, and
+        re-allocated whenever the frame size changes.
+        capacity must be at least 2, so that the next frame is never
+        decoded into the slot of the frame being shown.
+        """
+        if (capacity < 2):
+            raise ValueError("FrameRingBuffer capacity must be at least 2")
+        self.capacity = int(capacity)
+        self.frames = None
+        self.seqs = [0] * self.capacity
+        self.meta = [None] * self.capacity
+        self.lastSeq = 0   # Sequence number of the most recent frame
+        self.nextSeq = 1
+        self.lock = threading.Lock()
+
+    def getShape(self):
+        """ Returns the (ySize, xSize) shape of the buffered frames, or None
+        if nothing has been allocated yet.
+        """
+        if (self.frames is None):
+            return(None)
+        return(self.frames.shape[1:])
+
+    def reallocate(self, shape):
+        """ Discard all buffered frames and allocate storage for frames of
+        shape (ySize, xSize).
+        """
+        print("FrameRingBuffer.reallocate(%s x %d)" % (shape, self.capacity))
+        with self.lock:
+            self.frames = None
+            self.frames = np.empty((self.capacity,) + tuple(shape),
+                                   dtype=np.uint16)
+            self.seqs = [0] * self.capacity
+            self.meta = [None] * self.capacity
+
+    def getWriteSlot(self, shape):
+        """ Returns (seq, slot) where slot is the array that the next frame,
+        which will have sequence number seq, should be written into.
+        The frame is not visible to readers until commit(seq) is called.
+        """
+        if (self.getShape() != tuple(shape)):
+            self.reallocate(shape)
+        with self.lock:
+            seq = self.nextSeq
+            self.nextSeq += 1
+            idx = seq % self.capacity
+            # Invalidate the slot while it is being over-written.
+            self.seqs[idx] = 0
+            self.meta[idx] = None
+            return((seq, self.frames[idx]))
+
+    def commit(self, seq, meta = None):
+        """ Make frame seq, previously obtained from getWriteSlot(),
+        available to readers, with metadata dictionary meta.
+        """
+        with self.lock:
+            idx = seq % self.capacity
+            self.seqs[idx] = seq
+            self.meta[idx] = meta
+            self.lastSeq = seq
+
+    def push(self, img, meta = None):
+        """ Copy img into the buffer as the next frame.
+        Returns the sequence number of the frame.
+        """
+        seq, slot = self.getWriteSlot(img.shape)
+        np.copyto(slot, img, casting='unsafe')
+        self.commit(seq, meta)
+        return(seq)
+
+    def get(self, seq):
+        """ Returns (img, meta) for frame number seq, or None if it is no
+        longer in the buffer.
+        Note that img is a view of the buffer storage, which will be
+        over-written capacity frames later.
+        """
+        with self.lock:
+            idx = seq % self.capacity
+            if (seq <= 0 or self.seqs[idx] != seq):
+                return(None)
+            return((self.frames[idx], self.meta[idx]))
+
+    def check(self, seq):
+        """ Raises FrameOverwrittenError if frame number seq is no longer in
+        the buffer - use it after reading a view of a frame to check that
+        the frame was not over-written while it was being read.
+        """
+        if (self.get(seq) is None):
+            raise FrameOverwrittenError("Frame %d has been over-written"
+                                        % seq)
+
+    def getLatest(self, n = 1):
+        """ Returns a list of (seq, img, meta) for up to the last n frames,
+        oldest first.
+        """
+        frames = []
+        with self.lock:
+            lastSeq = self.lastSeq
+        for seq in range(max(1, lastSeq - min(n, self.capacity) + 1),
+                         lastSeq + 1):
+            frame = self.get(seq)
+            if (frame is not None):
+                frames.append((seq, frame[0], frame[1]))
+        return(frames)
+
+
+class FrameStacker():
+    MODE_MEAN = "mean"
+    MODE_SIGMA_CLIP = "sigmaClip"
+    MODES = (MODE_MEAN, MODE_SIGMA_CLIP)
+
+    def __init__(self, mode = MODE_MEAN, kappa = 3.0, minClipFrames = 5):
+        """ Initialise a stacker that co-adds frames as they arrive.
+        mode is MODE_MEAN for a simple running mean, or MODE_SIGMA_CLIP to
+        reject pixel values more than kappa standard deviations from the
+        running mean of that pixel once minClipFrames frames have been
+        stacked.
+        """
+        self.setMode(mode, kappa)
+        # The mode and kappa of the current stack, fixed by start().
+        self.stackMode = self.mode
+        self.stackKappa = self.kappa
+        self.minClipFrames = minClipFrames
+        self.active = False
+        self.nTarget = 0
+        self.nStacked = 0
+        self.nRejected = 0
+        self.acc = None
+        self.imgCache = None
+        self.imgCacheN = -1
+
+    def setMode(self, mode, kappa = 3.0):
+        """ Set the combine mode (used by the next start() - the current
+        stack carries on with the mode it was started with).
+        """
+        if (mode not in self.MODES):
+            raise ValueError("Unrecognised FrameStacker mode %s" % mode)
+        self.mode = mode
+        self.kappa = float(kappa)
+
+    def start(self, nFrames = 0):
+        """ Start a new stack of nFrames frames (0 = until stop() is called)
+        """
+        self.nTarget = int(nFrames)
+        self.stackMode = self.mode
+        self.stackKappa = self.kappa
+        self.nStacked = 0
+        self.nRejected = 0
+        self.acc = None
+        self.imgCacheN = -1
+        self.active = True
+
+    def stop(self):
+        """ Stop adding frames to the stack, keeping the result """
+        self.active = False
+
+    def allocate(self, shape):
+        """ Allocate the accumulator arrays for frames of shape shape """
+        self.acc = np.zeros(shape, dtype=np.float32)
+        self.tmp = np.empty(shape, dtype=np.float32)
+        if (self.stackMode == self.MODE_SIGMA_CLIP):
+            # Per-pixel running mean (in self.acc), sum of squared
+            # deviations and count of accepted values (Welford's method).
+            self.m2 = np.zeros(shape, dtype=np.float32)
+            self.count = np.zeros(shape, dtype=np.float32)
+            self.delta = np.empty(shape, dtype=np.float32)
+            self.keep = np.empty(shape, dtype=bool)
+
+    def add(self, img):
+        """ Add img to the stack, in place.  Returns True if the frame was
+        stacked, or False if stacking is not active or img does not
+        match the size of the frames already stacked.
+        """
+        if (not self.active):
+            return(False)
+        if (self.acc is None):
+            self.allocate(img.shape)
+        elif (self.acc.shape != img.shape):
+            print("FrameStacker.add - frame size changed - ignoring frame")
+            return(False)
+
+        if (self.stackMode == self.MODE_MEAN):
+            np.add(self.acc, img, out=self.acc)
+        else:
+            np.subtract(img, self.acc, out=self.delta)
+            if (self.nStacked >= self.minClipFrames):
+                # tmp = kappa * standard deviation of each pixel, with a
+                # floor of 1 count so that identical frames are accepted.
+                np.divide(self.m2, np.maximum(self.count, 1), out=self.tmp)
+                np.sqrt(self.tmp, out=self.tmp)
+                np.maximum(self.tmp, 1.0, out=self.tmp)
+                self.tmp *= self.stackKappa
+                np.less_equal(np.abs(self.delta), self.tmp, out=self.keep)
+                self.nRejected += self.keep.size - int(np.count_nonzero(self.keep))
+            else:
+                self.keep[:] = True
+            np.add(self.count, 1, out=self.count, where=self.keep)
+            np.divide(self.delta, self.count, out=self.tmp, where=self.keep)
+            np.add(self.acc, self.tmp, out=self.acc, where=self.keep)
+            # m2 += delta * (img - new mean)
+            np.subtract(img, self.acc, out=self.tmp)
+            self.tmp *= self.delta
+            np.add(self.m2, self.tmp, out=self.m2, where=self.keep)
+
+        self.nStacked += 1
+        if (self.nTarget > 0 and self.nStacked >= self.nTarget):
+            print("FrameStacker - stack of %d frames complete" % self.nStacked)
+            self.active = False
+        return(True)
+
+    def getMean(self):
+        """ Returns the stacked (mean) image as a float32 array, or None if
+        no frames have been stacked.
+        """
+        if (self.nStacked == 0):
+            return(None)
+        if (self.stackMode == self.MODE_MEAN):
+            return(self.acc / self.nStacked)
+        return(self.acc.copy())
+
+    def getImage(self):
+        """ Returns the stacked image rounded to uint16, or None if no
+        frames have been stacked.   The result is cached until the next
+        frame is stacked.
+        """
+        if (self.nStacked == 0):
+            return(None)
+        if (self.imgCacheN != self.nStacked):
+            mean = self.getMean()
+            np.clip(mean, 0, 65535, out=mean)
+            self.imgCache = np.rint(mean).astype(np.uint16)
+            self.imgCacheN = self.nStacked
+        return(self.imgCache)
+
+
+class BurstBuffer():
+    def __init__(self, nFrames, shape = None):
+        """ Initialise a buffer to hold a burst of nFrames frames of shape
+        (ySize, xSize), preallocated as a single uint16 array.  If shape
+        is None, or the first frame has a different shape, the storage is
+        allocated when the first frame arrives.
+        """
+        self.nFrames = max(1, int(nFrames))
+        self.frames = None
+        if (shape is not None):
+            self.allocate(shape)
+        self.times = np.zeros(self.nFrames, dtype=np.float64)
+        self.nReceived = 0
+        self.cancelled = False
+
+    def allocate(self, shape):
+        """ Allocate storage for nFrames frames of shape (ySize, xSize) """
+        self.frames = np.empty((self.nFrames,) + tuple(shape), dtype=np.uint16)
+
+    def isComplete(self):
+        return(self.cancelled or self.nReceived >= self.nFrames)
+
+    def cancel(self):
+        """ End the burst early, keeping the frames already received """
+        self.cancelled = True
+
+    def getWriteSlot(self, shape):
+        """ Returns the array that the next frame, of shape shape, should be
+        written to, or None if the burst is complete or the frame is the
+        wrong size.
+        """
+        if (self.isComplete()):
+            return(None)
+        if (self.frames is None
+            or (self.nReceived == 0 and self.frames.shape[1:] != tuple(shape))):
+            self.allocate(shape)
+        if (self.frames.shape[1:] != tuple(shape)):
+            print("BurstBuffer - frame size changed - ignoring frame")
+            return(None)
+        return(self.frames[self.nReceived])
+
+    def commit(self, frameTime):
+        """ Record that the frame in the current write slot was received at
+        frameTime.
+        """
+        self.times[self.nReceived] = frameTime
+        self.nReceived += 1
+
+    def getFrameRate(self):
+        """ Returns the mean frame rate (frames per second) of the burst """
+        if (self.nReceived < 2):
+            return(0.)
+        dt = self.times[self.nReceived - 1] - self.times[0]
+        if (dt <= 0):
+            return(0.)
+        return((self.nReceived - 1) / dt)
+
+    def save(self, fpath, **meta):
+        """ Write the frames received and their times, and any extra
+        values given as keyword arguments, to a single uncompressed numpy
+        .npz file fpath.
+        """
+        np.savez(fpath,
+                 frames=self.frames[:self.nReceived],
+                 times=self.times[:self.nReceived],
+                 **meta)
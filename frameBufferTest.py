@@ -0,0 +1,161 @@
+#
+# frameBufferTest.py
+#
+# MIT License - CCD_CAPTURE
+#
+# Copyright (c) 2019 Graham Jones
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+''' Unit Tests for the frameBuffer module '''
+
+import unittest
+import numpy as np
+import frameBuffer
+
+
+class TestFrameRingBuffer(unittest.TestCase):
+
+    def setUp(self):
+        self.fb = frameBuffer.FrameRingBuffer(3)
+
+    def test_push(self):
+        for i in range(5):
+            seq = self.fb.push(np.full((4,3),i,dtype=np.uint16),{'i':i})
+            self.assertEqual(seq,i+1,'wrong sequence number')
+        self.assertIsNone(self.fb.get(2),'frame 2 should be overwritten')
+        img, meta = self.fb.get(5)
+        self.assertEqual(meta['i'],4,'wrong metadata')
+        self.assertTrue(np.all(img==4),'wrong image')
+
+        latest = self.fb.getLatest(10)
+        self.assertEqual([f[0] for f in latest],[3,4,5],'wrong frames')
+        self.assertEqual([f[2]['i'] for f in latest],[2,3,4],'wrong order')
+        self.assertRaises(ValueError,frameBuffer.FrameRingBuffer,1)
+
+    def test_writeSlot(self):
+        seq, slot = self.fb.getWriteSlot((4,3))
+        slot[:] = 7
+        self.assertIsNone(self.fb.get(seq),'uncommitted frame visible')
+        self.fb.commit(seq)
+        self.assertTrue(np.all(self.fb.get(seq)[0]==7),'wrong image')
+
+    def test_check(self):
+        seq = self.fb.push(np.zeros((4,3),dtype=np.uint16))
+        self.fb.check(seq)
+        self.fb.getWriteSlot((4,3))
+        self.fb.check(seq)
+        self.fb.getWriteSlot((4,3))
+        self.fb.getWriteSlot((4,3))
+        self.assertRaises(frameBuffer.FrameOverwrittenError,
+                          self.fb.check,seq)
+        self.assertRaises(frameBuffer.FrameOverwrittenError,
+                          self.fb.check,0)
+
+    def test_reallocate(self):
+        self.fb.push(np.zeros((4,3),dtype=np.uint16))
+        frames = self.fb.frames
+        self.fb.push(np.zeros((4,3),dtype=np.uint16))
+        self.assertIs(self.fb.frames,frames,'storage re-allocated')
+        seq = self.fb.push(np.ones((2,2),dtype=np.uint16))
+        self.assertEqual(self.fb.getShape(),(2,2),'wrong shape')
+        self.assertEqual(len(self.fb.getLatest(3)),1,'old frames not cleared')
+        self.assertEqual(seq,3,'sequence number not monotonic')
+
+class TestFrameStacker(unittest.TestCase):
+
+    def test_mean(self):
+        fs = frameBuffer.FrameStacker()
+        self.assertFalse(fs.add(np.zeros((2,2),dtype=np.uint16)),
+                         'stacked while inactive')
+        fs.start(3)
+        for v in (10,20,33,1000):
+            fs.add(np.full((2,2),v,dtype=np.uint16))
+        self.assertEqual(fs.nStacked,3,'stack did not stop at target')
+        self.assertFalse(fs.active,'stack still active')
+        self.assertTrue(np.allclose(fs.getMean(),21.),'wrong mean')
+        self.assertEqual(fs.getImage().dtype,np.uint16,'wrong dtype')
+        self.assertTrue(np.all(fs.getImage()==21),'wrong image')
+
+    def test_sigmaClip(self):
+        fs = frameBuffer.FrameStacker(frameBuffer.FrameStacker.MODE_SIGMA_CLIP,
+                                      kappa=3.0)
+        fs.start()
+        rng = np.random.default_rng(1)
+        frames = rng.normal(1000,10,(20,8,8)).astype(np.uint16)
+        frames[10,3,4] = 60000   # "cosmic ray"
+        for frame in frames:
+            fs.add(frame)
+        mean = fs.getMean()
+        self.assertEqual(fs.nRejected >= 1,True,'outlier not rejected')
+        # Without clipping the outlier would add ~3000 to the mean.
+        self.assertLess(abs(float(mean[3,4])
+                            - float(np.delete(frames[:,3,4],10).mean())),
+                        10.,'outlier not clipped')
+        self.assertTrue(np.allclose(mean[0,0],frames[:,0,0].mean(),atol=1),
+                        'wrong mean')
+
+    def test_setModeMidStack(self):
+        # A mode change only applies to the next stack.
+        for first, second in ((frameBuffer.FrameStacker.MODE_MEAN,
+                               frameBuffer.FrameStacker.MODE_SIGMA_CLIP),
+                              (frameBuffer.FrameStacker.MODE_SIGMA_CLIP,
+                               frameBuffer.FrameStacker.MODE_MEAN)):
+            fs = frameBuffer.FrameStacker(first)
+            fs.start()
+            fs.add(np.full((2,2),10,dtype=np.uint16))
+            fs.setMode(second)
+            for i in range(2):
+                self.assertTrue(fs.add(np.full((2,2),10,dtype=np.uint16)),
+                                'frame not stacked after %s' % second)
+            self.assertTrue(np.allclose(fs.getMean(),10.),
+                            'wrong mean after %s to %s' % (first, second))
+            self.assertEqual(fs.mode,second,'mode not set')
+            fs.start()
+            self.assertEqual(fs.stackMode,second,'mode not used by start')
+
+class TestBurstBuffer(unittest.TestCase):
+
+    def test_burst(self):
+        bb = frameBuffer.BurstBuffer(3,(2,2))
+        frames = bb.frames
+        # First frame is a different size, so storage is re-allocated.
+        slot = bb.getWriteSlot((2,3))
+        self.assertIsNot(bb.frames,frames,'storage not re-allocated')
+        for i in range(3):
+            slot = bb.getWriteSlot((2,3))
+            slot[:] = i
+            bb.commit(10. + i * 0.5)
+        self.assertTrue(bb.isComplete(),'burst not complete')
+        self.assertIsNone(bb.getWriteSlot((2,3)),'slot returned when full')
+        self.assertAlmostEqual(bb.getFrameRate(),2.0,6,'wrong frame rate')
+        self.assertTrue(np.all(bb.frames[2]==2),'wrong frame')
+
+    def test_cancel(self):
+        bb = frameBuffer.BurstBuffer(3,(2,2))
+        bb.getWriteSlot((2,2))[:] = 1
+        bb.commit(10.)
+        self.assertIsNone(bb.getWriteSlot((2,3)),'wrong size slot returned')
+        bb.cancel()
+        self.assertTrue(bb.isComplete(),'cancelled burst not complete')
+        self.assertIsNone(bb.getWriteSlot((2,2)),'slot returned when cancelled')
+        self.assertEqual(bb.nReceived,1,'frames received lost')
+
+if __name__ == '__main__':
+    unittest.main()
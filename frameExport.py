@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+#
+# frameExport.py
+#
+# MIT License - CCD_CAPTURE
+#
+# Copyright (c) 2019 Graham Jones
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+'''frameExport - Writes full resolution frames as numpy .npy or deflate
+compressed TIFF files in chunks, so that a download can be streamed to the
+client without first building the whole file in memory.
+'''
+import io
+import struct
+import zlib
+import numpy as np
+
+# TIFF tag types
+TIFF_SHORT = 3
+TIFF_LONG = 4
+
+# TIFF SampleFormat for each numpy dtype kind.
+TIFF_SAMPLE_FORMATS = {'u': 1, 'i': 2, 'f': 3}
+
+
+def npyChunks(img, chunkRows = 64):
+    """ A generator of the bytes of 2 dimensional image img as a numpy .npy
+    file, chunkRows rows of the image at a time.
+    """
+    header = io.BytesIO()
+    np.lib.format.write_array_header_1_0(header, {
+        'descr': np.lib.format.dtype_to_descr(img.dtype),
+        'fortran_order': False,
+        'shape': img.shape})
+    yield(header.getvalue())
+    for row in range(0, img.shape[0], chunkRows):
+        yield(img[row : row + chunkRows].tobytes())
+
+
+def tiffChunks(img, rowsPerStrip = 64, level = 6):
+    """ A generator of the bytes of 2 dimensional image img as a single
+    channel TIFF file, compressed with deflate (zlib, at compression level
+    level) in strips of rowsPerStrip rows.   Integer images use the
+    horizontal differencing predictor, which makes smooth images compress
+    much better.
+    The TIFF header needs the compressed size of every strip, so all of
+    the strips are compressed before anything is returned - only the
+    compressed data is held in memory, never an uncompressed copy of img.
+    Raises ValueError if img is not a 2 dimensional integer or floating
+    point image.
+    """
+    if (img.ndim != 2 or img.dtype.kind not in TIFF_SAMPLE_FORMATS):
+        raise ValueError("Can not write %s image of shape %s as TIFF"
+                         % (img.dtype, img.shape))
+    ySize, xSize = img.shape
+    leImg = img.astype(img.dtype.newbyteorder('<'), copy=False)
+    usePredictor = img.dtype.kind in 'ui'
+
+    strips = []
+    for row in range(0, ySize, rowsPerStrip):
+        strip = leImg[row : row + rowsPerStrip]
+        if (usePredictor):
+            # Each pixel is replaced by its difference from the pixel to its
+            # left (wrapping around, as the TIFF predictor does).
+            diff = strip.copy()
+            np.subtract(strip[:, 1:], strip[:, :-1], out=diff[:, 1:])
+            strip = diff
+        strips.append(zlib.compress(strip.tobytes(), level))
+
+    nStrips = len(strips)
+    tags = [
+        (256, TIFF_LONG, [xSize]),                 # ImageWidth
+        (257, TIFF_LONG, [ySize]),                 # ImageLength
+        (258, TIFF_SHORT, [8 * img.dtype.itemsize]),  # BitsPerSample
+        (259, TIFF_SHORT, [8]),                    # Compression = deflate
+        (262, TIFF_SHORT, [1]),                    # Photometric = BlackIsZero
+        (273, TIFF_LONG, None),                    # StripOffsets
+        (277, TIFF_SHORT, [1]),                    # SamplesPerPixel
+        (278, TIFF_LONG, [rowsPerStrip]),          # RowsPerStrip
+        (279, TIFF_LONG, [len(s) for s in strips]),  # StripByteCounts
+        (317, TIFF_SHORT, [2 if usePredictor else 1]),  # Predictor
+        (339, TIFF_SHORT, [TIFF_SAMPLE_FORMATS[img.dtype.kind]]),
+    ]
+    # The file is laid out as header, IFD, strip offset and byte count
+    # arrays (if they do not fit in the IFD entries), then the strips.
+    ifdSize = 2 + 12 * len(tags) + 4
+    arraysSize = 0
+    if (nStrips > 1):
+        arraysSize = 2 * 4 * nStrips
+    offset = 8 + ifdSize + arraysSize
+    stripOffsets = []
+    for strip in strips:
+        stripOffsets.append(offset)
+        offset += len(strip)
+
+    ifd = [struct.pack('<2sHI', b'II', 42, 8), struct.pack('<H', len(tags))]
+    arrays = []
+    arrayOffset = 8 + ifdSize
+    for tag, tagType, values in tags:
+        if (values is None):
+            values = stripOffsets
+        fmt = {TIFF_SHORT: 'H', TIFF_LONG: 'I'}[tagType]
+        data = struct.pack('<%d%s' % (len(values), fmt), *values)
+        if (len(data) <= 4):
+            ifd.append(struct.pack('<HHI', tag, tagType, len(values))
+                       + data.ljust(4, b'\0'))
+        else:
+            ifd.append(struct.pack('<HHII', tag, tagType, len(values),
+                                   arrayOffset))
+            arrays.append(data)
+            arrayOffset += len(data)
+    ifd.append(struct.pack('<I', 0))   # No more IFDs
+    yield(b''.join(ifd + arrays))
+    while (strips):
+        yield(strips.pop(0))
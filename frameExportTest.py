@@ -0,0 +1,61 @@
+#
+# frameExportTest.py
+#
+# MIT License - CCD_CAPTURE
+#
+# Copyright (c) 2019 Graham Jones
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+''' Unit Tests for the frameExport module '''
+
+import unittest
+import io
+import numpy as np
+import cv2
+import frameExport
+
+
+class TestFrameExport(unittest.TestCase):
+
+    def setUp(self):
+        self.img = np.random.randint(0,65536,(301,203)).astype(np.uint16)
+
+    def test_npyChunks(self):
+        chunks = list(frameExport.npyChunks(self.img, 50))
+        self.assertEqual(len(chunks), 8, 'wrong number of chunks')
+        img = np.load(io.BytesIO(b''.join(chunks)))
+        self.assertTrue(np.array_equal(img, self.img), 'image wrong')
+
+    def test_tiffChunks(self):
+        for img in (self.img, self.img[:40], self.img.astype(np.uint8)):
+            data = b''.join(frameExport.tiffChunks(img, 64))
+            dec = cv2.imdecode(np.frombuffer(data, np.uint8),
+                               cv2.IMREAD_UNCHANGED)
+            self.assertEqual(dec.dtype, img.dtype, 'wrong dtype')
+            self.assertTrue(np.array_equal(dec, img), 'image wrong')
+        # A smooth image should compress well with the predictor.
+        smooth = np.add.outer(np.arange(300), np.arange(200)).astype(np.uint16)
+        data = b''.join(frameExport.tiffChunks(smooth))
+        self.assertLess(len(data), smooth.nbytes / 10, 'poor compression')
+        self.assertRaises(ValueError, list,
+                          frameExport.tiffChunks(np.zeros((2,2,3))))
+
+if __name__ == '__main__':
+    unittest.main()
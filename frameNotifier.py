@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+#
+# frameNotifier.py
+#
+# MIT License - CCD_CAPTURE
+#
+# Copyright (c) 2019 Graham Jones
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+'''frameNotifier - Tells the threads serving the /events and /liveStream
+streams when a new frame has been received, and when the server is being
+shut down so that the streams can end.
+'''
+import threading
+
+
+class FrameNotifier():
+    def __init__(self):
+        """ Initialise the notifier with no frames received """
+        self.cond = threading.Condition()
+        self.count = 0
+        self.shutDown = False
+
+    def notify(self):
+        """ Tell the waiting threads that a new frame has been received """
+        with self.cond:
+            self.count += 1
+            self.cond.notify_all()
+
+    def stop(self):
+        """ Tell the waiting threads that the server is shutting down """
+        with self.cond:
+            self.shutDown = True
+            self.cond.notify_all()
+
+    def waitForFrames(self, timeout):
+        """ A generator of frame counts - yields the current count
+        straight away, then the new count whenever a frame is received, or
+        None if no frame has been received for timeout seconds.  It ends
+        when stop() is called.
+        """
+        lastCount = None
+        while True:
+            with self.cond:
+                self.cond.wait_for(
+                    lambda: self.shutDown or self.count != lastCount,
+                    timeout)
+                if (self.shutDown):
+                    return
+                count = self.count
+            if (count == lastCount):
+                yield(None)
+            else:
+                lastCount = count
+                yield(count)
@@ -0,0 +1,76 @@
+#
+# frameNotifierTest.py
+#
+# MIT License - CCD_CAPTURE
+#
+# Copyright (c) 2019 Graham Jones
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+''' Unit Tests for the frameNotifier module '''
+
+import unittest
+import threading
+import time
+import frameNotifier
+
+
+class TestFrameNotifier(unittest.TestCase):
+
+    def test_waitForFrames(self):
+        fn = frameNotifier.FrameNotifier()
+        frames = fn.waitForFrames(0.01)
+        self.assertEqual(next(frames),0,'current count not yielded first')
+        self.assertIsNone(next(frames),'timeout should yield None')
+        fn.notify()
+        self.assertEqual(next(frames),1,'new frame not yielded')
+
+    def test_stop(self):
+        fn = frameNotifier.FrameNotifier()
+        frames = fn.waitForFrames(60)
+        next(frames)
+        counts = []
+        waitThread = threading.Thread(target=lambda: counts.extend(frames))
+        waitThread.start()
+        time.sleep(0.05)
+        self.assertTrue(waitThread.is_alive(),'generator did not wait')
+        fn.stop()
+        waitThread.join(1.0)
+        self.assertFalse(waitThread.is_alive(),'generator did not end')
+        self.assertEqual(counts,[],'no frames should be yielded')
+        self.assertEqual(list(fn.waitForFrames(60)),[],
+                         'generator should end straight away once stopped')
+
+    def test_stopAllViewers(self):
+        fn = frameNotifier.FrameNotifier()
+        waitThreads = [threading.Thread(target=list,
+                                        args=(fn.waitForFrames(60),))
+                       for i in range(3)]
+        for waitThread in waitThreads:
+            waitThread.start()
+        time.sleep(0.05)
+        fn.notify()
+        fn.stop()
+        for waitThread in waitThreads:
+            waitThread.join(1.0)
+            self.assertFalse(waitThread.is_alive(),'generator did not end')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+#
+# frameQueue.py
+#
+# MIT License - CCD_CAPTURE
+#
+# Copyright (c) 2019 Graham Jones
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+'''frameQueue - A bounded queue used to hand camera frames from the INDI
+client thread to the frame processing thread, with a configurable policy
+for what to do when the queue is full.
+'''
+import threading
+import collections
+
+
+class FrameQueue():
+    POLICY_DROP_OLDEST = "dropOldest"
+    POLICY_DROP_NEWEST = "dropNewest"
+    POLICY_BLOCK = "block"
+    POLICIES = (POLICY_DROP_OLDEST, POLICY_DROP_NEWEST, POLICY_BLOCK)
+
+    def __init__(self, maxSize = 4, policy = POLICY_DROP_OLDEST):
+        """ Initialise the queue to hold at most maxSize frames.
+        policy determines what put() does when the queue is full:
+          dropOldest - discard the oldest queued frame to make room.
+          dropNewest - discard the frame being added.
+          block - wait until the processing thread makes room.
+        """
+        if (policy not in self.POLICIES):
+            raise ValueError("Unrecognised FrameQueue policy %s" % policy)
+        if (maxSize < 1):
+            raise ValueError("FrameQueue maxSize must be at least 1")
+        self.maxSize = int(maxSize)
+        self.policy = policy
+        self.nDropped = 0
+        self.items = collections.deque()
+        self.cond = threading.Condition()
+
+    def put(self, item):
+        """ Add item to the queue, applying the overflow policy.
+        Returns True if item was queued, or False if it was dropped.
+        """
+        with self.cond:
+            if (len(self.items) >= self.maxSize):
+                if (self.policy == self.POLICY_DROP_NEWEST):
+                    self.nDropped += 1
+                    return(False)
+                elif (self.policy == self.POLICY_DROP_OLDEST):
+                    self.items.popleft()
+                    self.nDropped += 1
+                else:
+                    while (len(self.items) >= self.maxSize):
+                        self.cond.wait()
+            self.items.append(item)
+            self.cond.notify_all()
+            return(True)
+
+    def get(self, timeout = None):
+        """ Remove and return the oldest item in the queue, waiting up to
+        timeout seconds (forever if timeout is None) for one to arrive.
+        Returns None if the timeout expires.
+        """
+        with self.cond:
+            if (not self.cond.wait_for(lambda: len(self.items) > 0,
+                                       timeout)):
+                return(None)
+            item = self.items.popleft()
+            self.cond.notify_all()
+            return(item)
+
+    def qsize(self):
+        """ Returns the number of items waiting in the queue """
+        with self.cond:
+            return(len(self.items))
@@ -0,0 +1,72 @@
+#
+# frameQueueTest.py
+#
+# MIT License - CCD_CAPTURE
+#
+# Copyright (c) 2019 Graham Jones
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+''' Unit Tests for the frameQueue module '''
+
+import unittest
+import threading
+import time
+import frameQueue
+
+
+class TestFrameQueue(unittest.TestCase):
+
+    def test_dropOldest(self):
+        fq = frameQueue.FrameQueue(2, frameQueue.FrameQueue.POLICY_DROP_OLDEST)
+        self.assertTrue(fq.put(1))
+        self.assertTrue(fq.put(2))
+        self.assertTrue(fq.put(3))
+        self.assertEqual(fq.nDropped,1,'nDropped incorrect')
+        self.assertEqual(fq.get(0),2,'oldest frame not dropped')
+        self.assertEqual(fq.get(0),3,'wrong frame returned')
+        self.assertIsNone(fq.get(0),'queue should be empty')
+
+    def test_dropNewest(self):
+        fq = frameQueue.FrameQueue(2, frameQueue.FrameQueue.POLICY_DROP_NEWEST)
+        fq.put(1)
+        fq.put(2)
+        self.assertFalse(fq.put(3))
+        self.assertEqual(fq.nDropped,1,'nDropped incorrect')
+        self.assertEqual(fq.get(0),1,'wrong frame returned')
+        self.assertEqual(fq.get(0),2,'wrong frame returned')
+
+    def test_block(self):
+        fq = frameQueue.FrameQueue(1, frameQueue.FrameQueue.POLICY_BLOCK)
+        fq.put(1)
+        putThread = threading.Thread(target=fq.put, args=(2,))
+        putThread.start()
+        time.sleep(0.05)
+        self.assertTrue(putThread.is_alive(),'put() should block when full')
+        self.assertEqual(fq.get(1),1,'wrong frame returned')
+        putThread.join(1)
+        self.assertFalse(putThread.is_alive(),'put() did not unblock')
+        self.assertEqual(fq.get(1),2,'wrong frame returned')
+        self.assertEqual(fq.nDropped,0,'nDropped incorrect')
+
+    def test_badPolicy(self):
+        self.assertRaises(ValueError, frameQueue.FrameQueue, 2, "bad")
+
+if __name__ == '__main__':
+    unittest.main()
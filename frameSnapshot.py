@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+#
+# frameSnapshot.py
+#
+# MIT License - CCD_CAPTURE
+#
+# Copyright (c) 2019 Graham Jones
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+'''frameSnapshot - An immutable record of a processed frame - the image,
+the ROI, the image and ROI statistics and the frame metadata.
+
+The frame processing thread makes a new FrameSnapshot for each frame once
+it has been completely processed, and publishes it by assigning it to a
+single attribute.   Assigning a reference is atomic, so a web request that
+takes a reference to the snapshot when it starts sees one consistent
+frame, ROI and set of statistics without locking.
+The image of a live frame is not copied though - it is a view of a frame
+buffer slot, which is over-written once the buffer has wrapped round, so
+anything read from it must be checked afterwards (see
+Ccd_capture.renderFrame()).
+'''
+import collections
+from imgAnalyser import calcFrameStats
+
+FRAME_LIVE = "live"
+FRAME_STACK = "stack"
+
+# Image and ROI statistics - the SDs are percentages of the mean.
+FrameStats = collections.namedtuple('FrameStats', (
+    'imageMean', 'imageSd', 'imageSat', 'roiMean', 'roiSd', 'roiSat'))
+
+
+def calcStats(img, roi, step = 1):
+    """ Returns the FrameStats of image img and ROI roi
+    (xOrigin, yOrigin, xSize, ySize) in a single pass, using every step'th
+    pixel (see imgAnalyser.calcFrameStats()).
+    """
+    frameStats, roiStats = calcFrameStats(img, [roi], step = step)
+    return(FrameStats(
+        frameStats['mean'],
+        100 * frameStats['sd'] / max(frameStats['mean'], 1e-6),
+        frameStats['nSat'],
+        roiStats['mean'],
+        100 * roiStats['sd'] / max(roiStats['mean'], 1e-6),
+        roiStats['nSat']))
+
+
+class FrameSnapshot(collections.namedtuple('FrameSnapshot', (
+        'kind', 'seq', 'img', 'roi', 'stats', 'fits', 'time',
+        'exposureTime', 'calibration'))):
+    """ A processed frame:
+      kind - FRAME_LIVE for a camera frame or FRAME_STACK for a stack,
+      seq - the frame sequence number (or number of frames stacked),
+      img - the image, a read-only numpy array,
+      roi - the ROI (xOrigin, yOrigin, xSize, ySize),
+      stats - the FrameStats of img and roi,
+      fits - the FITS data the frame was decoded from (or None),
+      time - the time the frame was received,
+      exposureTime - the exposure time (s),
+      calibration - a description of the calibration applied.
+    Live frame images are read-only views of a frame buffer slot, not
+    copies.   The slot is re-used, and the image over-written, when the
+    frame buffer capacity (frameBufferSize, at least 2) more frames have
+    been received - a reader that may hold a snapshot for longer than
+    that must check that the frame is still in the buffer (see
+    Ccd_capture.renderFrame() and Ccd_capture.checkFrameChunks()).
+    """
+    __slots__ = ()
+
+    def getId(self):
+        """ Returns (kind, seq), which identifies the frame for caching """
+        return((self.kind, self.seq))
+
+    def getFrameId(self):
+        """ Returns the frame id string used by the web interface, e.g.
+        live-123
+        """
+        return("%s-%d" % (self.kind, self.seq))
+
+    def getRoiImg(self):
+        """ Returns a view of the ROI of the image (no copy is made) """
+        x, y, xSize, ySize = self.roi
+        return(self.img[y : y + ySize, x : x + xSize])
+
+    def withRoi(self, roi, step = 1):
+        """ Returns a copy of the snapshot with ROI roi, with the
+        statistics re-calculated (see calcStats()).
+        """
+        return(self._replace(roi=tuple(roi),
+                             stats=calcStats(self.img, roi, step)))
+
+
+def makeFrameSnapshot(kind, seq, img, roi, step = 1, fits = None, time = 0,
+                      exposureTime = 0, calibration = ""):
+    """ Returns a FrameSnapshot of image img (see FrameSnapshot for the
+    other parameters), with its statistics calculated from every step'th
+    pixel.   img is made read-only, so that nothing can change it through
+    the snapshot.
+    """
+    img = img.view()
+    img.flags.writeable = False
+    return(FrameSnapshot(kind, seq, img, tuple(roi),
+                         calcStats(img, roi, step), fits, time,
+                         exposureTime, calibration))
+
+
+# The snapshot published before the first frame is received
+NO_FRAME = FrameSnapshot(FRAME_LIVE, 0, None, (0, 0, 0, 0),
+                         FrameStats(0., 0., 0, 0., 0., 0), None, 0, 0, "")
@@ -0,0 +1,70 @@
+#
+# frameSnapshotTest.py
+#
+# MIT License - CCD_CAPTURE
+#
+# Copyright (c) 2019 Graham Jones
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+''' Unit Tests for the frameSnapshot module '''
+
+import unittest
+import numpy as np
+import frameSnapshot
+
+
+class TestFrameSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.img = np.random.randint(0,65536,(301,203)).astype(np.uint16)
+        self.roi = (10,20,50,100)
+        self.frame = frameSnapshot.makeFrameSnapshot(
+            frameSnapshot.FRAME_LIVE, 5, self.img, self.roi, time=123.)
+
+    def test_makeFrameSnapshot(self):
+        frame = self.frame
+        self.assertEqual(frame.getId(), ('live',5), 'wrong id')
+        self.assertEqual(frame.getFrameId(), 'live-5', 'wrong frameId')
+        self.assertTrue(np.shares_memory(frame.img, self.img),
+                        'image copied')
+        self.assertFalse(frame.img.flags.writeable, 'image writeable')
+        self.assertTrue(self.img.flags.writeable,
+                        'original image made read-only')
+        roiImg = self.img[20:120,10:60]
+        self.assertTrue(np.array_equal(frame.getRoiImg(), roiImg),
+                        'wrong roi image')
+        self.assertAlmostEqual(frame.stats.imageMean, self.img.mean(), 4,
+                               'wrong image mean')
+        self.assertAlmostEqual(frame.stats.roiMean, roiImg.mean(), 4,
+                               'wrong roi mean')
+        self.assertRaises(AttributeError, setattr, frame, 'seq', 6)
+
+    def test_withRoi(self):
+        frame = self.frame.withRoi((0,0,10,10))
+        self.assertEqual(frame.roi, (0,0,10,10), 'roi not changed')
+        self.assertAlmostEqual(frame.stats.roiMean,
+                               self.img[:10,:10].mean(), 4, 'wrong roi mean')
+        self.assertEqual(frame.stats.imageMean, self.frame.stats.imageMean,
+                         'image stats changed')
+        self.assertEqual(self.frame.roi, self.roi, 'original snapshot changed')
+        self.assertIs(frame.img, self.frame.img, 'image not shared')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -32,7 +32,6 @@ import io
 import os
 import numpy as np
 import cv2
-import matplotlib.pyplot as plt
 
 
 # ROI indices
@@ -41,6 +40,182 @@ Y_ORIGIN = 1
 X_SIZE = 2
 Y_SIZE = 3
 
+# Display stretches - see makeStretchLut()
+STRETCH_LINEAR = "linear"
+STRETCH_ASINH = "asinh"
+STRETCH_LOG = "log"
+STRETCH_PERCENTILE = "percentile"
+STRETCHES = (STRETCH_LINEAR, STRETCH_ASINH, STRETCH_LOG, STRETCH_PERCENTILE)
+
+# Default (xMax, yMax) size of images scaled for web viewing
+WEB_SIZE = (600, 400)
+
+
+def calcFrameStats(img, rois = (), step = 1, satLevel = 65535,
+                   chunkRows = 64):
+    """ Calculate the statistics of image img and of each of the ROIs in
+    rois (each [X_Origin, Y_Origin, X_Size, Y_Size]) in a single pass
+    through the image.
+    The image is processed in blocks of chunkRows rows so that the only
+    temporary arrays are the size of one block rather than the whole image.
+    If step is greater than 1, only every step'th pixel in each direction
+    is used, to give fast approximate statistics.
+    Returns a list of dictionaries, the first for the whole image, then
+    one for each ROI, with keys count, sum, sumSq, min, max, nSat (number of
+    pixels >= satLevel), mean and sd.
+    """
+    step = max(1, int(step))
+    imgSizeY, imgSizeX = img.shape[0], img.shape[1]
+    regions = [(0, 0, imgSizeX, imgSizeY)]
+    for roi in rois:
+        xOrigin = min(max(0, int(roi[X_ORIGIN])), imgSizeX)
+        yOrigin = min(max(0, int(roi[Y_ORIGIN])), imgSizeY)
+        regions.append((xOrigin, yOrigin,
+                        min(int(roi[X_SIZE]), imgSizeX - xOrigin),
+                        min(int(roi[Y_SIZE]), imgSizeY - yOrigin)))
+    if (img.dtype.kind in "ui"):
+        accType = np.int64
+    else:
+        accType = np.float64
+
+    results = []
+    for region in regions:
+        results.append({'count': 0, 'sum': 0, 'sumSq': 0,
+                        'min': None, 'max': None, 'nSat': 0})
+
+    blockRows = chunkRows * step
+    for blockStart in range(0, imgSizeY, blockRows):
+        blockEnd = blockStart + blockRows
+        for region, res in zip(regions, results):
+            xOrigin, yOrigin, xSize, ySize = region
+            rowMin = max(blockStart, yOrigin)
+            rowMax = min(blockEnd, yOrigin + ySize)
+            # Keep to the rows step, step*2.. from the region origin.
+            rowMin += (yOrigin - rowMin) % step
+            if (rowMin >= rowMax or xSize <= 0):
+                continue
+            block = img[rowMin : rowMax : step,
+                        xOrigin : xOrigin + xSize : step]
+            flat = block.astype(accType).ravel()
+            res['count'] += flat.size
+            res['sum'] += flat.sum().item()
+            res['sumSq'] += np.dot(flat, flat).item()
+            blockMin = block.min().item()
+            blockMax = block.max().item()
+            if (res['min'] is None or blockMin < res['min']):
+                res['min'] = blockMin
+            if (res['max'] is None or blockMax > res['max']):
+                res['max'] = blockMax
+            res['nSat'] += int(np.count_nonzero(block >= satLevel))
+
+    for res in results:
+        if (res['count'] > 0):
+            res['mean'] = res['sum'] / res['count']
+            var = res['sumSq'] / res['count'] - res['mean'] * res['mean']
+            res['sd'] = np.sqrt(max(var, 0.))
+        else:
+            res['mean'] = 0.
+            res['sd'] = 0.
+    return(results)
+
+def calcHistogram16(img, step = 4):
+    """ Returns the 65536 bin histogram of the values of 16 bit image img,
+    using every step'th pixel in each direction.
+    """
+    step = max(1, int(step))
+    return(np.bincount(img[::step, ::step].ravel(), minlength=65536))
+
+
+def rebinHistogram(hist, nBins = 256):
+    """ Returns (counts, binEdges) for a histogram with nBins equal bins
+    between the minimum and maximum values of the 65536 bin histogram hist,
+    as np.histogram(img, nBins) would return for the image, but much more
+    quickly.
+    """
+    nonZero = np.flatnonzero(hist)
+    if (len(nonZero) == 0):
+        return((np.zeros(nBins, dtype=np.int64),
+                np.linspace(0., 1., nBins + 1)))
+    lo = int(nonZero[0])
+    hi = int(nonZero[-1])
+    if (hi == lo):
+        # As np.histogram, use a range of +/-0.5 around a single value.
+        binEdges = np.linspace(lo - 0.5, hi + 0.5, nBins + 1)
+        counts = np.zeros(nBins, dtype=np.int64)
+        counts[nBins // 2] = hist[lo]
+        return((counts, binEdges))
+    binEdges = np.linspace(lo, hi, nBins + 1)
+    values = np.arange(lo, hi + 1)
+    binIdx = np.minimum(((values - lo) * nBins) // (hi - lo), nBins - 1)
+    counts = np.bincount(binIdx, weights=hist[lo : hi + 1],
+                         minlength=nBins).astype(np.int64)
+    return((counts, binEdges))
+
+
+def makeStretchLut(hist, stretch = STRETCH_PERCENTILE, lowPct = 0.5,
+                   highPct = 99.5, asinhBeta = 10., logScale = 1000.):
+    """ Returns a 65536 entry uint8 lookup table that maps 16 bit pixel
+    values to 8 bit display values, for an image with 65536 bin
+    histogram hist (see calcHistogram16()).
+    stretch is one of STRETCHES:
+      linear - linear between the minimum and maximum pixel values,
+      asinh - asinh(beta x) / asinh(beta), where x is the value scaled to
+              0-1 between the minimum and maximum, to show faint detail
+              without saturating bright objects,
+      log - log(1 + logScale x) / log(1 + logScale),
+      percentile - linear between the lowPct and highPct percentiles of the
+              pixel values (auto-contrast), clipping the extremes.
+    Raises ValueError if stretch is not recognised.
+    """
+    if (stretch not in STRETCHES):
+        raise ValueError("Unrecognised display stretch %s" % stretch)
+    nonZero = np.flatnonzero(hist)
+    if (len(nonZero) == 0):
+        return(np.zeros(65536, dtype=np.uint8))
+    lo = int(nonZero[0])
+    hi = int(nonZero[-1])
+    if (stretch == STRETCH_PERCENTILE):
+        cumHist = np.cumsum(hist)
+        total = cumHist[-1]
+        lo = int(np.searchsorted(cumHist, total * lowPct / 100.))
+        hi = int(np.searchsorted(cumHist, total * highPct / 100.))
+    hi = max(hi, lo + 1)
+
+    x = np.arange(65536, dtype=np.float32)
+    x -= lo
+    x *= 1. / (hi - lo)
+    np.clip(x, 0., 1., out=x)
+    if (stretch == STRETCH_ASINH):
+        x *= asinhBeta
+        np.arcsinh(x, out=x)
+        x *= 1. / np.arcsinh(asinhBeta)
+    elif (stretch == STRETCH_LOG):
+        x *= logScale
+        np.log1p(x, out=x)
+        x *= 1. / np.log1p(logScale)
+    x *= 255.
+    return(np.rint(x).astype(np.uint8))
+
+
+def applyLut(img, lut):
+    """ Returns 16 bit image img mapped to 8 bits by lookup table lut """
+    return(np.take(lut, img))
+
+
+def getWebSize(shape, maxSize = WEB_SIZE):
+    """ Returns the (xSize, ySize) to display an image of shape
+    (ySize, xSize) at for web viewing - the largest size with the same
+    aspect ratio that fits in maxSize (xMax, yMax).
+    """
+    xMax = int(maxSize[0])
+    yMax = int(shape[0] * xMax / shape[1])
+
+    if (yMax > maxSize[1]):
+        yMax = int(maxSize[1])
+        xMax = int(shape[1] * yMax / shape[0])
+    return((max(1, xMax), max(1, yMax)))
+
+
 class ImgAnalyser():
     img = None
     imgSizeX = None
@@ -49,8 +224,7 @@ class ImgAnalyser():
     xProfileWidth = 1
     yProfileWidth = 1
     
-    WEB_X_MAX = 600
-    WEB_Y_MAX = 400
+    stretch = STRETCH_PERCENTILE  # Display stretch used by convertTo8Bit()
     
     def __init__(self, img = None):
         """ Initialise the ImgAnalyser, with image img, which should be a
@@ -236,6 +410,8 @@ class ImgAnalyser():
         """ returns an image of a graph of the X profile statistics """
         xProfile = self.getXProfile()
         xData = np.linspace(0,xProfile.shape[1]-1,xProfile.shape[1])
+        # matplotlib is slow to import, so only load it if it is needed.
+        import matplotlib.pyplot as plt
         fig, ax = plt.subplots( nrows=1, ncols=1 ) 
         ax.plot(xData,xProfile[0,:])
         ax.set_title("ROI X Intensity Profile")
@@ -262,23 +438,22 @@ class ImgAnalyser():
         return(roiImg)
 
     def convertTo8Bit(self,img):
-        # Convert to 8 bit image for display - note this assumes
-        # that we have a 16 bit image for starters.
+        # Convert to 8 bit image for display, using display stretch
+        # self.stretch - note this assumes that we have a 16 bit image for
+        # starters.
         #print(img.dtype)
         if (img.dtype=="uint16"):
-            res8 = (img/256).astype('uint8')
+            lut = makeStretchLut(calcHistogram16(img), self.stretch)
+            res8 = applyLut(img, lut)
         else:
             res8 = img
         return(res8)
 
-    def resizeImgForWeb(self,img):
-        """ Returns a re-sized image for web viewing """
-        xMax = int(self.WEB_X_MAX)
-        yMax = int(img.shape[0] * xMax / img.shape[1])
-
-        if (yMax > self.WEB_Y_MAX):
-            yMax = int(self.WEB_Y_MAX)
-            xMax = int(img.shape[1] * yMax / img.shape[0])
+    def resizeImgForWeb(self,img,maxSize = WEB_SIZE):
+        """ Returns a re-sized image for web viewing, fitting in maxSize
+        (xMax, yMax).
+        """
+        xMax, yMax = getWebSize(img.shape, maxSize)
         res = cv2.resize(img, dsize=(xMax,yMax),
                          interpolation=cv2.INTER_CUBIC)
         res8 = self.convertTo8Bit(res)
@@ -134,6 +134,71 @@ class TestImgAnalyser(unittest.TestCase):
         self.assertEqual(np.allclose(roi,correctProfile),True,"roi wrong")
 
 
+    def test_calcFrameStats(self):
+        img = np.random.randint(0,65536,(301,203)).astype(np.uint16)
+        img[5,7] = 65535
+        roi = (10,20,50,100)
+        stats = imgAnalyser.calcFrameStats(img,[roi],chunkRows=16)
+        roiImg = img[20:120,10:60]
+        for res,arr in ((stats[0],img),(stats[1],roiImg)):
+            self.assertEqual(res['count'],arr.size,'count wrong')
+            self.assertEqual(res['min'],arr.min(),'min wrong')
+            self.assertEqual(res['max'],arr.max(),'max wrong')
+            self.assertEqual(res['nSat'],np.count_nonzero(arr==65535),
+                             'nSat wrong')
+            self.assertAlmostEqual(res['mean'],arr.mean(),6,'mean wrong')
+            self.assertAlmostEqual(res['sd'],arr.std(),4,'sd wrong')
+
+        # Subsampled statistics only use every step'th pixel
+        stats = imgAnalyser.calcFrameStats(img,[roi],step=3,chunkRows=4)
+        self.assertEqual(stats[0]['count'],img[::3,::3].size,'count wrong')
+        self.assertAlmostEqual(stats[0]['mean'],img[::3,::3].mean(),6,
+                               'mean wrong')
+        self.assertAlmostEqual(stats[1]['mean'],roiImg[::3,::3].mean(),6,
+                               'roi mean wrong')
+
+    def test_stretchLut(self):
+        img = np.full((100,100),1000,dtype=np.uint16)
+        img[:50,:] = 2000
+        img[0,0] = 100     # Outliers, clipped by the percentile stretch
+        img[0,1] = 60000
+        hist = imgAnalyser.calcHistogram16(img,step=1)
+        self.assertEqual(hist.sum(),img.size,'histogram count wrong')
+        for stretch in imgAnalyser.STRETCHES:
+            lut = imgAnalyser.makeStretchLut(hist,stretch)
+            self.assertEqual((lut.shape,lut.dtype),((65536,),np.uint8),
+                             'wrong lut for %s' % stretch)
+            self.assertTrue(np.all(np.diff(lut.astype(int)) >= 0),
+                            '%s lut not monotonic' % stretch)
+            img8 = imgAnalyser.applyLut(img,lut)
+            self.assertEqual(img8.dtype,np.uint8,'wrong dtype')
+            self.assertEqual((img8.min(),img8.max()),(0,255),
+                             '%s does not fill range' % stretch)
+        lut = imgAnalyser.makeStretchLut(hist,imgAnalyser.STRETCH_PERCENTILE)
+        self.assertEqual((lut[1000],lut[2000]),(0,255),
+                         'percentile stretch wrong')
+        lut = imgAnalyser.makeStretchLut(hist,imgAnalyser.STRETCH_ASINH)
+        self.assertGreater(lut[2000],
+                           imgAnalyser.makeStretchLut(hist,'linear')[2000],
+                           'asinh should brighten faint values')
+        self.assertRaises(ValueError,imgAnalyser.makeStretchLut,hist,'cubic')
+
+    def test_rebinHistogram(self):
+        img = np.random.randint(100,5000,(200,300)).astype(np.uint16)
+        hist = imgAnalyser.calcHistogram16(img,step=1)
+        counts, binEdges = imgAnalyser.rebinHistogram(hist,256)
+        npCounts, npEdges = np.histogram(img,256)
+        self.assertTrue(np.allclose(binEdges,npEdges),'bin edges wrong')
+        self.assertTrue(np.array_equal(counts,npCounts),'counts wrong')
+
+    def test_getWebSize(self):
+        self.assertEqual(imgAnalyser.getWebSize((1200,1600)),(533,400),
+                         'default size wrong')
+        self.assertEqual(imgAnalyser.getWebSize((1200,1600),(300,4000)),
+                         (300,225),'width limited size wrong')
+        self.assertEqual(imgAnalyser.getWebSize((10,5000),(600,400)),
+                         (600,1),'size less than 1 pixel')
+
     def test_realImage(self):
         self.ia.setImg("./test_image.tif")
         self.ia.setRoi((380,350,200,1800))
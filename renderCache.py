@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+#
+# renderCache.py
+#
+# MIT License - CCD_CAPTURE
+#
+# Copyright (c) 2019 Graham Jones
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+'''renderCache - A least-recently-used cache of encoded web responses
+(images, charts etc.) or numpy arrays, limited to a maximum total size in
+bytes.
+'''
+import threading
+import collections
+
+
+class RenderCache():
+    def __init__(self, maxBytes = 32 * 1024 * 1024):
+        """ Initialise an empty cache that holds at most maxBytes bytes.
+        """
+        self.maxBytes = int(maxBytes)
+        self.entries = collections.OrderedDict()
+        self.nBytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def clear(self):
+        """ Remove everything from the cache """
+        with self.lock:
+            self.entries.clear()
+            self.nBytes = 0
+
+    def get(self, key, renderFunc):
+        """ Returns the cached bytes for key.  If key is not in the cache,
+        renderFunc() is called to produce them, and the result is cached.
+        renderFunc() may return bytes, a numpy array or a file-like object
+        with a getvalue() method (e.g. io.BytesIO).
+        """
+        with self.lock:
+            data = self.entries.get(key)
+            if (data is not None):
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return(data)
+            self.misses += 1
+
+        # Render without holding the lock, so that other requests are
+        # not held up by a slow render.
+        data = renderFunc()
+        if (hasattr(data, "getvalue")):
+            data = data.getvalue()
+        self.put(key, data)
+        return(data)
+
+    def getSize(self, data):
+        """ Returns the size of data (bytes or a numpy array) in bytes """
+        size = getattr(data, "nbytes", None)
+        if (size is None):
+            size = len(data)
+        return(size)
+
+    def put(self, key, data):
+        """ Add data to the cache as key, discarding the least recently used
+        entries to keep within maxBytes.   Items larger than half of
+        maxBytes are not cached.
+        """
+        size = self.getSize(data)
+        if (size > self.maxBytes / 2):
+            return
+        with self.lock:
+            if (key in self.entries):
+                self.nBytes -= self.getSize(self.entries.pop(key))
+            self.entries[key] = data
+            self.nBytes += size
+            while (self.nBytes > self.maxBytes):
+                oldKey, oldData = self.entries.popitem(last=False)
+                self.nBytes -= self.getSize(oldData)
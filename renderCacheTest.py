@@ -0,0 +1,77 @@
+#
+# renderCacheTest.py
+#
+# MIT License - CCD_CAPTURE
+#
+# Copyright (c) 2019 Graham Jones
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+''' Unit Tests for the renderCache module '''
+
+import unittest
+import io
+import numpy as np
+import renderCache
+
+
+class TestRenderCache(unittest.TestCase):
+
+    def setUp(self):
+        self.rc = renderCache.RenderCache(100)
+        self.nRenders = 0
+
+    def render(self, size = 10):
+        self.nRenders += 1
+        return(b"x" * size)
+
+    def test_get(self):
+        self.assertEqual(self.rc.get("a",self.render),b"x"*10,'wrong data')
+        self.assertEqual(self.rc.get("a",self.render),b"x"*10,'wrong data')
+        self.assertEqual(self.nRenders,1,'cached item re-rendered')
+        self.assertEqual((self.rc.hits,self.rc.misses),(1,1),'wrong counts')
+        data = self.rc.get("b",lambda: io.BytesIO(b"abc"))
+        self.assertEqual(data,b"abc",'BytesIO not converted to bytes')
+
+    def test_budget(self):
+        for key in "abcde":
+            self.rc.get(key,lambda: self.render(30))
+        self.assertLessEqual(self.rc.nBytes,100,'over budget')
+        self.assertEqual(list(self.rc.entries.keys()),["c","d","e"],
+                         'least recently used items not discarded')
+        self.rc.get("f",lambda: self.render(60))
+        self.assertNotIn("f",self.rc.entries,'oversized item cached')
+
+    def test_arrays(self):
+        self.rc.get("a",lambda: np.zeros((5,4),dtype=np.uint16))
+        self.assertEqual(self.rc.nBytes,40,'array size wrong')
+        self.rc.get("b",lambda: np.zeros((5,4),dtype=np.uint16))
+        self.rc.get("c",lambda: np.zeros(30,dtype=np.uint8))
+        self.assertEqual(list(self.rc.entries.keys()),["b","c"],
+                         'least recently used array not discarded')
+
+    def test_clear(self):
+        self.rc.get("a",self.render)
+        self.rc.clear()
+        self.rc.get("a",self.render)
+        self.assertEqual(self.nRenders,2,'cache not cleared')
+        self.assertEqual(self.rc.nBytes,10,'wrong size')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+#
+# tilePyramid.py
+#
+# MIT License - CCD_CAPTURE
+#
+# Copyright (c) 2019 Graham Jones
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+'''tilePyramid - A zoom pyramid of an image, divided into square tiles, so
+that a pan and zoom viewer only needs the pixels that are in view.
+
+Zoom level 0 is the whole image reduced to fit in a single tile, and each
+level doubles the resolution, up to maxZoom which is the full resolution
+image.   Levels are only calculated when a tile from them is requested.
+'''
+import math
+import threading
+import cv2
+
+
+class TilePyramid():
+    def __init__(self, img, tileSize = 256):
+        """ Initialise the pyramid for image img (a numpy array, which is
+        not copied, so must not change while the pyramid is in use).
+        """
+        self.tileSize = int(tileSize)
+        self.imgSizeY, self.imgSizeX = img.shape[0], img.shape[1]
+        largest = max(self.imgSizeX, self.imgSizeY)
+        self.maxZoom = max(0, int(math.ceil(math.log2(largest
+                                                      / self.tileSize))))
+        self.levels = {self.maxZoom: img}
+        self.lock = threading.Lock()
+
+    def getLevel(self, zoom):
+        """ Returns the image at zoom level zoom, calculating it (and the
+        levels between it and the full resolution image) if necessary.
+        Each level is half the size of the next, made by averaging 2x2
+        blocks of pixels.
+        Raises ValueError if zoom is out of range.
+        """
+        if (zoom < 0 or zoom > self.maxZoom):
+            raise ValueError("Zoom level %d out of range 0-%d"
+                             % (zoom, self.maxZoom))
+        with self.lock:
+            level = self.levels.get(zoom)
+            if (level is None):
+                finer = zoom + 1
+                while (finer not in self.levels):
+                    finer += 1
+                level = self.levels[finer]
+                for z in range(finer - 1, zoom - 1, -1):
+                    level = cv2.resize(level,
+                                       dsize=(max(1, level.shape[1] // 2),
+                                              max(1, level.shape[0] // 2)),
+                                       interpolation=cv2.INTER_AREA)
+                    self.levels[z] = level
+            return(level)
+
+    def getLevelSize(self, zoom):
+        """ Returns (xSize, ySize), the size of the image at zoom level
+        zoom, without calculating it - each level is the next one halved,
+        rounding down, but is at least 1 pixel.
+        """
+        xSize, ySize = self.imgSizeX, self.imgSizeY
+        for z in range(self.maxZoom, zoom, -1):
+            xSize = max(1, xSize // 2)
+            ySize = max(1, ySize // 2)
+        return((xSize, ySize))
+
+    def getNumTiles(self, zoom):
+        """ Returns (nTilesX, nTilesY), the number of tiles at zoom level
+        zoom.
+        """
+        xSize, ySize = self.getLevelSize(zoom)
+        return((int(math.ceil(xSize / self.tileSize)),
+                int(math.ceil(ySize / self.tileSize))))
+
+    def checkTile(self, zoom, x, y):
+        """ Raises ValueError if there is no tile (x, y) at zoom level
+        zoom, without calculating the level.
+        """
+        if (zoom < 0 or zoom > self.maxZoom):
+            raise ValueError("Zoom level %d out of range 0-%d"
+                             % (zoom, self.maxZoom))
+        nTilesX, nTilesY = self.getNumTiles(zoom)
+        if (x < 0 or y < 0 or x >= nTilesX or y >= nTilesY):
+            raise ValueError("Tile (%d, %d) out of range at zoom %d"
+                             % (x, y, zoom))
+
+    def getTile(self, zoom, x, y):
+        """ Returns tile (x, y) at zoom level zoom, as a view of the level
+        image.   Tiles on the right and bottom edges may be smaller than
+        tileSize.
+        Raises ValueError if zoom, x or y is out of range.
+        """
+        self.checkTile(zoom, x, y)
+        level = self.getLevel(zoom)
+        return(level[y * self.tileSize : (y + 1) * self.tileSize,
+                     x * self.tileSize : (x + 1) * self.tileSize])
+
+    def getInfo(self):
+        """ Returns a dictionary describing the pyramid, for viewers.
+        levelSizes and numTiles give the (x, y) image size and number of
+        tiles at each zoom level, starting at level 0.
+        """
+        zooms = range(self.maxZoom + 1)
+        return({'tileSize': self.tileSize,
+                'maxZoom': self.maxZoom,
+                'imgSizeX': self.imgSizeX,
+                'imgSizeY': self.imgSizeY,
+                'levelSizes': [self.getLevelSize(z) for z in zooms],
+                'numTiles': [self.getNumTiles(z) for z in zooms]})
@@ -0,0 +1,90 @@
+#
+# tilePyramidTest.py
+#
+# MIT License - CCD_CAPTURE
+#
+# Copyright (c) 2019 Graham Jones
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+''' Unit Tests for the tilePyramid module '''
+
+import unittest
+import numpy as np
+import tilePyramid
+
+
+class TestTilePyramid(unittest.TestCase):
+
+    def setUp(self):
+        self.img = np.arange(1000*600, dtype=np.uint16).reshape(600,1000)
+        self.tp = tilePyramid.TilePyramid(self.img, 256)
+
+    def test_levels(self):
+        self.assertEqual(self.tp.maxZoom, 2, 'wrong maxZoom')
+        self.assertEqual(self.tp.getNumTiles(2), (4,3), 'wrong tile count')
+        self.assertEqual(self.tp.getNumTiles(0), (1,1), 'wrong tile count')
+        self.assertEqual(list(self.tp.levels), [2], 'levels built early')
+        self.assertEqual(self.tp.getLevel(0).shape, (150,250),
+                         'wrong level size')
+        self.assertEqual(sorted(self.tp.levels), [0,1,2],
+                         'intermediate level not kept')
+        self.assertAlmostEqual(float(self.tp.getLevel(1)[0,0]),
+                               self.img[:2,:2].mean(), delta=1,
+                               msg='level not averaged')
+        self.assertRaises(ValueError, self.tp.getLevel, 3)
+
+    def test_checkTile(self):
+        self.tp.checkTile(0, 0, 0)
+        self.assertRaises(ValueError, self.tp.checkTile, 0, 1, 0)
+        self.assertRaises(ValueError, self.tp.checkTile, 3, 0, 0)
+        self.assertEqual(list(self.tp.levels), [2], 'level built by check')
+
+    def test_getTile(self):
+        tile = self.tp.getTile(2, 1, 0)
+        self.assertTrue(np.array_equal(tile, self.img[0:256,256:512]),
+                        'wrong tile')
+        self.assertEqual(self.tp.getTile(2, 3, 2).shape, (88,232),
+                         'wrong edge tile size')
+        self.assertRaises(ValueError, self.tp.getTile, 2, 4, 0)
+        self.assertRaises(ValueError, self.tp.getTile, 0, 0, -1)
+
+    def test_oddSize(self):
+        # Levels are halved rounding down, so the edge tiles counted from
+        # the full resolution size would be empty.
+        img = np.zeros((300,1025), dtype=np.uint16)
+        tp = tilePyramid.TilePyramid(img, 256)
+        self.assertEqual(tp.maxZoom, 3, 'wrong maxZoom')
+        info = tp.getInfo()
+        for zoom in range(tp.maxZoom + 1):
+            nTilesX, nTilesY = tp.getNumTiles(zoom)
+            self.assertEqual(tuple(info['numTiles'][zoom]), (nTilesX,nTilesY),
+                             'getInfo tile count wrong')
+            level = tp.getLevel(zoom)
+            self.assertEqual(tuple(info['levelSizes'][zoom]),
+                             (level.shape[1],level.shape[0]),
+                             'getInfo level size wrong')
+            edge = tp.getTile(zoom, nTilesX - 1, nTilesY - 1)
+            self.assertGreater(edge.size, 0, 'empty edge tile')
+            self.assertRaises(ValueError, tp.getTile, zoom, nTilesX, 0)
+        self.assertEqual(tp.getNumTiles(1), (1,1), 'wrong tile count')
+        self.assertEqual(tp.getNumTiles(2), (2,1), 'wrong tile count')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+#
+# webBenchmark.py
+#
+# MIT License - CCD_CAPTURE
+#
+# Copyright (c) 2019 Graham Jones
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+'''webBenchmark - Measures how many requests per second a web server
+backend can handle from a number of concurrent dashboard clients.
+
+By default each of the WebControlClass server backends is started in turn
+(in a separate process) with a test application that imitates the
+ccd_capture endpoints, and one extra client repeatedly makes a slow request
+(like a chart render or full frame download) while the dashboard clients
+are running.   Use --url to benchmark a running ccd_capture server instead.
+'''
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+from WebControlClass import WebControlClass
+
+# The requests each dashboard client makes, in turn
+DASHBOARD_PATHS = ('/getData', '/getSnapshot?since=live-1', '/getImage')
+SLOW_PATH = '/slowRender'
+SLOW_TIME = 0.5   # seconds taken by each SLOW_PATH request
+
+
+class BenchmarkServer(WebControlClass):
+    """ A web server with responses of about the same size as the
+    ccd_capture dashboard requests, for benchmarking.
+    """
+    def __init__(self, portNo, server, workers):
+        WebControlClass.__init__(self, portNo, server, workers)
+        self.statusJson = json.dumps(dict(("key%d" % i, i * 1.5)
+                                          for i in range(50)))
+        self.imgBytes = os.urandom(60 * 1024)
+
+    def onWwwCmd(self, cmdStr, valStr, methodStr, request):
+        if (cmdStr == "getData" or cmdStr == "getSnapshot"):
+            return(self.statusJson)
+        elif (cmdStr == "getImage"):
+            return(self.imgBytes)
+        elif (cmdStr == SLOW_PATH[1:]):
+            time.sleep(SLOW_TIME)
+            return(self.imgBytes)
+        return("<h1>Unrecognised command %s</h1>" % cmdStr)
+
+
+class BenchmarkClient(threading.Thread):
+    def __init__(self, host, port, paths, endTime, keepAlive = True):
+        """ A client thread that requests each of paths from host:port in
+        turn until time endTime, re-using its connection if keepAlive is
+        True, and records the time taken by each request.
+        """
+        threading.Thread.__init__(self, daemon=True)
+        self.host = host
+        self.port = port
+        self.paths = paths
+        self.endTime = endTime
+        self.keepAlive = keepAlive
+        self.times = []
+        self.nErrors = 0
+
+    def run(self):
+        conn = None
+        i = 0
+        while (time.time() < self.endTime):
+            path = self.paths[i % len(self.paths)]
+            i += 1
+            tStart = time.time()
+            try:
+                if (conn is None):
+                    conn = http.client.HTTPConnection(self.host, self.port,
+                                                      timeout=30)
+                headers = {}
+                if (not self.keepAlive):
+                    headers['Connection'] = 'close'
+                conn.request('GET', path, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                if (response.status != 200):
+                    self.nErrors += 1
+                if (not self.keepAlive or response.will_close):
+                    conn.close()
+                    conn = None
+            except (OSError, http.client.HTTPException):
+                self.nErrors += 1
+                if (conn is not None):
+                    conn.close()
+                conn = None
+                continue
+            self.times.append(time.time() - tStart)
+        if (conn is not None):
+            conn.close()
+
+
+def benchmark(host, port, nClients = 8, duration = 5., keepAlive = True,
+              paths = DASHBOARD_PATHS, slowPath = None):
+    """ Runs nClients dashboard clients requesting paths from host:port
+    for duration seconds (and a client requesting slowPath, if it is not
+    None).   Returns a dictionary of the dashboard requests per second,
+    mean and 95th percentile response times (ms) and number of errors.
+    """
+    endTime = time.time() + duration
+    clients = [BenchmarkClient(host, port, paths, endTime, keepAlive)
+               for i in range(nClients)]
+    if (slowPath is not None):
+        slowClient = BenchmarkClient(host, port, (slowPath,), endTime,
+                                     keepAlive)
+        slowClient.start()
+    tStart = time.time()
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    dt = time.time() - tStart
+    times = sorted(t for client in clients for t in client.times)
+    if (len(times) == 0):
+        times = [float('nan')]
+    return({'rps': len(times) / dt,
+            'meanMs': 1000. * sum(times) / len(times),
+            'p95Ms': 1000. * times[int(0.95 * (len(times) - 1))],
+            'errors': sum(client.nErrors for client in clients)})
+
+
+def waitForServer(host, port, timeout = 10.):
+    """ Wait until something is listening on host:port """
+    endTime = time.time() + timeout
+    while (time.time() < endTime):
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=1)
+            conn.request('GET', '/getData')
+            conn.getresponse().read()
+            conn.close()
+            return(True)
+        except OSError:
+            time.sleep(0.1)
+    return(False)
+
+
+def printResult(name, result):
+    print("%-24s %8.1f %10.1f %10.1f %7d" % (name, result['rps'],
+                                             result['meanMs'],
+                                             result['p95Ms'],
+                                             result['errors']))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Benchmark the web server backends')
+    parser.add_argument('--servers', default='wsgiref,threaded,pool',
+                        help='Comma separated list of server backends to '
+                        'test (default wsgiref,threaded,pool)')
+    parser.add_argument('--workers', type=int, default=16,
+                        help='Worker threads for the pool and waitress '
+                        'backends (default 16)')
+    parser.add_argument('--clients', type=int, default=8,
+                        help='Number of concurrent dashboard clients '
+                        '(default 8)')
+    parser.add_argument('--duration', type=float, default=5.,
+                        help='Duration of each test (s, default 5)')
+    parser.add_argument('--port', type=int, default=8090,
+                        help='Port for the test servers (default 8090)')
+    parser.add_argument('--url', default=None,
+                        help='Benchmark the ccd_capture server at this URL '
+                        '(e.g. http://localhost:8081) instead')
+    parser.add_argument('--serve', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if (args.serve is not None):
+        # Child process - run a test server until we are killed.
+        BenchmarkServer(args.port, args.serve, args.workers).startServer()
+        sys.exit(0)
+
+    print("%d dashboard clients, %.0f s per test" % (args.clients,
+                                                     args.duration))
+    print("%-24s %8s %10s %10s %7s" % ("Server", "req/s", "mean ms",
+                                       "95% ms", "errors"))
+    if (args.url is not None):
+        url = urllib.parse.urlparse(args.url)
+        for keepAlive in (False, True):
+            printResult("%s%s" % (url.netloc, " keep-alive" * keepAlive),
+                        benchmark(url.hostname, url.port or 80,
+                                  args.clients, args.duration, keepAlive))
+        sys.exit(0)
+
+    for server in args.servers.split(","):
+        port = args.port
+        args.port += 1
+        proc = subprocess.Popen([sys.executable, __file__,
+                                 '--serve', server, '--port', str(port),
+                                 '--workers', str(args.workers)],
+                                stdout=subprocess.DEVNULL,
+                                stderr=subprocess.DEVNULL)
+        try:
+            if (not waitForServer('localhost', port)):
+                print("%-24s failed to start" % server)
+                continue
+            for keepAlive in (False, True):
+                printResult("%s%s" % (server, " keep-alive" * keepAlive),
+                            benchmark('localhost', port, args.clients,
+                                      args.duration, keepAlive,
+                                      slowPath=SLOW_PATH))
+        finally:
+            proc.kill()
+            proc.wait()
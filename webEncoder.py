@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+#
+# webEncoder.py
+#
+# MIT License - CCD_CAPTURE
+#
+# Copyright (c) 2019 Graham Jones
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+
+'''webEncoder - Encodes preview images for the web as JPEG, WebP or PNG,
+choosing the format from the request and recording how long each format
+takes to encode.
+'''
+import threading
+import time
+import cv2
+
+# format : (file extension, mime type, opencv quality parameter,
+#           minimum quality, maximum quality)
+FORMATS = {
+    'jpeg': ('.jpg', 'image/jpeg', cv2.IMWRITE_JPEG_QUALITY, 1, 100),
+    'webp': ('.webp', 'image/webp', cv2.IMWRITE_WEBP_QUALITY, 1, 100),
+    'png': ('.png', 'image/png', cv2.IMWRITE_PNG_COMPRESSION, 0, 9),
+}
+
+
+def getMimeType(fmt):
+    """ Returns the mime type of image format fmt """
+    return(FORMATS[fmt][1])
+
+
+def parseAccept(acceptStr):
+    """ Returns a dictionary of mime type (or range, e.g. image/*):quality
+    for the HTTP Accept header acceptStr.
+    """
+    accept = {}
+    for item in acceptStr.split(","):
+        parts = item.strip().split(";")
+        mimeType = parts[0].strip().lower()
+        if (mimeType == ""):
+            continue
+        q = 1.0
+        for param in parts[1:]:
+            param = param.strip()
+            if (param.startswith("q=")):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.
+        accept[mimeType] = q
+    return(accept)
+
+
+def negotiateFormat(acceptStr, preferred):
+    """ Returns the image format (a key of FORMATS) to use for a client
+    that sent HTTP Accept header acceptStr.   The format the client rates
+    highest is used, with ties (e.g. when the client accepts image/*)
+    going to format preferred.   Returns preferred if acceptStr is empty
+    or the client accepts none of our formats.
+    """
+    if (not acceptStr):
+        return(preferred)
+    accept = parseAccept(acceptStr)
+    bestFmt = preferred
+    bestQ = 0.
+    for fmt in [preferred] + [f for f in FORMATS if f != preferred]:
+        mimeType = FORMATS[fmt][1]
+        q = accept.get(mimeType, accept.get("image/*", accept.get("*/*", 0.)))
+        if (q > bestQ):
+            bestFmt = fmt
+            bestQ = q
+    return(bestFmt)
+
+
+class WebEncoder():
+    def __init__(self):
+        """ Initialise the encoder with no timings recorded """
+        self.lock = threading.Lock()
+        self.nEncoded = {}
+        self.encodeTime = {}
+
+    def encode(self, img, fmt = 'png', quality = None):
+        """ Returns img encoded in format fmt (a key of FORMATS) as bytes.
+        quality is the JPEG or WebP quality (1-100) or the PNG compression
+        level (0-9), clipped to the allowed range - the opencv default is
+        used if it is None.
+        Raises ValueError if fmt is not recognised.
+        """
+        if (fmt not in FORMATS):
+            raise ValueError("Unrecognised image format %s" % fmt)
+        ext, mimeType, param, qMin, qMax = FORMATS[fmt]
+        params = []
+        if (quality is not None):
+            params = [param, int(min(max(int(quality), qMin), qMax))]
+        tStart = time.time()
+        success, encImg = cv2.imencode(ext, img, params)
+        dt = time.time() - tStart
+        with self.lock:
+            self.nEncoded[fmt] = self.nEncoded.get(fmt, 0) + 1
+            self.encodeTime[fmt] = self.encodeTime.get(fmt, 0.) + dt
+        return(encImg.tobytes())
+
+    def getTimings(self):
+        """ Returns a dictionary of format : {'n', 'meanMs'} giving the
+        number of images encoded in each format and the mean time taken
+        to encode them, in milliseconds.
+        """
+        with self.lock:
+            return(dict((fmt, {'n': n,
+                               'meanMs': 1000. * self.encodeTime[fmt] / n})
+                        for fmt, n in self.nEncoded.items()))
@@ -0,0 +1,66 @@
+#
+# webEncoderTest.py
+#
+# MIT License - CCD_CAPTURE
+#
+# Copyright (c) 2019 Graham Jones
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+''' Unit Tests for the webEncoder module '''
+
+import unittest
+import numpy as np
+import cv2
+import webEncoder
+
+
+class TestWebEncoder(unittest.TestCase):
+
+    def test_negotiateFormat(self):
+        browser = "image/avif,image/webp,image/apng,image/*,*/*;q=0.8"
+        self.assertEqual(webEncoder.negotiateFormat(browser,'jpeg'),'jpeg',
+                         'wildcard should give preferred format')
+        self.assertEqual(webEncoder.negotiateFormat("image/webp",'jpeg'),
+                         'webp','explicit format not used')
+        self.assertEqual(webEncoder.negotiateFormat(
+            "image/png;q=0.5,image/webp;q=0.9",'jpeg'),'webp',
+                         'highest quality format not used')
+        self.assertEqual(webEncoder.negotiateFormat("",'png'),'png',
+                         'empty Accept should give preferred format')
+        self.assertEqual(webEncoder.negotiateFormat("text/html",'png'),'png',
+                         'unusable Accept should give preferred format')
+
+    def test_encode(self):
+        enc = webEncoder.WebEncoder()
+        img = (np.arange(100*120) % 256).astype(np.uint8).reshape(100,120)
+        for fmt in webEncoder.FORMATS:
+            data = enc.encode(img, fmt, 1000)
+            dec = cv2.imdecode(np.frombuffer(data,np.uint8),
+                               cv2.IMREAD_UNCHANGED)
+            self.assertEqual(dec.shape[:2], img.shape, 'wrong size for %s' % fmt)
+        self.assertTrue(np.array_equal(cv2.imdecode(
+            np.frombuffer(enc.encode(img,'png'),np.uint8),
+            cv2.IMREAD_UNCHANGED), img), 'png not lossless')
+        timings = enc.getTimings()
+        self.assertEqual(timings['png']['n'], 2, 'wrong count')
+        self.assertRaises(ValueError, enc.encode, img, 'gif')
+
+if __name__ == '__main__':
+    unittest.main()
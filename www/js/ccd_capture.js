@@ -1,17 +1,44 @@
 
-var lastImageDate = -1;
+var lastFrameId = null;
 var continuousMode = 0;
 var getDataTimer = null;
 var getDataTimerPeriod = 1000;
+// With server push we only need to poll for slowly changing status
+// (temperature, exposure progress etc.).
+var statusTimerPeriod = 5000;
+var frameEvents = null;
 var subframeSelectInProgress = 0;
 
+// Request the status and, if there is a new frame, its images and chart
+// data, in a single request.   The preview images are sized to fit the
+// width of the page column they are shown in.
 function getData() {
-    $.ajax({url:"/getData",success:updateDashboard});
+    var previewWidth = $("#camera-preview-image").parent().width();
+    $.ajax({url:"/getSnapshot?since="+lastFrameId+"&w="+Math.round(previewWidth),
+	    dataType:"json",
+	    success:updateSnapshot});
 };
 
-function updateDashboard(dataStr) {
-    //alert (dataStr);
-    obj = JSON.parse(dataStr)
+function updateSnapshot(snapshot) {
+    updateDashboard(snapshot['status']);
+    if ('images' in snapshot) {
+	var images = snapshot['images'];
+	$("#camera-preview-image").attr("src",images['preview']);
+	$("#roi-preview-image").attr("src",images['roi']);
+	$("#roi-cropped-image").attr("src",images['roiCropped']);
+	var charts = snapshot['charts'];
+	drawChart("histogram-chart", charts['frameHistogram'], "Intensity Histogram");
+	drawChart("x-profile-chart", charts['xProfile'], "X Intensity Profile");
+	drawChart("y-profile-chart", charts['yProfile'], "Y Intensity Profile");
+	drawChart("roi-histogram-chart", charts['roiHistogram'], "ROI Intensity Histogram");
+	drawChart("roi-x-profile-chart", charts['roiXProfile'], "ROI X Intensity Profile");
+	drawChart("roi-y-profile-chart", charts['roiYProfile'], "ROI Y Intensity Profile");
+	lastFrameId = snapshot['frameId'];
+    }
+};
+
+function updateDashboard(statusObj) {
+    obj = statusObj;
     $("#cooler-on-checkbox").prop('checked', obj['coolerOn']);
     
     // This populates the <span> elements that have the same id
@@ -25,22 +52,7 @@ function updateDashboard(dataStr) {
 	    var seconds = "0" + date.getSeconds();
 	    var timeStr = hours.substr(-2) + ':' + minutes.substr(-2) + ':' + seconds.substr(-2);
 	    var imageAge = Math.floor(new Date().getTime()/1000 - val)
-	    var imgSrc = "/getImage?"+ new Date().getTime();
 	    $("#"+key).html(timeStr + " (" + imageAge + " s old)");
-	    // If we have a new image available, display it, otherwise do not
-	    // refresh preview image to save bandwidth.
-	    if (((val - lastImageDate) > 1) || (lastImageDate==-1)) {
-		$("#camera-preview-image").attr("src",imgSrc);
-		$("#roi-preview-image").attr("src","/getRoiImage?" + new Date().getTime());
-		$("#roi-cropped-image").attr("src","/getRoiCroppedImage?" + new Date().getTime());
-		$("#histogram-image").attr("src","/getFrameHistogram?"+ new Date().getTime());
-		$("#x-profile-image").attr("src","/getXProfile?"+ new Date().getTime());
-		$("#y-profile-image").attr("src","/getYProfile?"+ new Date().getTime());
-		$("#roi-histogram-image").attr("src","/getRoiHistogram?"+ new Date().getTime());
-		$("#roi-x-profile-image").attr("src","/getRoiXProfile?"+ new Date().getTime());
-		$("#roi-y-profile-image").attr("src","/getRoiYProfile?"+ new Date().getTime());
-		lastImageDate = val;
-	    }
 	    ///////////////////////////////////////////////////
 	} else if (key == "statusVal") {
 	    var statusStr;
@@ -68,6 +80,10 @@ function updateDashboard(dataStr) {
 	    }
 	  
 	    /////////////////////////////////////////////////
+	} else if (key == "stretch") {
+	    $("#stretch-select").val(val);
+	} else if (key == "calibrationOn") {
+	    $("#calibrate-chk").prop('checked', val);
 	} else if (key == "coolerOn") {
 	    if (val==true) {
 		coolerOn = true
@@ -102,6 +118,53 @@ function updateDashboard(dataStr) {
 };
 
 
+// Draw a line plot of chart data {x0, dx, values} (as returned by
+// /getChartData) into the canvas with id canvasId.
+function drawChart(canvasId, data, title) {
+    var canvas = document.getElementById(canvasId);
+    var ctx = canvas.getContext("2d");
+    var values = data['values'];
+    var n = values.length;
+    var left = 60, right = 10, top = 30, bottom = 30;
+    var w = canvas.width - left - right;
+    var h = canvas.height - top - bottom;
+    var yMin = Math.min.apply(null, values);
+    var yMax = Math.max.apply(null, values);
+    if (yMax == yMin) {
+	yMax = yMin + 1;
+    }
+    var xMin = data['x0'];
+    var xMax = data['x0'] + data['dx'] * Math.max(n - 1, 1);
+
+    ctx.clearRect(0, 0, canvas.width, canvas.height);
+    ctx.fillStyle = "black";
+    ctx.font = "14px sans-serif";
+    ctx.textAlign = "center";
+    ctx.fillText(title, canvas.width / 2, 20);
+    ctx.font = "10px sans-serif";
+    ctx.fillText(xMin.toFixed(0), left, top + h + 15);
+    ctx.fillText(xMax.toFixed(0), left + w, top + h + 15);
+    ctx.textAlign = "right";
+    ctx.fillText(yMax.toFixed(0), left - 5, top + 5);
+    ctx.fillText(yMin.toFixed(0), left - 5, top + h);
+    ctx.strokeStyle = "black";
+    ctx.strokeRect(left, top, w, h);
+
+    ctx.strokeStyle = "blue";
+    ctx.beginPath();
+    for (var i = 0; i < n; i++) {
+	var x = left + w * i / Math.max(n - 1, 1);
+	var y = top + h - h * (values[i] - yMin) / (yMax - yMin);
+	if (i == 0) {
+	    ctx.moveTo(x, y);
+	} else {
+	    ctx.lineTo(x, y);
+	}
+    }
+    ctx.stroke();
+};
+
+
 updateRoi = function(img,roiObj) {
     //alert("updateRoi: "+roiObj['x1']+","+roiObj['y1']+" : "+roiObj['x2']+","+roiObj['y2']);
     xScale = $('#roi-preview-image').width() / obj['subFrameSizeX'];
@@ -264,6 +327,74 @@ $(document).ready(function(){
         });
     });
 
+    $("#start-stack-btn").click(function(evt) {
+        $('#loading-indicator').show();
+        $.post("/setStackMode/"+$("#stack-mode-select").val(), function(data,status) {
+            $.post("/startStack/"+$("#stack-frames-input").val(), function(data,status) {
+		$('#loading-indicator').hide();
+            });
+        });
+    });
+
+    $("#stop-stack-btn").click(function(evt) {
+        $('#loading-indicator').show();
+        $.post("/stopStack/", function(data,status) {
+            $('#loading-indicator').hide();
+        });
+    });
+
+    $("#save-stack-btn").click(function(evt) {
+        $('#loading-indicator').show();
+	val = $("#fname-input").val()
+        $.post("/saveStack/"+val, function(data,status) {
+            $('#loading-indicator').hide();
+        });
+    });
+
+    $("#start-burst-btn").click(function(evt) {
+        $('#loading-indicator').show();
+        $.post("/startBurst/"+$("#burst-frames-input").val(), function(data,status) {
+            $('#loading-indicator').hide();
+        });
+    });
+
+    $("#stop-burst-btn").click(function(evt) {
+        $('#loading-indicator').show();
+        $.post("/stopBurst", function(data,status) {
+            $('#loading-indicator').hide();
+        });
+    });
+
+    $("#capture-master-btn").click(function(evt) {
+        $('#loading-indicator').show();
+	val = $("#cal-type-select").val() + "," + $("#cal-frames-input").val();
+        $.post("/captureMaster/"+val, function(data,status) {
+            $('#loading-indicator').hide();
+        });
+    });
+
+    $("#stretch-select").change(function(evt) {
+        $('#loading-indicator').show();
+        $.post("/setStretch/"+$("#stretch-select").val(), function(data,status) {
+	    $('#loading-indicator').hide();
+	    lastFrameId = null;
+	    getData();
+        });
+    });
+
+    $("#calibrate-chk").click(function(evt) {
+        $('#loading-indicator').show();
+	if($("#calibrate-chk").is(':checked')) {
+            $.post("/startCalibration/", function(data,status) {
+		$('#loading-indicator').hide();
+            });
+	} else {
+            $.post("/stopCalibration/", function(data,status) {
+		$('#loading-indicator').hide();
+            });
+	}
+    });
+
     $("#autosave-chk").click(function(evt) {
         $('#loading-indicator').show();
 	val = $("#fname-input").val()
@@ -281,6 +412,18 @@ $(document).ready(function(){
     });
 
     
+    // Fetch a new snapshot whenever the server tells us about a new frame,
+    // or poll if the browser does not support Server-Sent Events.
+    if (window.EventSource) {
+	getDataTimerPeriod = statusTimerPeriod;
+	frameEvents = new EventSource("/events");
+	frameEvents.addEventListener("frame", function(evt) {
+	    var frameObj = JSON.parse(evt.data);
+	    if (!subframeSelectInProgress && frameObj['frameId'] != lastFrameId) {
+		getData();
+	    }
+	});
+    }
     getDataTimer = setInterval("getData();",getDataTimerPeriod);
     getData();
 });        
@@ -0,0 +1,119 @@
+// Pan and zoom viewer for the /getTile image pyramid.
+// Only the tiles that are in view are requested.
+
+var tileInfo = null;
+var zoom = 0;
+var viewX = 0;   // Position of the top left of the view in zoom level pixels.
+var viewY = 0;
+var dragStart = null;
+
+function getTileInfo() {
+    $.ajax({url:"/getTileInfo",
+	    dataType:"json",
+	    success:function(info) {
+		var newFrame = (tileInfo == null
+				|| info['frameId'] != tileInfo['frameId']);
+		if (tileInfo == null) {
+		    zoom = 0;
+		}
+		tileInfo = info;
+		$("#maxZoom").html(info['maxZoom']);
+		$("#frameId").html(info['frameId']);
+		if (newFrame) {
+		    // New frame, so all of the tiles need reloading.
+		    $("#tile-view").empty();
+		}
+		drawTiles();
+	    }});
+};
+
+// Show the tiles that are in view, re-using the ones we already have,
+// and remove the rest.
+function drawTiles() {
+    if (tileInfo == null) {
+	return;
+    }
+    var view = $("#tile-view");
+    var w = view.width();
+    var h = view.height();
+    var ts = tileInfo['tileSize'];
+    var nTilesX = tileInfo['numTiles'][zoom][0];
+    var nTilesY = tileInfo['numTiles'][zoom][1];
+    var x0 = Math.max(0, Math.floor(viewX / ts));
+    var y0 = Math.max(0, Math.floor(viewY / ts));
+    var x1 = Math.min(nTilesX - 1, Math.floor((viewX + w) / ts));
+    var y1 = Math.min(nTilesY - 1, Math.floor((viewY + h) / ts));
+    var wanted = {};
+    for (var y = y0; y <= y1; y++) {
+	for (var x = x0; x <= x1; x++) {
+	    var id = "tile-" + zoom + "-" + x + "-" + y;
+	    wanted[id] = true;
+	    var tile = $("#" + id);
+	    if (tile.length == 0) {
+		tile = $("<img/>", {id: id, draggable: false})
+		    .css({position: "absolute"})
+		    .attr("src", "/getTile/" + zoom + "/" + x + "/" + y
+			  + "?frame=" + tileInfo['frameId']);
+		view.append(tile);
+	    }
+	    tile.css({left: x * ts - viewX, top: y * ts - viewY});
+	}
+    }
+    view.children("img").each(function() {
+	if (!wanted[this.id]) {
+	    $(this).remove();
+	}
+    });
+    $("#zoom").html(zoom);
+};
+
+// Zoom by dz levels, keeping the point (px, py) in the view fixed.
+function zoomBy(dz, px, py) {
+    var newZoom = Math.min(Math.max(zoom + dz, 0), tileInfo['maxZoom']);
+    var factor = Math.pow(2, newZoom - zoom);
+    viewX = (viewX + px) * factor - px;
+    viewY = (viewY + py) * factor - py;
+    zoom = newZoom;
+    drawTiles();
+};
+
+$(document).ready(function(){
+    var view = $("#tile-view");
+    view.mousedown(function(evt) {
+	dragStart = [evt.pageX + viewX, evt.pageY + viewY];
+    });
+    $(document).mousemove(function(evt) {
+	if (dragStart != null) {
+	    viewX = dragStart[0] - evt.pageX;
+	    viewY = dragStart[1] - evt.pageY;
+	    drawTiles();
+	}
+    });
+    $(document).mouseup(function(evt) {
+	dragStart = null;
+    });
+    view.on("wheel", function(evt) {
+	evt.preventDefault();
+	var offset = view.offset();
+	zoomBy(evt.originalEvent.deltaY < 0 ? 1 : -1,
+	       evt.pageX - offset.left, evt.pageY - offset.top);
+    });
+    $("#zoom-in-btn").click(function(evt) {
+	zoomBy(1, view.width() / 2, view.height() / 2);
+    });
+    $("#zoom-out-btn").click(function(evt) {
+	zoomBy(-1, view.width() / 2, view.height() / 2);
+    });
+    $(window).resize(drawTiles);
+
+    // Reload the tiles when there is a new frame.
+    if (window.EventSource) {
+	var frameEvents = new EventSource("/events");
+	frameEvents.addEventListener("frame", function(evt) {
+	    getTileInfo();
+	});
+    } else {
+	setInterval("getTileInfo();", 5000);
+    }
+    getTileInfo();
+});